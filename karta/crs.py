@@ -9,8 +9,10 @@ Implements CRS classes for different kinds of spatial reference systems:
     - Proj4CRS
 """
 
+import threading
 import numpy as np
 import pyproj
+from collections import OrderedDict
 from . import geodesy
 
 # A CRS class needs to have pyproj Proj and Geod instances. Exceptions are
@@ -45,9 +47,14 @@ class Cartesian(CRS):
 
     @staticmethod
     def forward(x, y, az, dist, radians=False):
-        """ Returns x, y, and back azimuths """
+        """ Returns x, y, and back azimuths. Arguments may be scalars or
+        broadcastable arrays. """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        dist = np.asarray(dist, dtype=np.float64)
+        az = np.asarray(az, dtype=np.float64)
         if not radians:
-            az = np.array(az) / 180 * np.pi
+            az = az / 180 * np.pi
 
         x2 = x + dist * np.sin(az)
         y2 = y + dist * np.cos(az)
@@ -55,7 +62,8 @@ class Cartesian(CRS):
 
         if not radians:
             baz = np.array(baz) * 180 / np.pi
-        return x2, y2, baz
+        return (geodesy._result(x2), geodesy._result(y2),
+                geodesy._result(baz))
 
     @staticmethod
     def inverse(x1, y1, x2, y2, radians=False):
@@ -70,10 +78,27 @@ class Cartesian(CRS):
         return az, baz, dist
 
 class GeographicalCRS(CRS):
-    """ Reference systems with longitude-latitude (θ, φ) coordinates """
-    def __init__(self, spheroid, name):
+    """ Reference systems with longitude-latitude (θ, φ) coordinates
+
+    Optional parameters
+    -------------------
+    geodesic_solver     "pyproj" (default) or "vincenty"
+
+    With "vincenty", array arguments to `forward` and `inverse` are solved in
+    one call by `geodesy.ellipsoid_forward` and `geodesy.ellipsoid_inverse`,
+    with the convergence tolerance (radians) and iteration limit given by the
+    *geodesic_tol* and *geodesic_maxiter* attributes. Pairs that do not
+    converge, and scalar arguments, are passed to pyproj.
+    """
+
+    geodesic_solver = "pyproj"
+    geodesic_tol = 1e-12
+    geodesic_maxiter = 200
+
+    def __init__(self, spheroid, name, geodesic_solver="pyproj"):
         self._geod = pyproj.Geod(spheroid)
         self.name = name
+        self.geodesic_solver = _check_geodesic_solver(geodesic_solver)
         return
 
     @staticmethod
@@ -83,11 +108,13 @@ class GeographicalCRS(CRS):
         else:
             return np.array(x)/180 * np.pi, np.array(y)/180 * np.pi
 
-    def forward(self, *args, **kwargs):
-        return self._geod.fwd(*args, **kwargs)
+    def forward(self, lons, lats, az, dist, radians=False):
+        """ Returns lons, lats, and back azimuths """
+        return _ellipsoid_forward(self, lons, lats, az, dist, radians)
 
-    def inverse(self, *args, **kwargs):
-        return self._geod.inv(*args, **kwargs)
+    def inverse(self, lons1, lats1, lons2, lats2, radians=False):
+        """ Returns forward and back azimuths and distances """
+        return _ellipsoid_inverse(self, lons1, lats1, lons2, lats2, radians)
 
 
 class Spherical(GeographicalCRS):
@@ -98,43 +125,48 @@ class Spherical(GeographicalCRS):
         self.radius = radius
 
     def forward(self, lons, lats, az, dist, radians=False):
-        """ Returns lons, lats, and back azimuths """
+        """ Returns lons, lats, and back azimuths. Arguments may be scalars or
+        broadcastable arrays. """
+        lons = np.asarray(lons, dtype=np.float64)
+        lats = np.asarray(lats, dtype=np.float64)
+        az = np.asarray(az, dtype=np.float64)
+        dist = np.asarray(dist, dtype=np.float64)
         if not radians:
-            lons = np.array(lons) * np.pi / 180.0
-            lats = np.array(lats) * np.pi / 180.0
-            az = np.array(az) * np.pi / 180.0
-
+            lons = lons * np.pi / 180.0
+            lats = lats * np.pi / 180.0
+            az = az * np.pi / 180.0
 
-        d_ = dist / self.radius
-        lats2 = np.arcsin(np.sin(lats) * np.cos(d_) + 
-                    np.cos(lats) * np.sin(d_) * np.cos(az))
-        dlons = np.arccos((np.cos(d_) - np.sin(lats2) * np.sin(lats)) /
-                          (np.cos(lats) * np.cos(lats2)))
-        baz = np.arccos((np.sin(lats) - np.cos(d_) * np.sin(lats2)) /
-                        (np.sin(d_) * np.cos(lats2)))
-        if 0 <= az < np.pi:
-            lons2 = lons + dlons
-            baz = -baz
-        elif np.pi <= az < 2*np.pi:
-            lons2 = lons - dlons
-        else:
+        if np.any((az < 0) | (az >= 2*np.pi) | np.isnan(az)):
             raise ValueError("azimuth should be [0, 2pi)")
 
-        baz = geodesy.unroll_angle(baz)
+        d_ = dist / self.radius
+        lats2 = np.arcsin(np.clip(np.sin(lats) * np.cos(d_) +
+                                  np.cos(lats) * np.sin(d_) * np.cos(az),
+                                  -1.0, 1.0))
+        dlons = np.arccos(np.clip((np.cos(d_) - np.sin(lats2) * np.sin(lats)) /
+                                  (np.cos(lats) * np.cos(lats2)), -1.0, 1.0))
+        # back azimuth is undefined for zero distances
+        with np.errstate(divide="ignore", invalid="ignore"):
+            baz = np.arccos(np.clip((np.sin(lats) - np.cos(d_) * np.sin(lats2)) /
+                                    (np.sin(d_) * np.cos(lats2)), -1.0, 1.0))
+        eastward = az < np.pi
+        lons2 = np.where(eastward, lons + dlons, lons - dlons)
+        baz = geodesy.unroll_angle(np.where(eastward, -baz, baz))
 
         if not radians:
-            lons2 = np.array(lons2) * 180 / np.pi
-            lats2 = np.array(lats2) * 180 / np.pi
+            lons2 = lons2 * 180 / np.pi
+            lats2 = lats2 * 180 / np.pi
             baz = np.array(baz) * 180 / np.pi
-        return lons2, lats2, baz
+        return (geodesy._result(lons2), geodesy._result(lats2),
+                geodesy._result(baz))
 
     def inverse(self, lons1, lats1, lons2, lats2, radians=False):
         """ Returns forward and back azimuths and distances """
         if not radians:
-            lons1 = lons1 * np.pi / 180.0
-            lons2 = lons2 * np.pi / 180.0
-            lats1 = lats1 * np.pi / 180.0
-            lats2 = lats2 * np.pi / 180.0
+            lons1 = np.asarray(lons1) * np.pi / 180.0
+            lons2 = np.asarray(lons2) * np.pi / 180.0
+            lats1 = np.asarray(lats1) * np.pi / 180.0
+            lats2 = np.asarray(lats2) * np.pi / 180.0
 
         az = geodesy.sphere_azimuth(lons1, lats1, lons2, lats2)
         baz = geodesy.sphere_azimuth(lons2, lats2, lons1, lats1)
@@ -147,11 +179,23 @@ class Spherical(GeographicalCRS):
 
 class Proj4CRS(CRS):
     """ Custom reference systems, which may be backed by a *pypoj.Proj* instance
-    or a custom projection function """
+    or a custom projection function
+
+    Optional parameters
+    -------------------
+    name                name of the system [default *proj*]
+    geodesic_solver     "pyproj" (default) or "vincenty", as for
+                        `GeographicalCRS`
+    """
+
+    geodesic_solver = "pyproj"
+    geodesic_tol = 1e-12
+    geodesic_maxiter = 200
 
-    def __init__(self, proj, spheroid, name=None):
+    def __init__(self, proj, spheroid, name=None, geodesic_solver="pyproj"):
         self.project = pyproj.Proj(proj)
         self._geod = pyproj.Geod(spheroid)
+        self.geodesic_solver = _check_geodesic_solver(geodesic_solver)
 
         if name is not None:
             self.name = name
@@ -179,11 +223,118 @@ class Proj4CRS(CRS):
         """ Return the proj.4 init string defining the geoid. """
         return self._geod.initstring
 
-    def forward(self, *args, **kwargs):
-        return self._geod.fwd(*args, **kwargs)
+    def forward(self, lons, lats, az, dist, radians=False):
+        """ Returns lons, lats, and back azimuths """
+        return _ellipsoid_forward(self, lons, lats, az, dist, radians)
 
-    def inverse(self, *args, **kwargs):
-        return self._geod.inv(*args, **kwargs)
+    def inverse(self, lons1, lats1, lons2, lats2, radians=False):
+        """ Returns forward and back azimuths and distances """
+        return _ellipsoid_inverse(self, lons1, lats1, lons2, lats2, radians)
+
+def _check_geodesic_solver(solver):
+    """ Return *solver* if it names a geodesic solver, or raise ValueError. """
+    if solver not in ("pyproj", "vincenty"):
+        raise ValueError("geodesic solver must be \"pyproj\" or \"vincenty\", "
+                         "not {0!r}".format(solver))
+    return solver
+
+def _ellipsoid_forward(crs, lons, lats, az, dist, radians):
+    """ Solve the direct geodesic problem on the ellipsoid of *crs*. Array
+    arguments are solved in one call with `geodesy.ellipsoid_forward` when
+    *crs.geodesic_solver* is "vincenty", and all others are passed to pyproj.
+    Results follow the pyproj conventions. """
+    if crs.geodesic_solver != "vincenty" or \
+            not any(hasattr(v, "__len__") for v in (lons, lats, az, dist)):
+        return crs._geod.fwd(lons, lats, az, dist, radians=radians)
+
+    lons, lats, az = (np.asarray(v, dtype=np.float64) for v in (lons, lats, az))
+    if not radians:
+        lons, lats, az = np.radians(lons), np.radians(lats), np.radians(az)
+    lons2, lats2, az2 = geodesy.ellipsoid_forward(lons, lats, az, dist,
+                                                  crs._geod.a, crs._geod.f,
+                                                  tol=crs.geodesic_tol,
+                                                  maxiter=crs.geodesic_maxiter)
+    baz = np.mod(az2, 2*np.pi) - np.pi
+    if not radians:
+        lons2, lats2, baz = np.degrees(lons2), np.degrees(lats2), np.degrees(baz)
+    return lons2, lats2, baz
+
+def _ellipsoid_inverse(crs, lons1, lats1, lons2, lats2, radians):
+    """ Solve the inverse geodesic problem on the ellipsoid of *crs*. Array
+    arguments are solved in one call with `geodesy.ellipsoid_inverse` when
+    *crs.geodesic_solver* is "vincenty", falling back to pyproj for pairs that
+    do not converge, and all others are passed to pyproj. Results follow the
+    pyproj conventions. """
+    args = (lons1, lats1, lons2, lats2)
+    if crs.geodesic_solver != "vincenty" or \
+            not any(hasattr(v, "__len__") for v in args):
+        return crs._geod.inv(lons1, lats1, lons2, lats2, radians=radians)
+
+    args = np.broadcast_arrays(*(np.asarray(v, dtype=np.float64) for v in args))
+    if not radians:
+        args = [np.radians(v) for v in args]
+    az, az2, dist, converged = geodesy.ellipsoid_inverse(*args,
+            a=crs._geod.a, f=crs._geod.f, tol=crs.geodesic_tol,
+            maxiter=crs.geodesic_maxiter)
+    baz = np.mod(az2, 2*np.pi) - np.pi
+
+    if not np.all(converged):
+        # nearly antipodal pairs
+        idx = ~converged
+        az[idx], baz[idx], dist[idx] = crs._geod.inv(*[v[idx] for v in args],
+                                                     radians=True)
+    if not radians:
+        az, baz = np.degrees(az), np.degrees(baz)
+    return az, baz, dist
+
+# Transformations between pairs of CRS instances, keyed by identity. Beyond
+# TRANSFORMER_CACHE_SIZE entries, the least recently used is discarded.
+TRANSFORMER_CACHE_SIZE = 64
+_transformers = OrderedDict()
+_transformers_lock = threading.Lock()
+
+def get_transformer(src, dst):
+    """ Return a function that takes projected coordinate arrays (x, y) in
+    *src* and returns them projected in *dst*. Transformers are cached, so
+    that repeated reprojection between the same pair of systems reuses them.
+    """
+    key = (id(src), id(dst))
+    with _transformers_lock:
+        entry = _transformers.pop(key, None)
+        if entry is None:
+            # the entry holds src and dst so that their ids stay valid
+            entry = (src, dst, _make_transformer(src, dst))
+            while len(_transformers) >= TRANSFORMER_CACHE_SIZE:
+                _transformers.popitem(last=False)
+        _transformers[key] = entry
+    return entry[2]
+
+def transform(src, dst, x, y):
+    """ Return coordinates (*x*, *y*) in *src* projected to *dst*. """
+    return get_transformer(src, dst)(x, y)
+
+def _geographic_project(crs):
+    """ Return whether the *project* method of *crs* is the identity on
+    longitude and latitude in degrees. """
+    return crs is Cartesian or isinstance(crs, GeographicalCRS)
+
+def _make_transformer(src, dst):
+    """ Return a function transforming coordinates from *src* to *dst* with
+    as few projection calls as possible. """
+    if src == dst:
+        return lambda x, y: (x, y)
+    elif isinstance(src.project, pyproj.Proj) and isinstance(dst.project, pyproj.Proj):
+        if hasattr(pyproj, "Transformer"):
+            return pyproj.Transformer.from_proj(src.project, dst.project,
+                                                always_xy=True).transform
+        # pyproj < 2.1
+        return lambda x, y: pyproj.transform(src.project, dst.project, x, y)
+    elif _geographic_project(src):
+        return lambda x, y: dst.project(x, y)
+    elif _geographic_project(dst):
+        return lambda x, y: src.project(x, y, inverse=True)
+    else:
+        return lambda x, y: dst.project(*src.project(x, y, inverse=True))
 
 class CRSError(Exception):
     """ Exception to raise for invalid geodetic operations. """
@@ -1,113 +1,337 @@
 """ Defines basic geodetic operations on a planes and spheres. """
 
 #
-# Functions are defined with an underscored version that works on scalars and a
-# public version that dispatches between scalars and vectors. This approach is
-# used rather than vectorization to make the C translation more straighforward.
+# Functions accept scalars or broadcastable arrays. Branches are selected with
+# masks rather than per-element conditionals, so that array inputs are
+# processed without a Python-level loop. Scalar inputs return floats.
 #
 
 import numpy as np
-from math import sqrt, sin, cos, tan, asin, acos, atan, pi
+from multiprocessing.pool import ThreadPool
 
-def _plane_distance(x1, y1, x2, y2):
-    return sqrt((x2 - x1)**2 + (y2 - y1)**2)
+def _result(a):
+    """ Return *a* as a float if it is zero-dimensional. """
+    if np.ndim(a) == 0:
+        return float(a)
+    return a
 
 def plane_distance(xs1, ys1, xs2, ys2):
-    if hasattr(xs1, "__len__"):
-        return np.array([_plane_distance(x1, y1, x2, y2)
-                        for x1, y1, x2, y2 in zip(xs1, ys1, xs2, ys2)])
-    else:
-        return _plane_distance(xs1, ys1, xs2, ys2)
-
-def _sphere_distance(lon1, lat1, lon2, lat2, radius):
-    dx = abs(lon1-lon2)
-    dy = abs(lat1-lat2)
-
-    if dx > 0.01 or dy > 0.01:
-        # use spherical law of cosines
-        d_ = acos(sin(lat1) * sin(lat2) + cos(lat1) * cos(lat2) * cos(dx))
-
-    else:
-        # use haversine
-        d_ = (2 * asin(sqrt(sin(dy / 2.)**2 +
-                        cos(lat1) * cos(lat2) * sin(dx / 2.)**2)))
-    return radius * d_
+    """ Return cartesian distance between points """
+    xs1, ys1, xs2, ys2 = (np.asarray(a, dtype=np.float64)
+                          for a in (xs1, ys1, xs2, ys2))
+    return _result(np.sqrt((xs2 - xs1)**2 + (ys2 - ys1)**2))
 
 def sphere_distance(lons1, lats1, lons2, lats2, radius):
-    if hasattr(lons1, "__len__"):
-        return np.array([_sphere_distance(ln1, lt1, ln2, lt2, radius)
-                        for ln1, lt1, ln2, lt2
-                        in zip(lons1, lats1, lons2, lats2)])
-    else:
-        return _sphere_distance(lons1, lats1, lons2, lats2, radius)
-
-
-def _plane_azimuth(x1, y1, x2, y2):
-    """ Return cartesian azimuth between points (scalar func) """
-    dx = x2 - x1
-    dy = y2 - y1
-    if dx > 0:
-        if dy > 0:
-            return np.arctan(dx/dy)
-        elif dy < 0:
-            return np.pi - np.arctan(-dx/dy)
-        else:
-            return 0.5*np.pi
-    elif dx < 0:
-        if dy > 0:
-            return 2*np.pi - np.arctan(-dx/dy)
-        elif dy < 0:
-            return np.pi + np.arctan(dx/dy)
-        else:
-            return 1.5*np.pi
-    else:
-        if dy > 0:
-            return 0.0
-        else:
-            return np.pi
+    """ Return great circle distance between points on a sphere of *radius*.
+    Coordinates are in radians. """
+    lons1, lats1, lons2, lats2 = (np.asarray(a, dtype=np.float64)
+                                  for a in (lons1, lats1, lons2, lats2))
+    dx = np.abs(lons1 - lons2)
+    dy = np.abs(lats1 - lats2)
+
+    # spherical law of cosines, except for nearby points where haversine is
+    # better conditioned
+    cosines = np.arccos(np.clip(np.sin(lats1) * np.sin(lats2) +
+                                np.cos(lats1) * np.cos(lats2) * np.cos(dx),
+                                -1.0, 1.0))
+    haversine = 2 * np.arcsin(np.sqrt(np.sin(dy / 2.)**2 +
+                              np.cos(lats1) * np.cos(lats2) * np.sin(dx / 2.)**2))
+    d_ = np.where((dx > 0.01) | (dy > 0.01), cosines, haversine)
+    return _result(radius * d_)
 
 def plane_azimuth(xs1, ys1, xs2, ys2):
     """ Return cartesian azimuth between points """
-    if hasattr(xs1, "__len__"):
-        return np.array([_plane_azimuth(x1, y1, x2, y2)
-                        for x1, y1, x2, y2 in zip(xs1, ys1, xs2, ys2)])
-    else:
-        return _plane_azimuth(xs1, ys1, xs2, ys2)
-
-def _sphere_azimuth(lon1, lat1, lon2, lat2):
-    dlon = lon2 - lon1
-    if (cos(lat1) * tan(lat2) - sin(lat1) * cos(dlon)) == 0:
-        az = 0.5*pi
-    else:
-        az = atan(sin(dlon) / (cos(lat1) * tan(lat2) - sin(lat1) * cos(dlon)))
-    
-    if unroll_angle(dlon) <= pi:
-        if lat2 < lat1:
-            az = az + pi
-    else:
-        if lat1 < lat2:
-            az = az + 2*pi
-        else:
-            az = az + pi
-    return unroll_angle(az)
+    dx = np.asarray(xs2, dtype=np.float64) - np.asarray(xs1, dtype=np.float64)
+    dy = np.asarray(ys2, dtype=np.float64) - np.asarray(ys1, dtype=np.float64)
+    az = unroll_angle(np.arctan2(dx, dy))
+    # coincident points have an azimuth of pi
+    return _result(np.where((dx == 0) & (dy == 0), np.pi, az))
 
 def sphere_azimuth(lons1, lats1, lons2, lats2):
-    if hasattr(lons1, "__len__"):
-        return np.array([_sphere_azimuth(lon1, lat1, lon2, lat2)
-                        for lon1, lat1, lon2, lat2
-                        in zip(lons1, lats1, lons2, lats2)])
-    else:
-        return _sphere_azimuth(lons1, lats1, lons2, lats2)
+    """ Return azimuth between points on a sphere. Coordinates are in
+    radians. """
+    lons1, lats1, lons2, lats2 = (np.asarray(a, dtype=np.float64)
+                                  for a in (lons1, lats1, lons2, lats2))
+    dlon = lons2 - lons1
+    az = unroll_angle(np.arctan2(np.sin(dlon) * np.cos(lats2),
+                                 np.cos(lats1) * np.sin(lats2) -
+                                 np.sin(lats1) * np.cos(lats2) * np.cos(dlon)))
+    # coincident points have an azimuth of pi/2
+    coincident = (lats1 == lats2) & (np.mod(dlon, 2*np.pi) == 0)
+    return _result(np.where(coincident, 0.5*np.pi, az))
+
+def _reduced_latitude(lats, f):
+    """ Return the sine and cosine of the reduced latitude of *lats* on an
+    ellipsoid with flattening *f*. """
+    tanU = (1 - f) * np.tan(lats)
+    cosU = 1 / np.sqrt(1 + tanU**2)
+    return tanU * cosU, cosU
+
+def ellipsoid_inverse(lons1, lats1, lons2, lats2, a, f, tol=1e-12, maxiter=200):
+    """ Solve the inverse geodesic problem on an ellipsoid with semi-major
+    axis *a* and flattening *f* using Vincenty's method. Coordinates are in
+    radians.
+
+    Iteration stops once the change in the auxiliary longitude is below *tol*
+    radians for every pair, or after *maxiter* iterations. Nearly antipodal
+    pairs may fail to converge.
+
+    Returns arrays of the forward azimuth at the first point, the forward
+    azimuth at the second point, the distance, and whether each pair
+    converged.
+    """
+    lons1, lats1, lons2, lats2 = np.broadcast_arrays(
+            *(np.asarray(v, dtype=np.float64) for v in (lons1, lats1, lons2, lats2)))
+    b = a * (1 - f)
+    L = (lons2 - lons1).ravel()
+    sinU1, cosU1 = _reduced_latitude(lats1.ravel(), f)
+    sinU2, cosU2 = _reduced_latitude(lats2.ravel(), f)
+    # products of the reduced latitude terms
+    prods = (cosU2, sinU1*sinU2, cosU1*cosU2, cosU1*sinU2, sinU1*cosU2)
+
+    def terms(lam, prods):
+        cU2, sU1sU2, cU1cU2, cU1sU2, sU1cU2 = prods
+        sinlam, coslam = np.sin(lam), np.cos(lam)
+        sinsig = np.sqrt((cU2*sinlam)**2 + (cU1sU2 - sU1cU2*coslam)**2)
+        cossig = sU1sU2 + cU1cU2*coslam
+        sig = np.arctan2(sinsig, cossig)
+        sinalpha = np.divide(cU1cU2*sinlam, sinsig, out=np.zeros_like(lam),
+                             where=(sinsig != 0))
+        cos2alpha = 1 - sinalpha**2
+        # equatorial lines have cos2alpha == 0
+        cos2sigm = np.divide(2*sU1sU2, cos2alpha, out=np.zeros_like(lam),
+                             where=(cos2alpha != 0))
+        cos2sigm = np.where(cos2alpha != 0, cossig - cos2sigm, 0.0)
+        return sinsig, cossig, sig, sinalpha, cos2alpha, cos2sigm
+
+    # iterate on compacted arrays holding the pairs that have not converged
+    lam = L.copy()
+    active = np.arange(len(L))
+    lam_a, L_a, prods_a = lam, L, prods
+    for _ in range(maxiter):
+        if len(active) == 0:
+            break
+        sinsig, cossig, sig, sinalpha, cos2alpha, cos2sigm = terms(lam_a, prods_a)
+        C = f / 16 * cos2alpha * (4 + f * (4 - 3*cos2alpha))
+        lamnew = L_a + (1 - C) * f * sinalpha * \
+                (sig + C*sinsig*(cos2sigm + C*cossig*(-1 + 2*cos2sigm**2)))
+        done = np.abs(lamnew - lam_a) <= tol
+        lam_a = lamnew
+        if done.any():
+            lam[active] = lam_a
+            keep = ~done
+            active = active[keep]
+            lam_a, L_a = lam_a[keep], L_a[keep]
+            prods_a = tuple(p[keep] for p in prods_a)
+    lam[active] = lam_a
+    converged = np.ones(len(L), dtype=bool)
+    converged[active] = False
+
+    sinsig, cossig, sig, sinalpha, cos2alpha, cos2sigm = terms(lam, prods)
+    u2 = cos2alpha * (a**2 - b**2) / b**2
+    A = 1 + u2/16384 * (4096 + u2*(-768 + u2*(320 - 175*u2)))
+    B = u2/1024 * (256 + u2*(-128 + u2*(74 - 47*u2)))
+    dsig = B*sinsig*(cos2sigm + B/4*(cossig*(-1 + 2*cos2sigm**2) -
+                     B/6*cos2sigm*(-3 + 4*sinsig**2)*(-3 + 4*cos2sigm**2)))
+    dist = b * A * (sig - dsig)
+
+    sinlam, coslam = np.sin(lam), np.cos(lam)
+    az1 = np.arctan2(cosU2*sinlam, prods[3] - prods[4]*coslam)
+    az2 = np.arctan2(cosU1*sinlam, prods[3]*coslam - prods[4])
+    shape = lons1.shape
+    return (az1.reshape(shape), az2.reshape(shape), dist.reshape(shape),
+            converged.reshape(shape))
+
+def ellipsoid_forward(lons, lats, az, dist, a, f, tol=1e-12, maxiter=200):
+    """ Solve the direct geodesic problem on an ellipsoid with semi-major axis
+    *a* and flattening *f* using Vincenty's method. Coordinates and azimuths
+    are in radians.
+
+    Iteration stops once the change in angular distance is below *tol*
+    radians for every point, or after *maxiter* iterations.
+
+    Returns arrays of longitude (wrapped to [-pi, pi)) and latitude of the
+    destination, and the forward azimuth at the destination.
+    """
+    lons, lats, az, dist = np.broadcast_arrays(
+            *(np.asarray(v, dtype=np.float64) for v in (lons, lats, az, dist)))
+    b = a * (1 - f)
+    sinU1, cosU1 = _reduced_latitude(lats, f)
+    sinaz, cosaz = np.sin(az), np.cos(az)
+    sig1 = np.arctan2(sinU1, cosU1*cosaz)
+    sinalpha = cosU1 * sinaz
+    cos2alpha = 1 - sinalpha**2
+    u2 = cos2alpha * (a**2 - b**2) / b**2
+    A = 1 + u2/16384 * (4096 + u2*(-768 + u2*(320 - 175*u2)))
+    B = u2/1024 * (256 + u2*(-128 + u2*(74 - 47*u2)))
+
+    sig0 = dist / (b * A)
+    sig = sig0
+    for _ in range(maxiter):
+        cos2sigm = np.cos(2*sig1 + sig)
+        sinsig, cossig = np.sin(sig), np.cos(sig)
+        dsig = B*sinsig*(cos2sigm + B/4*(cossig*(-1 + 2*cos2sigm**2) -
+                         B/6*cos2sigm*(-3 + 4*sinsig**2)*(-3 + 4*cos2sigm**2)))
+        signew = sig0 + dsig
+        done = np.all(np.abs(signew - sig) <= tol)
+        sig = signew
+        if done:
+            break
+
+    cos2sigm = np.cos(2*sig1 + sig)
+    sinsig, cossig = np.sin(sig), np.cos(sig)
+    tmp = sinU1*sinsig - cosU1*cossig*cosaz
+    lats2 = np.arctan2(sinU1*cossig + cosU1*sinsig*cosaz,
+                       (1 - f) * np.sqrt(sinalpha**2 + tmp**2))
+    lam = np.arctan2(sinsig*sinaz, cosU1*cossig - sinU1*sinsig*cosaz)
+    C = f / 16 * cos2alpha * (4 + f * (4 - 3*cos2alpha))
+    L = lam - (1 - C) * f * sinalpha * \
+            (sig + C*sinsig*(cos2sigm + C*cossig*(-1 + 2*cos2sigm**2)))
+    az2 = np.arctan2(sinalpha, -tmp)
+    lons2 = np.mod(lons + L + np.pi, 2*np.pi) - np.pi
+    return lons2, lats2, az2
+
+def _ring_next(starts, n):
+    """ Return the index of the next vertex in the ring for each of *n*
+    vertices, where rings begin at positions *starts*. """
+    nxt = np.arange(1, n+1)
+    ends = np.append(starts[1:], n)
+    nxt[ends-1] = starts
+    return nxt
+
+def sphere_ring_areas(lons, lats, starts, radius):
+    """ Return the areas of rings on a sphere of *radius* with edges along
+    great circles. The vertices of all rings are concatenated in *lons* and
+    *lats* (radians), and ring *i* begins at position *starts[i]*. The area
+    of each ring is that of the smaller of the two regions it bounds. """
+    lons = np.asarray(lons, dtype=np.float64)
+    lats = np.asarray(lats, dtype=np.float64)
+    starts = np.asarray(starts, dtype=np.int64)
+    if len(starts) == 0:
+        return np.zeros(0, dtype=np.float64)
+    nxt = _ring_next(starts, len(lons))
+
+    # signed area between each edge and the equator
+    dlon = np.mod(lons[nxt] - lons + np.pi, 2*np.pi) - np.pi
+    t1, t2 = np.tan(0.5*lats), np.tan(0.5*lats[nxt])
+    excess = 2 * np.arctan2(np.tan(0.5*dlon) * (t1 + t2), 1 + t1*t2)
+
+    # rings that encircle a pole sweep through 2pi of longitude
+    S = np.add.reduceat(excess, starts)
+    turns = np.round(np.add.reduceat(dlon, starts) / (2*np.pi))
+    S = np.abs(S - 2*np.pi*turns)
+    return np.minimum(S, 4*np.pi - S) * radius**2
+
+def ellipsoid_ring_areas(lons, lats, starts, a, f):
+    """ Return the areas of rings on an ellipsoid with semi-major axis *a* and
+    flattening *f*. Arguments are as for `sphere_ring_areas`.
+
+    Latitudes are converted to authalic latitudes, which map the ellipsoid to
+    a sphere of equal area. Edges follow great circles on that sphere, which
+    for the short edges of typical polygons differ negligibly from ellipsoidal
+    geodesics.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    if f == 0:
+        return sphere_ring_areas(lons, lats, starts, a)
+    e2 = f * (2 - f)
+    e = np.sqrt(e2)
+
+    def q(sinlat):
+        return (1 - e2) * (sinlat / (1 - e2*sinlat**2) -
+                           np.log((1 - e*sinlat) / (1 + e*sinlat)) / (2*e))
+
+    qp = q(1.0)
+    beta = np.arcsin(np.clip(q(np.sin(lats)) / qp, -1.0, 1.0))
+    return sphere_ring_areas(lons, beta, starts, a*np.sqrt(0.5*qp))
+
+# approximate bytes of temporary storage used per point pair by the inverse
+# functions, which sets the number of rows in a chunk
+_BYTES_PER_PAIR = 256
+
+def _row_chunks(n, m, maxbytes):
+    """ Return (start, stop) row ranges that keep the temporary storage for
+    each chunk of an (n x m) problem below *maxbytes*. """
+    rows = max(1, int(maxbytes // (max(m, 1) * _BYTES_PER_PAIR)))
+    return [(i, min(i+rows, n)) for i in range(0, n, rows)]
+
+def _map_chunks(func, chunks, threads):
+    """ Apply *func* to each chunk, using a pool of *threads* threads when
+    *threads* is greater than one. """
+    if threads is None or threads <= 1 or len(chunks) <= 1:
+        return [func(chunk) for chunk in chunks]
+    pool = ThreadPool(threads)
+    try:
+        return pool.map(func, chunks)
+    finally:
+        pool.close()
+
+def _pair_distances(inverse, x1, y1, x2, y2, z1, z2):
+    """ Return the (n x m) distances between points (*x1*, *y1*) and
+    (*x2*, *y2*). """
+    n, m = len(x1), len(x2)
+    _, _, d = inverse(np.repeat(x1, m), np.repeat(y1, m),
+                      np.tile(x2, n), np.tile(y2, n), radians=False)
+    d = np.asarray(d, dtype=np.float64).reshape(n, m)
+    if z1 is not None and z2 is not None:
+        d = np.sqrt(d**2 + (z1[:,np.newaxis] - z2)**2)
+    return d
+
+def distance_matrix(inverse, xs1, ys1, xs2, ys2, zs1=None, zs2=None,
+                    maxbytes=2**26, threads=None):
+    """ Return the (n x m) matrix of distances between n points (*xs1*,
+    *ys1*) and m points (*xs2*, *ys2*).
+
+    *inverse* is a function with the signature of `CRS.inverse`, which
+    returns distances in the reference system of the coordinates. If *zs1*
+    and *zs2* are provided, vertical offsets are added in quadrature.
+
+    Rows are computed in chunks that keep temporary storage below *maxbytes*
+    (the result itself requires n*m*8 bytes), optionally in parallel on
+    *threads* threads.
+    """
+    xs1, ys1, xs2, ys2 = (np.asarray(a, dtype=np.float64)
+                          for a in (xs1, ys1, xs2, ys2))
+    out = np.empty((len(xs1), len(xs2)), dtype=np.float64)
+
+    def work(chunk):
+        i0, i1 = chunk
+        z1 = None if zs1 is None else zs1[i0:i1]
+        out[i0:i1] = _pair_distances(inverse, xs1[i0:i1], ys1[i0:i1],
+                                     xs2, ys2, z1, zs2)
+        return
+
+    _map_chunks(work, _row_chunks(len(xs1), len(xs2), maxbytes), threads)
+    return out
+
+def nearest_distances(inverse, xs1, ys1, xs2, ys2, zs1=None, zs2=None,
+                      maxbytes=2**26, threads=None):
+    """ Return the distance from each of n points (*xs1*, *ys1*) to the
+    nearest of m points (*xs2*, *ys2*), and the index of that point. Arguments
+    are as for `distance_matrix`, but the full matrix is never stored. """
+    xs1, ys1, xs2, ys2 = (np.asarray(a, dtype=np.float64)
+                          for a in (xs1, ys1, xs2, ys2))
+    if len(xs2) == 0:
+        raise ValueError("no points to measure distances to")
+    dist = np.empty(len(xs1), dtype=np.float64)
+    idx = np.empty(len(xs1), dtype=np.int64)
+
+    def work(chunk):
+        i0, i1 = chunk
+        z1 = None if zs1 is None else zs1[i0:i1]
+        d = _pair_distances(inverse, xs1[i0:i1], ys1[i0:i1], xs2, ys2, z1, zs2)
+        idx[i0:i1] = np.argmin(d, axis=1)
+        dist[i0:i1] = d[np.arange(i1-i0), idx[i0:i1]]
+        return
+
+    _map_chunks(work, _row_chunks(len(xs1), len(xs2), maxbytes), threads)
+    return dist, idx
 
 
 ###### Utility functions ######
 def unroll_angle(alpha):
-    if hasattr(alpha, "__len__"):
-        alpha = np.array([unroll_angle(a) for a in alpha])
-    else:
-        while alpha < 0:
-            alpha += 2*pi
-        while alpha >= 2*pi:
-            alpha -= 2*pi
-    return alpha
+    """ Return *alpha* wrapped to the interval [0, 2pi). """
+    alpha = np.mod(alpha, 2*np.pi)
+    # np.mod can round small negative angles up to 2pi
+    return _result(np.where(alpha >= 2*np.pi, 0.0, alpha))
 
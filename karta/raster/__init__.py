@@ -9,6 +9,7 @@ from . import misc
 from .grid import RegularGrid, WarpedGrid
 from .read import read_aai, read_gtiff, aairead, gtiffread
 from .aaigrid import AAIGrid
+from .sampling import Sampler
 from .misc import witch_of_agnesi, peaks, pad, slope, aspect, grad, div
 from .misc import normed_vector_field
 
@@ -20,7 +21,7 @@ except ImportError:
 __all__ = ["grid", "aaigrid", "misc",
            "RegularGrid", "WarpedGrid",
            "aairead", "gtiffread", "read_aai", "read_gtiff",
-           "AAIGrid",
+           "AAIGrid", "Sampler",
            "pad", "slope", "aspect", "grad", "div", "normed_vector_field",
            "streamline2d"]
 
@@ -7,9 +7,9 @@ argument to open a grid, or can read data from a numpy array.
 Written by Nat Wilson
 """
 
-from math import sqrt
 import numpy as np
 from . import grid
+from ..vector.geometry import Line
 import traceback
 
 class AAIGrid(grid.RegularGrid):
@@ -432,29 +432,10 @@ class AAIGrid(grid.RegularGrid):
         -------
         profile : ndarray
         """
-        z = []
-        p = 0
-        for s, f in zip(segments[:-1], segments[1:]):
-
-            x0 = s[0]
-            y0 = s[1]
-            xf = f[0]
-            yf = f[1]
-
-            xlen = xf-x0
-            ylen = yf-y0
-            d = sqrt((xf - x0)**2 + (yf - y0)**2)
-
-            while p < d:
-                fd = p / d
-                fx = fd*xlen
-                fy = fd*ylen
-                xi, yi = self.get_indices(x0+fx, y0+fy)
-                z.append(self.data[yi, xi])
-                p += resolution
-            p -= d
-
-        return np.array(z)
+        line = Line(np.asarray(segments, dtype=np.float64)[:,:2])
+        xy = line.vertices_at(np.arange(0.0, line.length, resolution))
+        xi, yi = self.get_indices(xy[:,0], xy[:,1])
+        return self.data[yi, xi]
 
     def clip(self, bounds):
         """ Clip the z-range in place to bounds = [min, max]. """
@@ -3,7 +3,10 @@
 import copy
 import numbers
 import numpy as np
-from ..crs import Cartesian
+from ..crs import Cartesian, transform
+from . import sampling
+from ..vector import _vectorgeo
+from ..vector.geometry import Line
 
 IntegerType = (numbers.Integral, np.int32, np.int64)
 
@@ -199,8 +202,7 @@ class RegularGrid(Grid):
         is assumed that the bounding box shares the same coordinate system as
         the grid. """
         if crs is not None:
-            xg, yg = crs.project([xmin, xmax], [ymin, ymax], inverse=True)
-            x, y = self.crs.project(xg, yg)
+            x, y = transform(crs, self.crs, [xmin, xmax], [ymin, ymax])
             xmin, xmax = x
             ymin, ymax = y
         else:
@@ -287,65 +289,53 @@ class RegularGrid(Grid):
         tnew = (t[0], t[1], dx, dy, t[4], t[5])
         return RegularGrid(tnew, values, crs=self.crs)
 
-    def get_positions(self, x, y):
-        """ Return the column and row indices for the point nearest
-        geographical coordinates (x, y). """
-        # Calculate this by forming block matrices
-        #       | dx sy          |
-        #       | sx dy          |
-        #   T = |      ....      |
-        #       |          dx sy |
-        #       |          sx dy |
-        #
-        #       | x0 |
-        #       | y0 |
-        #   S = | .. |
-        #       | x0 |
-        #       | y0 |
-        #
-        # where the grid transform is t = (x0, y0, dx, dy, sy, sx)
-        #
-        # Then the nearest indices J come from solving the system
-        # T J = X - S
-        try:
-            npts = len(x)
-        except TypeError:
-            npts = 1
-
-        n = min(70, npts)    # number to process at once
-        t = self._transform
-        T = (np.diag(np.tile([t[2], t[3]], n)) +
-             np.diag(np.tile([t[4], 0], n)[:-1], 1) +
-             np.diag(np.tile([t[5], 0], n)[:-1], -1))
-        S = np.tile([t[0], t[1]], n)
+    @property
+    def _inverse_transform(self):
+        """ Coefficients (x0, y0, jx, jy, ix, iy) of the inverse of the grid
+        transform, such that
+
+        j = jx * (X-x0) + jy * (Y-y0)
+        i = ix * (X-x0) + iy * (Y-y0)
+
+        The coefficients are computed once per transform. """
+        cached = getattr(self, "_inverse_cache", None)
+        if cached is None or cached[0] != self._transform:
+            t = self._transform
+            det = t[2]*t[3] - t[4]*t[5]
+            if det == 0:
+                raise GridError("grid transform {0} is singular".format(t))
+            cached = (t, (t[0], t[1], t[3]/det, -t[4]/det, -t[5]/det, t[2]/det))
+            self._inverse_cache = cached
+        return cached[1]
 
-        if npts == 1:
-            ind = np.linalg.solve(T, np.array([x, y]) - S)
-        else:
-            ind = np.empty(2*npts, dtype=np.float64)
-            i = 0
-            while i != npts:
-                ip = min(i + n, npts)
-                xy = np.zeros(2*n, dtype=np.float64)
-                xy[:2*(ip-i)] = np.vstack([x[i:ip], y[i:ip]]).T.ravel()
-                ind_ = np.linalg.solve(T, xy - S)
-                ind[2*i:2*ip] = ind_[:2*(ip-i)]
-                i = ip
-
-        ny, nx = self.size
-        j = ind[::2]
-        i = ind[1::2]
-        return i, j
+    def get_positions(self, x, y):
+        """ Return the fractional row and column indices of geographical
+        coordinates (x, y), as arrays. """
+        x0, y0, jx, jy, ix, iy = self._inverse_transform
+        dx = np.subtract(np.atleast_1d(x), x0, dtype=np.float64)
+        dy = np.subtract(np.atleast_1d(y), y0, dtype=np.float64)
+        if jy == 0 and ix == 0:
+            dx *= jx
+            dy *= iy
+            return dy, dx
+        i = ix*dx
+        i += iy*dy
+        dx *= jx
+        dy *= jy
+        dx += dy
+        return i, dx
 
     def get_indices(self, x, y):
         """ Return the column and row indices for the point nearest
         geographical coordinates (x, y). """
-        ny, nx = self.size
+        ny, nx = self.values.shape[:2]
         i, j = self.get_positions(x, y)
 
         if len(i) != 1:
-            i, j = np.round(i).astype(int), np.round(j).astype(int)
-            if min(i) < 0 or max(i) > ny-1 or min(j) < 0 or max(j) > nx-1:
+            i = np.rint(i, out=i).astype(int)
+            j = np.rint(j, out=j).astype(int)
+            if len(i) != 0 and (i.min() < 0 or i.max() > ny-1 or
+                                j.min() < 0 or j.max() > nx-1):
                 raise GridError("Coordinates outside grid region ({0})".format(self.bbox))
         else:
             i, j = int(round(i[0])), int(round(j[0]))
@@ -354,53 +344,101 @@ class RegularGrid(Grid):
 
         return i,j
 
-    def sample_nearest(self, x, y):
-        """ Return the value nearest to (`x`, `y`). Nearest grid center
-        sampling scheme. """
-        i, j = self.get_indices(x, y)
-        ny, nx = self.values.shape[:2]
-        return self.values[i, j]
-
-    def sample_bilinear(self, x, y):
-        """ Return the value nearest to (`x`, `y`). Bilinear sampling scheme.
-        """
+    def _sample(self, x, y, method, fill_value, out, return_mask=False):
+        """ Sample grid values at (*x*, *y*) with a stencil from
+        `sampling.STENCILS`. """
+        try:
+            stencil = sampling.STENCILS[method]
+        except KeyError:
+            raise ValueError("method \"{0}\" not available".format(method))
+        shape = np.broadcast(np.asarray(x), np.asarray(y)).shape
+        extra = self.values.shape[2:]
         i, j = self.get_positions(x, y)
-        i0 = np.floor(i).astype(int)
-        i1 = np.ceil(i).astype(int)
-        j0 = np.floor(j).astype(int)
-        j1 = np.ceil(j).astype(int)
-
-        # Handle case where interpolation point is exactly on a grid point
-        mska = i0==i1
-        mskb = i0==0
-        i0[mska&~mskb] -= 1
-        i1[mska&mskb] += 1
-
-        mska = j0==j1
-        mskb = j0==0
-        j0[mska&~mskb] -= 1
-        j1[mska&mskb] += 1
-
-        dx, dy = self._transform[2:4]
-        z = (self.values[i0,j0]*(i1-i)*(j1-j) + self.values[i1,j0]*(i-i0)*(j1-j) + \
-             self.values[i0,j1]*(i1-i)*(j-j0) + self.values[i1,j1]*(i-i0)*(j-j0))
-        return z
-
-    def sample(self, x, y, crs=None, method="bilinear"):
+        if fill_value is None:
+            fill_value = self.nodata
+
+        buf = out
+        if out is not None:
+            buf = out.reshape((i.size,) + extra)
+        index, weights, valid = sampling.flatten_stencil(
+                stencil(i.ravel(), j.ravel(), self.values.shape),
+                self.values.shape)
+        res, valid = sampling.apply_weights(self.values, index, weights, valid,
+                                            nodata=self.nodata,
+                                            fill_value=fill_value, out=buf)
+        if out is None:
+            out = res.reshape(shape + extra)
+            if out.ndim == 0:
+                out = out[()]
+        elif not np.may_share_memory(res, out):
+            out[...] = res.reshape(out.shape)
+
+        if return_mask:
+            return out, valid.reshape(shape + extra)
+        return out
+
+    def sample_nearest(self, x, y, fill_value=None, out=None):
+        """ Return the values nearest to (`x`, `y`). Nearest grid center
+        sampling scheme. Points outside the grid are set to *fill_value*
+        (default grid nodata). """
+        return self._sample(x, y, "nearest", fill_value, out)
+
+    def sample_bilinear(self, x, y, fill_value=None, out=None):
+        """ Return the values at (`x`, `y`). Bilinear sampling scheme. Points
+        outside the grid, or next to nodata cells, are set to *fill_value*
+        (default grid nodata). """
+        return self._sample(x, y, "bilinear", fill_value, out)
+
+    def sample_bicubic(self, x, y, fill_value=None, out=None):
+        """ Return the values at (`x`, `y`). Bicubic convolution sampling
+        scheme. Points outside the grid, or near nodata cells, are set to
+        *fill_value* (default grid nodata). """
+        return self._sample(x, y, "bicubic", fill_value, out)
+
+    def sample(self, x, y, crs=None, method="bilinear", fill_value=None,
+               out=None, return_mask=False):
         """ Return the values nearest (*x*, *y*), where *x* and *y* may be
         equal length vectors. Keyword *method* may be one of 'nearest',
-        'bilinear' (default).
+        'bilinear' (default), 'bicubic'.
+
+        Optional parameters:
+        --------------------
+        crs : coordinate system of (*x*, *y*) [default grid crs]
+        fill_value : value for points outside the grid or on nodata cells
+                     [default grid nodata]
+        out : array to write the sampled values to
+        return_mask : if True, also return a mask of the valid points
         """
         if crs is not None:
-            xg, yg = crs.project(x, y, inverse=True)
-            x, y = self.crs.project(xg, yg)
-
-        if method == "nearest":
-            return self.sample_nearest(x, y)
-        elif method == "bilinear":
-            return self.sample_bilinear(x, y)
-        else:
-            raise ValueError("method \"{0}\" not available".format(method))
+            x, y = transform(crs, self.crs, x, y)
+        return self._sample(x, y, method, fill_value, out,
+                            return_mask=return_mask)
+
+    def _profile_vertices(self, lines, resolution):
+        """ Return an (n x 2) array of grid coordinates spaced *resolution*
+        apart along each of *lines*, beginning at their first vertices, and
+        the number of positions on each line. Lines that share a coordinate
+        system are handled together (see `_line_positions`). """
+        groups = {}
+        for k, line in enumerate(lines):
+            groups.setdefault(id(line.crs), []).append(k)
+
+        results = []
+        counts = np.empty(len(lines), dtype=np.int64)
+        for idx in groups.values():
+            group = [lines[k] for k in idx]
+            xy, n = _line_positions(group, resolution)
+            x, y = transform(group[0].crs, self.crs, xy[:,0], xy[:,1])
+            results.append((idx, np.column_stack([x, y])))
+            counts[idx] = n
+
+        starts = np.cumsum(counts) - counts
+        vertices = np.empty((counts.sum(), 2), dtype=np.float64)
+        for idx, xy in results:
+            _, rows = _vectorgeo._expand_ranges(starts[idx],
+                                                starts[idx] + counts[idx])
+            vertices[rows] = xy
+        return vertices, counts
 
     def profile(self, line, resolution=None, **kw):
         """ Sample along a *line* at *resolution*.
@@ -409,42 +447,44 @@ class RegularGrid(Grid):
         -----------
         line : `geometry.Line`-like object describing the sampling path
 
-        resolution : sample spacing
+        resolution : sample spacing, measured horizontally along *line* in its
+                     coordinate system [default grid cell size]
 
         Additional keyword arguments passed to `RegularGrid.sample` (e.g. to
         specify sampling method)
 
         Returns:
         --------
+        vertices : (n x 2) array of sample positions in grid coordinates
+
         profile : ndarray
         """
         if resolution is None:
-            resolution = min(self.transform[2:4])
-
-        remainder = 0
-        pt0 = line[0]
-        vertices = [pt0.get_vertex(self.crs)]
-
-        for seg in line.segments:
-            pos = 0
-            az = seg[0].azimuth(seg[1])
-
-            while pos < seg.length:
-                distance_to_endpt = pt0.distance(seg[1])
-                if distance_to_endpt >= resolution:
-                    pt1 = pt0.walk(resolution - remainder, az)
-                    pos += resolution - remainder
-                    vertices.append(pt1.get_vertex(self.crs))
-                    remainder = 0
-                    pt0 = pt1
-                else:
-                    remainder = distance_to_endpt
-                    pos = seg.length
-                    pt0 = seg[1]
-
-        z = self.sample(*zip(*vertices), **kw)
+            resolution = min(abs(d) for d in self.transform[2:4])
+        vertices, _ = self._profile_vertices([line], resolution)
+        z = self.sample(vertices[:,0], vertices[:,1], **kw)
         return vertices, z
 
+    def profiles(self, lines, resolution=None, **kw):
+        """ Sample along each of *lines* at *resolution* (see `profile`). The
+        positions on all lines sharing a coordinate system are computed
+        together, and all profiles are sampled with a single call to
+        `RegularGrid.sample`.
+
+        Returns:
+        --------
+        list of (vertices, profile) pairs
+        """
+        if resolution is None:
+            resolution = min(abs(d) for d in self.transform[2:4])
+        lines = list(lines)
+        if len(lines) == 0:
+            return []
+        vertices, counts = self._profile_vertices(lines, resolution)
+        z = self.sample(vertices[:,0], vertices[:,1], **kw)
+        splits = np.cumsum(counts)[:-1]
+        return list(zip(np.split(vertices, splits), np.split(z, splits)))
+
     def as_warpedgrid(self):
         """ Return a copy of grid as a `WarpedGrid`. This is a more general
         grid class that has a larger memory footprint but can represent more
@@ -590,6 +630,24 @@ class NonEquivalentGridError(GridError):
         else:
             self.message = message
 
+def _line_positions(lines, resolution):
+    """ Return an (n x 2) array of positions spaced *resolution* apart along
+    each of *lines*, which share a coordinate system, and the number of
+    positions on each line. The lines are joined into a single path, so that
+    the positions on all of them are found with one call to
+    `Line.vertices_at`. """
+    nverts = np.array([len(line.vertices) for line in lines], dtype=np.int64)
+    if np.any(nverts < 2):
+        raise ValueError("lines must have at least one segment")
+    path = Line(np.vstack([line.vertices[:,:2] for line in lines]),
+                crs=lines[0].crs)
+    last = np.cumsum(nverts) - 1
+    cumlength = path.cumlength()
+    linestart = cumlength[last - nverts + 1]
+    counts = ((cumlength[last] - linestart) // resolution).astype(np.int64) + 1
+    lineidx, steps = _vectorgeo._expand_ranges(np.zeros_like(counts), counts)
+    return path.vertices_at(linestart[lineidx] + steps*resolution), counts
+
 def get_nodata(T):
     """ Return a default value for NODATA given a type (e.g. int, float,
     complex).
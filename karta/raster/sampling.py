@@ -0,0 +1,255 @@
+""" Vectorized sampling of gridded values at fractional row and column
+positions.
+
+A sampling scheme is described by a stencil: a tuple of row index arrays, a
+tuple of column index arrays, the matching row and column weights, and a mask
+of the positions that can be sampled. The sampled value at each position is
+the weighted sum over every combination of stencil row and column. """
+
+import numpy as np
+from ..crs import transform
+
+def nearest_stencil(i, j, shape):
+    """ Return the stencil sampling the cells nearest to positions (*i*,
+    *j*) on a grid of *shape*. """
+    ny, nx = shape[:2]
+    i = np.rint(i)
+    j = np.rint(j)
+    valid = (i >= 0) & (i <= ny-1) & (j >= 0) & (j <= nx-1)
+    rows = np.where(valid, i, 0).astype(np.intp)
+    cols = np.where(valid, j, 0).astype(np.intp)
+    one = np.ones(len(valid))
+    return (rows,), (cols,), (one,), (one,), valid
+
+def _linear_weights(t, n):
+    """ Return the two indices and linear weights of fractional positions *t*
+    along an axis of length *n*. """
+    t0 = np.clip(np.floor(t), 0, max(n-2, 0)).astype(np.intp)
+    u = t - t0
+    return (t0, np.minimum(t0+1, n-1)), (1.0-u, u)
+
+def bilinear_stencil(i, j, shape):
+    """ Return the stencil bilinearly interpolating between the four cells
+    surrounding positions (*i*, *j*) on a grid of *shape*. Positions on the
+    last row or column are valid. """
+    ny, nx = shape[:2]
+    valid = (i >= 0) & (i <= ny-1) & (j >= 0) & (j <= nx-1)
+    rows, wi = _linear_weights(np.where(valid, i, 0.0), ny)
+    cols, wj = _linear_weights(np.where(valid, j, 0.0), nx)
+    return rows, cols, wi, wj, valid
+
+def _cubic_weights(t, n):
+    """ Return the four indices and cubic convolution weights (Keys, 1981,
+    with a = -0.5) of fractional positions *t* along an axis of length *n*.
+    Indices beyond the axis are clamped to the edge. """
+    t0 = np.clip(np.floor(t), 0, max(n-2, 0)).astype(np.intp)
+    u = t - t0
+    u2 = u*u
+    u3 = u2*u
+    weights = (-0.5*u3 + u2 - 0.5*u,
+               1.5*u3 - 2.5*u2 + 1.0,
+               -1.5*u3 + 2.0*u2 + 0.5*u,
+               0.5*u3 - 0.5*u2)
+    indices = tuple(np.clip(t0+k, 0, n-1) for k in (-1, 0, 1, 2))
+    return indices, weights
+
+def bicubic_stencil(i, j, shape):
+    """ Return the stencil interpolating with cubic convolution over the
+    sixteen cells surrounding positions (*i*, *j*) on a grid of *shape*. """
+    ny, nx = shape[:2]
+    valid = (i >= 0) & (i <= ny-1) & (j >= 0) & (j <= nx-1)
+    rows, wi = _cubic_weights(np.where(valid, i, 0.0), ny)
+    cols, wj = _cubic_weights(np.where(valid, j, 0.0), nx)
+    return rows, cols, wi, wj, valid
+
+STENCILS = {"nearest": nearest_stencil,
+            "bilinear": bilinear_stencil,
+            "bicubic": bicubic_stencil}
+
+def flatten_stencil(stencil, shape):
+    """ Return a *stencil* on a grid of *shape* as linear cell indices (k x
+    npositions), weights (k x npositions) and the mask of valid positions,
+    where k is the number of cells in the stencil. """
+    rows, cols, wi, wj, valid = stencil
+    nx = shape[1]
+    index = np.empty((len(rows)*len(cols), len(valid)), dtype=np.intp)
+    weights = np.empty(index.shape, dtype=np.float64)
+    k = 0
+    for r, a in zip(rows, wi):
+        for c, b in zip(cols, wj):
+            np.multiply(r, nx, out=index[k])
+            index[k] += c
+            np.multiply(a, b, out=weights[k])
+            k += 1
+    return index, weights, valid
+
+def nodata_mask(values, nodata):
+    """ Return a mask of the entries of *values* equal to *nodata*. NaNs are
+    always treated as missing. """
+    if values.dtype.kind in "fc":
+        mask = np.isnan(values)
+        if nodata is not None and nodata == nodata:
+            mask |= (values == nodata)
+        return mask
+    elif nodata is not None and nodata == nodata:
+        return values == nodata
+    else:
+        return np.zeros(values.shape, dtype=bool)
+
+def apply_weights(values, index, weights, valid, nodata=None,
+                  fill_value=np.nan, out=None):
+    """ Sample *values* (nrows x ncols [x nbands]) as weighted sums of the
+    cells in *index*, as returned by `flatten_stencil`.
+
+    Positions that are not *valid*, and positions for which a cell with
+    non-zero weight contains *nodata*, are set to *fill_value*. Results are
+    written to *out* if it is provided, which must have shape (npositions [x
+    nbands]). An *out* buffer that is not of floating point type can only
+    receive nearest samples, with a fill value other than NaN.
+
+    Returns the sampled values and a mask of the valid entries.
+    """
+    ny, nx = values.shape[:2]
+    extra = values.shape[2:]
+    flat = values.reshape((ny*nx,) + extra)
+    k, n = index.shape
+    if out is None:
+        if k == 1:
+            dtype = np.result_type(values.dtype, np.min_scalar_type(fill_value))
+        else:
+            dtype = np.result_type(values.dtype, np.float64)
+        out = np.empty((n,) + extra, dtype=dtype)
+    elif out.shape != (n,) + extra:
+        raise ValueError("output buffer must have shape {0}".format((n,)+extra))
+    elif out.dtype.kind not in "fc":
+        if k != 1:
+            raise ValueError("interpolated samples require an output buffer "
+                             "of floating point type")
+        if fill_value != fill_value:
+            raise ValueError("a NaN fill value requires an output buffer of "
+                             "floating point type")
+
+    wshape = (n,) + (1,)*len(extra)
+    bad = np.empty(out.shape, dtype=bool)
+    bad[...] = ~valid.reshape(wshape)
+    if k == 1:
+        v = flat.take(index[0], axis=0)
+        bad |= nodata_mask(v, nodata)
+        out[...] = v
+    else:
+        out[...] = 0
+        for idx, w in zip(index, weights):
+            v = flat.take(idx, axis=0).astype(out.dtype, copy=False)
+            w = w.reshape(wshape)
+            missing = nodata_mask(v, nodata)
+            if missing.any():
+                bad |= missing & (w != 0)
+                v[missing] = 0
+            v *= w
+            out += v
+    out[bad] = fill_value
+    return out, ~bad
+
+class Sampler(object):
+    """ Sampler for co-registered grids at a fixed set of points.
+
+    The grid positions, cell indices and interpolation weights of the points
+    (*x*, *y*) are computed once from the geometry of *grid*, a RegularGrid.
+    Calling the Sampler with any grid that shares that geometry returns the
+    sampled values with a single gather-and-weight pass.
+
+    Optional parameters
+    -------------------
+    crs                 coordinate system of (*x*, *y*) [default grid crs]
+    method              'nearest', 'bilinear' (default) or 'bicubic'
+    """
+
+    def __init__(self, grid, x, y, crs=None, method="bilinear"):
+        try:
+            stencil = STENCILS[method]
+        except KeyError:
+            raise ValueError("method \"{0}\" not available".format(method))
+        if crs is not None:
+            x, y = transform(crs, grid.crs, x, y)
+        self.method = method
+        self.transform = grid.transform
+        self.gridshape = grid.values.shape[:2]
+        self.shape = np.broadcast(np.asarray(x), np.asarray(y)).shape
+        i, j = grid.get_positions(x, y)
+        self.index, self.weights, self.valid = flatten_stencil(
+                stencil(i.ravel(), j.ravel(), self.gridshape), self.gridshape)
+        return
+
+    def __len__(self):
+        return self.index.shape[1]
+
+    def __call__(self, grid, fill_value=None, out=None, return_mask=False):
+        """ Return the values of *grid* at the sampler points.
+
+        *grid* may be a RegularGrid with the sampler geometry, a sequence of
+        such grids, or an array (nrows x ncols [x nlayers]) such as a stack of
+        grid values. Sampled values have the shape of the points followed by
+        the band or layer dimensions. Invalid points are set to *fill_value*
+        [default grid nodata, or NaN for arrays].
+        """
+        if isinstance(grid, (list, tuple)):
+            return self._sample_grids(grid, fill_value, out, return_mask)
+        values, nodata = self._values(grid)
+        if fill_value is None:
+            fill_value = np.nan if nodata is None else nodata
+
+        extra = values.shape[2:]
+        buf = out
+        if out is not None:
+            buf = out.reshape((len(self),) + extra)
+        res, valid = apply_weights(values, self.index, self.weights,
+                                   self.valid, nodata=nodata,
+                                   fill_value=fill_value, out=buf)
+        if out is None:
+            out = res.reshape(self.shape + extra)
+        elif not np.may_share_memory(res, out):
+            out[...] = res.reshape(out.shape)
+
+        if return_mask:
+            return out, valid.reshape(self.shape + extra)
+        return out
+
+    def _sample_grids(self, grids, fill_value, out, return_mask):
+        """ Sample a sequence of grids into the last axis of one array. """
+        if out is None:
+            if fill_value is not None:
+                fills = [fill_value]
+            else:
+                fills = [np.nan if g.nodata is None else g.nodata for g in grids]
+            dtype = np.result_type(*([g.values.dtype for g in grids] +
+                                     [np.min_scalar_type(f) for f in fills]))
+            if self.index.shape[0] != 1:
+                dtype = np.result_type(dtype, np.float64)
+            out = np.empty(self.shape + (len(grids),), dtype=dtype)
+        valid = np.empty(out.shape, dtype=bool)
+        for k, grid in enumerate(grids):
+            if grid.values.ndim != 2:
+                raise ValueError("grids sampled together must have one band")
+            res = self(grid, fill_value=fill_value, out=out[...,k],
+                       return_mask=return_mask)
+            if return_mask:
+                valid[...,k] = res[1]
+        if return_mask:
+            return out, valid
+        return out
+
+    def _values(self, grid):
+        """ Return the values and nodata value of *grid*, checking that it
+        matches the sampler geometry. """
+        from .grid import NonEquivalentGridError
+        if hasattr(grid, "values"):
+            if grid.transform != self.transform or \
+                    grid.values.shape[:2] != self.gridshape:
+                raise NonEquivalentGridError(self, grid, "grid geometry does "
+                                             "not match the sampler")
+            return grid.values, grid.nodata
+        values = np.asarray(grid)
+        if values.shape[:2] != self.gridshape:
+            raise NonEquivalentGridError(self, values, "array shape does not "
+                                         "match the sampler")
+        return values, None
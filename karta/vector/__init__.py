@@ -8,6 +8,7 @@ from . import geojson
 from . import gpx
 from . import vtk
 from . import quadtree
+from . import rtree
 
 from .geometry import Point, Multipoint, Line, Polygon
 from .read import read_geojson, read_shapefile, from_shape
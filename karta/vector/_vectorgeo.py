@@ -78,6 +78,167 @@ def intersection(x0, x1, x2, x3, y0, y1, y2, y3):
     else:
         return (np.nan, np.nan)
 
+def intersection_many(x0, x1, x2, x3, y0, y1, y2, y3):
+    """ Vectorized form of `intersection`, taking arrays of segment
+    coordinates. Returns arrays of intersection coordinates, which are NaN
+    where the segments do not intersect.
+    """
+    dxa = x1 - x0
+    dxb = x3 - x2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        m0 = np.where(dxa != 0, (y1 - y0) / np.where(dxa != 0, dxa, 1.0), 1e37)
+        m1 = np.where(dxb != 0, (y3 - y2) / np.where(dxb != 0, dxb, 1.0), 1e37)
+        x = (m0*x0 - m1*x2 + y2 - y0) / (m0 - m1)
+        y = np.where(np.abs(x - x0) >= 1e-15, m0 * (x - x0) + y0,
+                     m1 * (x - x2) + y2)
+
+    def isbetween_incl(a, b, c):
+        return (b < np.maximum(a, c)) & (b >= np.minimum(a, c))
+
+    flat_a = np.abs(dxa) < 1e-15
+    flat_b = np.abs(dxb) < 1e-15
+    iswithinx = np.where(flat_a,
+            (np.abs(x - x0) < 1e-15) & isbetween_incl(x2, x, x3),
+            np.where(flat_b,
+                (np.abs(x - x2) < 1e-15) & isbetween_incl(x0, x, x1),
+                isbetween_incl(x0, x, x1) & isbetween_incl(x2, x, x3)))
+
+    flat_a = np.abs(y1 - y0) < 1e-15
+    flat_b = np.abs(y3 - y2) < 1e-15
+    iswithiny = np.where(flat_a,
+            (np.abs(y - y0) < 1e-15) & isbetween_incl(y2, y, y3),
+            np.where(flat_b,
+                (np.abs(y - y2) < 1e-15) & isbetween_incl(y0, y, y1),
+                isbetween_incl(y0, y, y1) & isbetween_incl(y2, y, y3)))
+
+    miss = (m0 == m1) | ~iswithinx | ~iswithiny
+    x[miss] = np.nan
+    y[miss] = np.nan
+    return x, y
+
+def _expand_ranges(lo, hi):
+    """ Given arrays of half-open ranges [lo, hi), return the arrays of range
+    numbers and of the values within each range. """
+    counts = hi - lo
+    ranges = np.repeat(np.arange(len(lo)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return ranges, lo[ranges] + offsets
+
+def _group(q, idx, nqueries):
+    """ Return a list with the sorted indices *idx* belonging to each of the
+    query numbers in *q*, which range from 0 to *nqueries*-1. """
+    order = np.lexsort((idx, q))
+    q, idx = q[order], idx[order]
+    return np.split(idx, np.searchsorted(q, np.arange(1, nqueries)))
+
+def _sweep_candidates(xa0, xa1, xb0, xb1, strict, blocksize):
+    """ Generate blocks of index pairs (i, j) for which the start of segment
+    j in *b* falls within the x-range of segment i in *a*. Segments in *b*
+    must be sorted by their minimum x. When *strict* is True, ties between
+    starting positions are excluded. """
+    side = "right" if strict else "left"
+    lo = np.searchsorted(xb0, xa0, side=side)
+    hi = np.searchsorted(xb0, xa1, side="right")
+    hi = np.maximum(lo, hi)
+    cumcounts = np.cumsum(hi - lo)
+
+    i0 = 0
+    while i0 != len(lo):
+        offset = cumcounts[i0-1] if i0 != 0 else 0
+        i1 = np.searchsorted(cumcounts, offset + blocksize, side="right")
+        i1 = min(max(i1, i0+1), len(lo))
+        ranges, j = _expand_ranges(lo[i0:i1], hi[i0:i1])
+        yield ranges + i0, j
+        i0 = i1
+
+def sweep_intersections(a0, a1, b0=None, b1=None, closed=False,
+                        first_only=False, blocksize=2**20):
+    """ Find the intersections between the segments running from *a0* to *a1*
+    and the segments running from *b0* to *b1*, where each argument is an
+    (n x 2) array of vertices.
+
+    Segments are sorted by their minimum x-coordinate and swept, so that
+    `intersection_many` is only evaluated for pairs with overlapping bounding
+    boxes. *blocksize* bounds the number of candidate pairs tested at a time.
+
+    If *b0* and *b1* are None, intersections between non-adjacent segments
+    of *a* are found instead. In this case *closed* indicates that the last
+    and first segments are adjacent.
+
+    If *first_only* is True, searching stops after the first block of pairs
+    containing an intersection.
+
+    Returns arrays of segment indices into *a* and *b*, and the x and y
+    coordinates of the intersections, ordered by segment indices.
+    """
+    selfmode = b0 is None
+    if selfmode:
+        b0, b1 = a0, a1
+
+    def bounds(p0, p1):
+        xmin = np.minimum(p0[:,0], p1[:,0])
+        order = np.argsort(xmin, kind="mergesort")
+        return (order, xmin[order],
+                np.maximum(p0[:,0], p1[:,0])[order],
+                np.minimum(p0[:,1], p1[:,1])[order],
+                np.maximum(p0[:,1], p1[:,1])[order])
+
+    if len(a0) == 0 or len(b0) == 0:
+        empty = np.array([], dtype=int)
+        return empty, empty, np.array([]), np.array([])
+
+    oa, xa0, xa1, ya0, ya1 = bounds(a0, a1)
+    ob, xb0, xb1, yb0, yb1 = bounds(b0, b1)
+
+    # Pairs in which b starts within the x-range of a, and pairs in which a
+    # starts within the x-range of b. For self-intersection the second set
+    # mirrors the first.
+    passes = [(False, _sweep_candidates(xa0, xa1, xb0, xb1, False, blocksize))]
+    if not selfmode:
+        passes.append((True, _sweep_candidates(xb0, xb1, xa0, xa1, True, blocksize)))
+
+    n = len(a0)
+    ia_out, ib_out, x_out, y_out = [], [], [], []
+    for swapped, blocks in passes:
+        for i, j in blocks:
+            if swapped:
+                i, j = j, i
+            keep = (ya0[i] <= yb1[j]) & (yb0[j] <= ya1[i])
+            if selfmode:
+                # pairs of segments that start at the same x appear twice
+                keep &= (xa0[i] != xb0[j]) | (oa[i] < ob[j])
+            i, j = oa[i[keep]], ob[j[keep]]
+            if selfmode:
+                i, j = np.minimum(i, j), np.maximum(i, j)
+                keep = (j - i > 1)
+                if closed:
+                    keep &= ~((i == 0) & (j == n-1))
+                i, j = i[keep], j[keep]
+
+            x, y = intersection_many(a0[i,0], a1[i,0], b0[j,0], b1[j,0],
+                                     a0[i,1], a1[i,1], b0[j,1], b1[j,1])
+            hit = ~np.isnan(x)
+            if hit.any():
+                ia_out.append(i[hit])
+                ib_out.append(j[hit])
+                x_out.append(x[hit])
+                y_out.append(y[hit])
+                if first_only:
+                    break
+        if first_only and len(ia_out) != 0:
+            break
+
+    if len(ia_out) == 0:
+        empty = np.array([], dtype=int)
+        return empty, empty, np.array([]), np.array([])
+
+    ia = np.concatenate(ia_out)
+    ib = np.concatenate(ib_out)
+    x = np.concatenate(x_out)
+    y = np.concatenate(y_out)
+    order = np.lexsort((ib, ia))
+    return ia[order], ib[order], x[order], y[order]
+
 def intersects_cn(xp, yp, x0, x1, y0, y1):
     """ Test whether a horizontal ray emanating left from a point (xp, yp)
     crosses a line segment. Used to implement a crossing number membership
@@ -112,6 +273,41 @@ def intersects_cn(xp, yp, x0, x1, y0, y1):
             
     return iswithinx and iswithiny
 
+def crossings_cn(xp, yp, x0, x1, y0, y1):
+    """ Vectorized form of `intersects_cn`. Given arrays of points (*xp*,
+    *yp*) and arrays of segments (*x0*, *x1*, *y0*, *y1*), return an array
+    with the number of segments crossed by a horizontal ray emanating from
+    each point. Memory use scales with the product of the number of points
+    and the number of segments.
+    """
+    xp = np.asarray(xp, dtype=np.float64)[:,np.newaxis]
+    yp = np.asarray(yp, dtype=np.float64)[:,np.newaxis]
+    dx = x1 - x0
+    dy = y1 - y0
+
+    vertical = (dx == 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        m = np.where(vertical, 1e37, dy / np.where(vertical, 1.0, dx))
+    horizontal = (m == 0.0)
+    m[horizontal] = 1.0
+
+    x = (yp - y0) / m + x0
+
+    ascending = m > 0
+    xlo = np.minimum(x0, x1)
+    xhi = np.maximum(x0, x1)
+    ylo = np.minimum(y0, y1)
+    yhi = np.maximum(y0, y1)
+    isbetween_x = np.where(ascending, (xlo <= x) & (x < xhi),
+                                      (xlo < x) & (x <= xhi))
+    isbetween_y = np.where(ascending, (ylo <= yp) & (yp < yhi),
+                                      (ylo < yp) & (yp <= yhi))
+
+    iswithinx = ((np.abs(dx) >= 1e-15) & isbetween_x) | (np.abs(x - x0) < 1e-15)
+    iswithiny = ((np.abs(dy) >= 1e-15) & isbetween_y) | (np.abs(yp - y0) < 1e-15)
+    crosses = ~horizontal & (x >= xp) & iswithinx & iswithiny
+    return crosses.sum(axis=1)
+
 def distance(pt0, pt1):
     """ Calculate the distance between two points (tuples) """
     d = math.sqrt(sum([abs(a-b)**2 for a, b in zip(pt0, pt1)]))
@@ -254,3 +450,169 @@ def hashpt(xmin, xmax, ymin, ymax, x, y):
 class HashError(Exception):
     pass
 
+
+def _spread_bits(v):
+    """ Spread the lower 32 bits of each integer in *v* so that bit k moves to
+    bit 2k. """
+    v = np.asarray(v, dtype=np.uint64) & np.uint64(0x00000000FFFFFFFF)
+    v = (v | (v << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x3333333333333333)
+    v = (v | (v << np.uint64(1))) & np.uint64(0x5555555555555555)
+    return v
+
+def _compact_bits(v):
+    """ Inverse of `_spread_bits`. """
+    v = np.asarray(v, dtype=np.uint64) & np.uint64(0x5555555555555555)
+    v = (v | (v >> np.uint64(1))) & np.uint64(0x3333333333333333)
+    v = (v | (v >> np.uint64(2))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    v = (v | (v >> np.uint64(4))) & np.uint64(0x00FF00FF00FF00FF)
+    v = (v | (v >> np.uint64(8))) & np.uint64(0x0000FFFF0000FFFF)
+    v = (v | (v >> np.uint64(16))) & np.uint64(0x00000000FFFFFFFF)
+    return v
+
+def hashpt_many(xmin, xmax, ymin, ymax, x, y, depth):
+    """ Return an array of Morton codes for the points given by coordinate
+    arrays *x* and *y* in a global bbox. Read as base-4 numbers, the codes
+    hold the first *depth* (at most 31) quadrants generated by `hashpt`, with
+    the coarsest quadrant in the leading digit. """
+    if not 0 < depth <= 31:
+        raise ValueError("depth must be between 1 and 31")
+    n = 2**depth
+    ix = np.floor((np.asarray(x, dtype=np.float64) - xmin) / (xmax - xmin) * n)
+    iy = np.floor((np.asarray(y, dtype=np.float64) - ymin) / (ymax - ymin) * n)
+    ix = np.clip(ix, 0, n-1).astype(np.uint64)
+    iy = np.clip(iy, 0, n-1).astype(np.uint64)
+    return _spread_bits(ix) | (_spread_bits(iy) << np.uint64(1))
+
+def unhash_many(codes):
+    """ Return the integer cell positions (ix, iy) encoded by Morton *codes*
+    from `hashpt_many`. """
+    codes = np.asarray(codes, dtype=np.uint64)
+    ix = _compact_bits(codes).astype(np.int64)
+    iy = _compact_bits(codes >> np.uint64(1)).astype(np.int64)
+    return ix, iy
+
+def unit_vectors(lons, lats):
+    """ Return an (n x 3) array of unit vectors for the points on a sphere
+    with longitudes *lons* and latitudes *lats* in degrees. """
+    lons = np.radians(np.asarray(lons, dtype=np.float64))
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    coslat = np.cos(lats)
+    return np.column_stack([coslat*np.cos(lons), coslat*np.sin(lons), np.sin(lats)])
+
+def lonlat(xyz):
+    """ Return arrays of longitude and latitude in degrees for an (n x 3)
+    array of vectors. """
+    r = np.sqrt(np.sum(xyz**2, axis=1))
+    lons = np.degrees(np.arctan2(xyz[:,1], xyz[:,0]))
+    lats = np.degrees(np.arcsin(np.clip(xyz[:,2] / r, -1.0, 1.0)))
+    return lons, lats
+
+def hemisphere_centre(*xyz):
+    """ Return a unit vector *c* such that every vector in the (n x 3) arrays
+    *xyz* lies in the open hemisphere centred on *c*, or None if the mean
+    direction does not have this property. """
+    xyz = np.vstack(xyz)
+    c = np.sum(xyz, axis=0)
+    norm = np.sqrt(np.sum(c**2))
+    if norm == 0:
+        return None
+    c = c / norm
+    if np.min(xyz.dot(c)) <= 1e-9:
+        return None
+    return c
+
+def gnomonic(xyz, c):
+    """ Project the vectors *xyz* onto the plane tangent to the unit sphere at
+    *c*. Great circles project to straight lines, so planar segment and
+    crossing tests on the projected coordinates are exact for great circle
+    arcs. Vectors must lie in the hemisphere centred on *c*. Returns arrays of
+    plane coordinates (x, y). """
+    # orthonormal basis of the tangent plane
+    e = np.cross([0.0, 0.0, 1.0], c)
+    if np.sum(e**2) < 1e-24:
+        e = np.array([0.0, 1.0, 0.0])
+    e = e / np.sqrt(np.sum(e**2))
+    n = np.cross(c, e)
+    d = xyz.dot(c)
+    return xyz.dot(e) / d, xyz.dot(n) / d
+
+def inverse_gnomonic(x, y, c):
+    """ Return the unit vectors projected to (*x*, *y*) by `gnomonic`. """
+    e = np.cross([0.0, 0.0, 1.0], c)
+    if np.sum(e**2) < 1e-24:
+        e = np.array([0.0, 1.0, 0.0])
+    e = e / np.sqrt(np.sum(e**2))
+    n = np.cross(c, e)
+    xyz = c + np.asarray(x)[:,np.newaxis]*e + np.asarray(y)[:,np.newaxis]*n
+    return xyz / np.sqrt(np.sum(xyz**2, axis=1))[:,np.newaxis]
+
+def arc_intersections(a0, a1, b0=None, b1=None, closed=False,
+                      first_only=False, blocksize=2**20):
+    """ Find the intersections between the great circle arcs running from
+    *a0* to *a1* and the arcs running from *b0* to *b1*, where each argument
+    is an (n x 3) array of unit vectors. This handles arcs of any extent, but
+    tests all pairs of arcs with overlapping bounding caps, so
+    `sweep_intersections` on gnomonic coordinates is preferred where a
+    hemisphere holds every arc.
+
+    Arguments and return values are as for `sweep_intersections`, except
+    that intersections are returned as an (n x 3) array of unit vectors.
+    """
+    selfmode = b0 is None
+    if selfmode:
+        b0, b1 = a0, a1
+    n = len(a0)
+    ia_out, ib_out, p_out = [], [], []
+
+    def caps(p0, p1):
+        mid = p0 + p1
+        mid = mid / np.maximum(np.sqrt(np.sum(mid**2, axis=1)), 1e-300)[:,np.newaxis]
+        radius = 0.5 * np.arccos(np.clip(np.sum(p0*p1, axis=1), -1.0, 1.0))
+        return mid, radius, np.cross(p0, p1)
+
+    ma, ra, na = caps(a0, a1)
+    mb, rb, nb = caps(b0, b1)
+
+    rows = max(1, blocksize // max(len(b0), 1))
+    for i0 in range(0, n, rows):
+        sep = np.arccos(np.clip(ma[i0:i0+rows].dot(mb.T), -1.0, 1.0))
+        i, j = np.nonzero(sep <= ra[i0:i0+rows,np.newaxis] + rb + 1e-12)
+        i = i + i0
+        if selfmode:
+            keep = (j - i > 1)
+            if closed:
+                keep &= ~((i == 0) & (j == n-1))
+            i, j = i[keep], j[keep]
+
+        p = np.cross(na[i], nb[j])
+        norm = np.sqrt(np.sum(p**2, axis=1))
+        valid = norm > 1e-15
+        i, j, p = i[valid], j[valid], p[valid] / norm[valid][:,np.newaxis]
+
+        def on_arcs(p):
+            return ((np.sum(np.cross(a0[i], p) * na[i], axis=1) >= 0) &
+                    (np.sum(np.cross(p, a1[i]) * na[i], axis=1) >= 0) &
+                    (np.sum(np.cross(b0[j], p) * nb[j], axis=1) >= 0) &
+                    (np.sum(np.cross(p, b1[j]) * nb[j], axis=1) >= 0))
+
+        flip = ~on_arcs(p)
+        p[flip] = -p[flip]
+        hit = on_arcs(p)
+        if hit.any():
+            ia_out.append(i[hit])
+            ib_out.append(j[hit])
+            p_out.append(p[hit])
+            if first_only:
+                break
+
+    if len(ia_out) == 0:
+        empty = np.array([], dtype=int)
+        return empty, empty, np.zeros((0, 3))
+    ia = np.concatenate(ia_out)
+    ib = np.concatenate(ib_out)
+    p = np.vstack(p_out)
+    order = np.lexsort((ib, ia))
+    return ia[order], ib[order], p[order]
@@ -8,13 +8,17 @@ from __future__ import division
 import math
 import sys
 import itertools
+import functools
 import numpy as np
 from . import vtk
 from . import geojson
 from . import xyfile
 from . import shp
-from ..crs import Cartesian, SphericalEarth, CRSError
+from ..crs import Cartesian, SphericalEarth, GeographicalCRS, CRSError
+from ..crs import transform
+from .. import geodesy
 from .metadata import Metadata, Indexer
+from .quadtree import LinearQuadTree
 from . import _vectorgeo
 
 try:
@@ -23,6 +27,23 @@ except ImportError:
     sys.stderr.write("falling back on slow _vectorgeo")
     _vecgeo = _vectorgeo
 
+def _cached(func):
+    """ Decorator for methods without arguments whose result depends only on
+    the vertices of a geometry. The result is stored in the geometry's cache
+    until the cache is invalidated. """
+    name = func.__name__
+
+    @functools.wraps(func)
+    def wrapper(self):
+        try:
+            return self._cache[name]
+        except KeyError:
+            value = func(self)
+            self._cache[name] = value
+            return value
+    return wrapper
+
+
 class Geometry(object):
     """ This is the abstract base class for all geometry types """
     _geotype = None
@@ -30,6 +51,13 @@ class Geometry(object):
     def __init__(self, crs=Cartesian):
         self.properties = {}
         self._crs = crs
+        self._cache = {}
+        return
+
+    def _invalidate_cache(self):
+        """ Discard cached derived quantities. Must be called by any method
+        that modifies the vertices in place. """
+        self._cache.clear()
         return
 
     @staticmethod
@@ -52,7 +80,7 @@ class Geometry(object):
 
     @property
     def d(self):
-        return Indexer(self.data)
+        return Indexer(self.data, self)
 
     def add_property(self, name, value):
         """ Insert a property (name -> value) into the properties dict, raising
@@ -144,8 +172,7 @@ class Point(Geometry):
         if crs is None or crs==self._crs:
             return self.vertex
         else:
-            vg = self.crs.project(self.x, self.y, inverse=True)
-            return crs.project(*vg)
+            return transform(self._crs, crs, self.x, self.y)
 
     def coordsxy(self, convert_to=False):
         """ Returns the x,y coordinates. Convert_to may be set to 'deg'
@@ -256,10 +283,30 @@ class MultipointBase(Geometry):
                  **kwargs):
         """ Partial init function that establishes geometry rank and creates a
         metadata attribute.
+
+        Vertices are stored as an (n x rank) array. When *vertices* is already
+        a floating point array of that shape, it is used without copying.
         """
         super(MultipointBase, self).__init__(**kwargs)
-        vertices = list(vertices)
-        if len(vertices) > 0:
+        if not isinstance(vertices, np.ndarray):
+            vertices = list(vertices)
+
+        if isinstance(vertices, np.ndarray):
+
+            # Construct from an array of positions
+            if vertices.ndim != 2 or not 2 <= vertices.shape[1] <= 3:
+                raise GInitError("Input must be doubles or triples")
+            if not np.issubdtype(vertices.dtype, np.floating):
+                vertices = vertices.astype(np.float64)
+            self.vertices = vertices
+            self.rank = vertices.shape[1]
+
+            if data is None:
+                self.data = None
+            else:
+                self.data = Metadata(data)
+
+        elif len(vertices) > 0:
 
             def ispoint(a):
                 return getattr(a, "_geotype", None) == "Point"
@@ -280,7 +327,7 @@ class MultipointBase(Geometry):
                     if all(pt.data._fields == pts[0].data._fields for pt in pts[1:]):
                         if data is not None:
                             raise GInitError("Data kweyword disallowed when constructing from points")
-                        d = [pt.data._data[0] for pt in pts]
+                        d = [pt.data[0] for pt in pts]
                         self.data = Metadata(d, fields=pts[0].data.fields)
                     else:
                         raise GInitError("Point have inconsistent data attributes")
@@ -289,7 +336,8 @@ class MultipointBase(Geometry):
                 else:
                     self.data = None
 
-                self.vertices = [pt.vertex for pt in pts]
+                self.vertices = np.array([pt.vertex for pt in pts],
+                                         dtype=np.float64)
                 self.rank = rank
                 self._crs = crs
 
@@ -301,10 +349,12 @@ class MultipointBase(Geometry):
 
                 if not 2 <= self.rank <= 3:
                     raise GInitError("Input must be doubles or triples")
-                if any(self.rank != len(v) for v in vertices):
+                try:
+                    self.vertices = np.array(vertices, dtype=np.float64)
+                except ValueError:
+                    raise GInitError("Input must have consistent rank")
+                if self.vertices.ndim != 2:
                     raise GInitError("Input must have consistent rank")
-
-                self.vertices = [tuple(v) for v in vertices]
 
                 if data is None:
                     self.data = None
@@ -313,7 +363,8 @@ class MultipointBase(Geometry):
 
         else:
             self.rank = None
-            self.vertices = []
+            self.vertices = np.empty((0, 2), dtype=np.float64)
+            self.data = None
 
         if hasattr(properties, "keys"):
             self.properties = properties
@@ -325,9 +376,10 @@ class MultipointBase(Geometry):
 
     def __repr__(self):
         if len(self) < 5:
-            ppverts = str(self.vertices)
+            ppverts = str(self.vertices.tolist())
         else:
-            ppverts = str(self.vertices[:2])[:-1] + "..." + str(self.vertices[-2:])[1:]
+            ppverts = str(self.vertices[:2].tolist())[:-1] + "..." + \
+                      str(self.vertices[-2:].tolist())[1:]
         return '{typ}({verts})>'.format(
                 typ=str(type(self))[:-1], verts=ppverts)
 
@@ -339,12 +391,12 @@ class MultipointBase(Geometry):
         if isinstance(key, (int, np.int64)):
             if self.data is not None:
                 d = Metadata([self.data[key]], fields=self.data._fields)
-            return Point(self.vertices[key], data=d, properties=self.properties,
-                         crs=self._crs)
+            return Point(tuple(self.vertices[key].tolist()), data=d,
+                         properties=self.properties, crs=self._crs)
         elif isinstance(key, slice):
             if self.data is not None:
-                d = Metadata(self.data[key], fields=self.data._fields)
-            return type(self)(self.vertices[key], data=d,
+                d = self.data[key].copy()
+            return type(self)(self.vertices[key].copy(), data=d,
                               properties=self.properties, crs=self._crs)
         else:
             raise GGeoError('Index must be an integer or a slice object')
@@ -352,33 +404,33 @@ class MultipointBase(Geometry):
     def __setitem__(self, key, value):
         if not isinstance(key, int):
             raise GGeoError('Indices must be integers')
-        try:
-            self.vertices[key] = value.vertex
-            if None not in (self.data, value.data):
-                self.data[key] = tuple(value.data[value.data._fields.index(f)] for f in self._fields)
-            elif self.data is not None:
-                self.data[key] = (None for i in range(len(self.data._fields)))
-
-        except AttributeError:
-            self.vertices[key] = value
-            if self.data is not None:
-                self.data[key] = (None for i in range(len(self.data._fields)))
 
         if getattr(value, "_geotype", None) == "Point":
+            if value.rank != self.rank:
+                raise GGeoError('Cannot insert Point with rank != '
+                                '{0}'.format(self.rank))
             self.vertices[key] = value.vertex
             if self.data is not None:
-                self.data[key] = value.data._data[0]
+                if value.data is not None:
+                    self.data[key] = value.data[0]
+                else:
+                    self.data[key] = tuple(None for f in self.data._fields)
         elif len(value) == self.rank:
             self.vertices[key] = value
+            if self.data is not None:
+                self.data[key] = tuple(None for f in self.data._fields)
         else:
             raise GGeoError('Cannot insert non-Pointlike value with '
                             'length != {0}'.format(self.rank))
+        self._invalidate_cache()
         return
 
     def __delitem__(self, key):
         if len(self) > key:
-            del self.vertices[key]
-            del self.data[key]
+            self.vertices = np.delete(self.vertices, key, axis=0)
+            self._invalidate_cache()
+            if self.data is not None:
+                del self.data[key]
         else:
             raise GGeoError('Index ({0}) exceeds length'
                             '({1})'.format(key, len(self)))
@@ -390,7 +442,8 @@ class MultipointBase(Geometry):
     def __eq__(self, other):
         try:
             return (self._geotype == other._geotype) and \
-                   (self.vertices == other.vertices) and \
+                   (self.vertices.shape == other.vertices.shape) and \
+                   np.all(self.vertices == other.vertices) and \
                    (self.data == other.data) and \
                    (self.properties == other.properties) and \
                    (self._crs == other._crs)
@@ -410,13 +463,15 @@ class MultipointBase(Geometry):
                 reg0[1] <= reg1[3] and reg1[1] <= reg0[3])
 
     @property
+    @_cached
     def bbox(self):
         """ Return the extents of a bounding box as
             (xmin, ymin, xmax, ymax)
         """
-        x, y = self.get_coordinate_lists()
-        bbox = (min(x), min(y), max(x), max(y))
-        return bbox
+        xy = self.vertices[:,:2]
+        xmin, ymin = xy.min(axis=0).tolist()
+        xmax, ymax = xy.max(axis=0).tolist()
+        return (xmin, ymin, xmax, ymax)
 
     @property
     def coordinates(self):
@@ -428,19 +483,26 @@ class MultipointBase(Geometry):
             print("{0}\t{1}".format(i, vertex))
 
     def get_vertices(self):
-        """ Return vertices as a list of tuples. """
-        return np.array(self.vertices)
+        """ Return a copy of the vertices as an (n x rank) array. """
+        return self.vertices.copy()
+
+    @_cached
+    def _cached_coordinate_tuples(self):
+        """ Return vertices as a list of tuples. The list is shared with the
+        cache, and must not be modified. """
+        return _as_tuples(self.vertices)
+
+    def _coordinate_tuples(self):
+        """ Return vertices as a new list of tuples. """
+        return list(self._cached_coordinate_tuples())
 
     def get_coordinate_lists(self, crs=None):
-        """ Return horizontal coordinate lists, optionally projected to *crs*.
+        """ Return horizontal coordinate arrays, optionally projected to *crs*.
         """
-        if self.rank == 2:
-            x, y = tuple(zip(*self.vertices))
-        else:
-            x, y, _ = tuple(zip(*self.vertices))
+        x = self.vertices[:,0]
+        y = self.vertices[:,1]
         if crs is not None and (crs != self._crs):
-            xg, yg = self.crs.project(x, y, inverse=True)
-            x, y = crs.project(xg, yg)
+            x, y = transform(self._crs, crs, x, y)
         return x, y
 
     def append(self, point):
@@ -448,7 +510,8 @@ class MultipointBase(Geometry):
         if self._crs != point._crs:
             raise crs.CRSError("CRS mismatch ({0} != {1})".format(self._crs, point._crs))
         if self.rank == point.rank:
-            self.vertices.append(point.vertex)
+            self.vertices = np.vstack([self.vertices, point.vertex])
+            self._invalidate_cache()
             if self.data is not None:
                 self.data.extend(point.data)
         else:
@@ -457,8 +520,14 @@ class MultipointBase(Geometry):
 
     def pop(self, index=-1):
         """ Removes a vertex from the register by index. """
-        pt = Point(self.vertices.pop(index), data=self.data[index])
-        del self.data[index]
+        vertex = tuple(self.vertices[index].tolist())
+        if self.data is not None:
+            pt = Point(vertex, data=self.data[index], crs=self._crs)
+            del self.data[index]
+        else:
+            pt = Point(vertex, crs=self._crs)
+        self.vertices = np.delete(self.vertices, index, axis=0)
+        self._invalidate_cache()
         return pt
 
     def shift(self, shift_vector):
@@ -467,52 +536,37 @@ class MultipointBase(Geometry):
         if len(shift_vector) != self.rank:
             raise GGeoError('Shift vector length must equal geometry rank.')
 
-        if self.rank == 2:
-            f = lambda pt: (pt[0] + shift_vector[0], pt[1] + shift_vector[1])
-        elif self.rank == 3:
-            f = lambda pt: (pt[0] + shift_vector[0], pt[1] + shift_vector[1],
-                            pt[2] + shift_vector[2])
-        self.vertices = list(map(f, self.vertices))
+        self.vertices = self.vertices + np.asarray(shift_vector, dtype=np.float64)
+        self._invalidate_cache()
         return self
 
-    def _matmult(self, A, x):
-        """ Return Ax=b """
-        b = []
-        for a in A:
-            b.append(sum([ai * xi for ai, xi in zip(a, x)]))
-        return b
-
     def rotate2d(self, thetad, origin=(0, 0)):
-        """ Rotate rank 2 Multipoint around *origin* counter-clockwise by
-        *thetad* degrees. """
-        # First, shift by the origin
-        self.shift([-a for a in origin])
-
-        # Multiply by a rotation matrix
+        """ Rotate Multipoint around *origin* counter-clockwise by *thetad*
+        degrees. Only the horizontal coordinates are modified. """
         theta = thetad / 180.0 * math.pi
-        R = ((math.cos(theta), -math.sin(theta)),
-             (math.sin(theta), math.cos(theta)))
-        rvertices = [self._matmult(R, x) for x in self.vertices]
-        self.vertices = rvertices
-
-        # Shift back
-        self.shift(origin)
+        R = np.array([[math.cos(theta), -math.sin(theta)],
+                      [math.sin(theta), math.cos(theta)]])
+        origin = np.asarray(origin[:2], dtype=np.float64)
+
+        vertices = self.vertices.copy()
+        vertices[:,:2] = np.dot(self.vertices[:,:2] - origin, R.T) + origin
+        self.vertices = vertices
+        self._invalidate_cache()
         return self
 
     def apply_affine_transform(self, M):
         """ Apply an affine transform given by matrix *M* to data and return a
         new geometry. """
-        vertices = []
-        for x,y in self.get_vertices():
-            vertices.append(tuple(np.dot(M, [x, y, 1])[:2]))
+        M = np.asarray(M, dtype=np.float64)
+        vertices = np.dot(self.vertices[:,:2], M[:2,:2].T) + M[:2,2]
         return type(self)(vertices, data=self.data, properties=self.properties,
                           crs=self._crs)
 
     def _subset(self, idxs):
         """ Return a subset defined by index in *idxs*. """
-        vertices = [self.vertices[i] for i in idxs]
+        vertices = self.vertices[np.asarray(idxs, dtype=int)]
         if self.data is not None:
-            data = Metadata([self.data[i] for i in idxs], fields=self.data._fields)
+            data = self.data[np.asarray(idxs, dtype=int)]
         else:
             data = None
         subset = type(self)(vertices, data=data, properties=self.properties,
@@ -521,44 +575,104 @@ class MultipointBase(Geometry):
 
     def flat_distances_to(self, pt):
         """ Return the "flat Earth" distance from each vertex to a point. """
-        A = np.array(self.vertices)
-        P = np.tile(np.array(pt.vertex), (A.shape[0], 1))
-        d = np.sqrt(np.sum((A-P)**2, 1))
+        d = np.sqrt(np.sum((self.vertices - np.asarray(pt.vertex))**2, axis=1))
         return d
 
     def distances_to(self, pt):
         """ Return the distance from each vertex to a point. """
-        d = [pt.distance(a) for a in self]
-        return np.array(d)
+        if self._crs != pt._crs:
+            raise CRSError("Points must share the same coordinate system.")
+        n = len(self)
+        x, y = self._crs.project(self.vertices[:,0], self.vertices[:,1],
+                                 inverse=True)
+        x0, y0 = self._crs.project(pt.x, pt.y, inverse=True)
+        _, _, d = self._crs.inverse(np.full(n, x0, dtype=np.float64),
+                                    np.full(n, y0, dtype=np.float64),
+                                    np.asarray(x), np.asarray(y),
+                                    radians=False)
+        d = np.asarray(d, dtype=np.float64)
+        if self.rank == 3 and pt.rank == 3:
+            d = np.sqrt(d**2 + (self.vertices[:,2] - pt.z)**2)
+        return d
+
+    def _geographical_vertices(self, other):
+        """ Return the geographical coordinates of the vertices of *self* and
+        *other* as (x, y, z) tuples, with z set only when both are 3D. """
+        if self._crs != other._crs:
+            raise CRSError("Geometries must share the same coordinate system.")
+        use_z = (self.rank == 3 and other.rank == 3)
+        out = []
+        for geom in (self, other):
+            x, y = geom._crs.project(geom.vertices[:,0], geom.vertices[:,1],
+                                     inverse=True)
+            z = geom.vertices[:,2] if use_z else None
+            out.append((x, y, z))
+        return out
+
+    def distance_matrix(self, other, maxbytes=2**26, threads=None):
+        """ Return an (n x m) array of the distances between the n vertices
+        of *self* and the m vertices of *other*, measured in the shared
+        coordinate system.
+
+        Rows are computed in chunks that use no more than about *maxbytes* of
+        temporary storage, optionally on a pool of *threads* threads.
+        """
+        (x1, y1, z1), (x2, y2, z2) = self._geographical_vertices(other)
+        return geodesy.distance_matrix(self._crs.inverse, x1, y1, x2, y2,
+                                       z1, z2, maxbytes=maxbytes,
+                                       threads=threads)
+
+    def nearest_distances(self, other, maxbytes=2**26, threads=None):
+        """ Return arrays of the distance from each vertex of *self* to the
+        nearest vertex of *other*, and the index of that vertex in *other*.
+        Arguments are as for `distance_matrix`, but the full matrix is not
+        stored. """
+        (x1, y1, z1), (x2, y2, z2) = self._geographical_vertices(other)
+        return geodesy.nearest_distances(self._crs.inverse, x1, y1, x2, y2,
+                                         z1, z2, maxbytes=maxbytes,
+                                         threads=threads)
+
+    def build_index(self, maxchildren=20):
+        """ Build a quadtree index of the vertices of a Cartesian geometry,
+        which `nearest_point_to` and `within_radius` then use. The index is
+        discarded when the vertices are modified. Returns the index, a
+        `LinearQuadTree`. """
+        if self._crs != Cartesian:
+            raise CRSError("Vertex indexes require a Cartesian CRS")
+        index = LinearQuadTree(self.vertices[:,:2], maxchildren=maxchildren)
+        self._cache["index"] = index
+        return index
+
+    def _planar_index(self, pt):
+        """ Return the vertex index if one has been built and applies to
+        queries with *pt*, or None. """
+        if self._crs == Cartesian and pt._crs == Cartesian:
+            return self._cache.get("index", None)
+        return None
 
     def nearest_point_to(self, pt):
         """ Returns the internal Point that is nearest to *pt*. If two points
-        are equidistant, only one will be returned.
+        are equidistant, only one will be returned. Returns None if the
+        Multipoint is empty.
         """
-        distances = self.distances_to(pt)
-        idx = np.argmin(distances)
-        return self[idx]
+        if len(self) == 0:
+            return None
+        index = self._planar_index(pt)
+        if index is not None and not (self.rank == 3 and pt.rank == 3):
+            idx = index.nearest(pt.vertex, k=1)[0]
+        else:
+            distances = self.distances_to(pt)
+            idx = np.argmin(distances)
+        return self[int(idx)]
 
     def get_extents(self):
         """ Calculate a bounding box. """
-        def gen_minmax(G):
-            """ Get the min/max from a single pass through a generator. """
-            mn = mx = next(G)
-            for x in G:
-                mn = min(mn, x)
-                mx = max(mx, x)
-            return mn, mx
-
-        xmn, xmx = gen_minmax(c[0] for c in self.vertices)
-        ymn, ymx = gen_minmax(c[1] for c in self.vertices)
+        xmn, ymn, xmx, ymx = self.bbox
         return xmn, xmx, ymn, ymx
 
     def any_within_poly(self, poly):
         """ Return whether any vertices are inside *poly* """
-        for pt in self:
-            if poly.contains(pt):
-                return True
-        return False
+        return bool(np.any(poly.contains_many(self)))
 
     def convex_hull(self):
         """ Return a Polygon representing the convex hull. Assumes that the CRS
@@ -615,7 +729,7 @@ class MultipointBase(Geometry):
 
         Additional kwargs are passed to `xyfile.write_xy`.
         """
-        xyfile.write_xy(self.get_vertices(), fnm, delimiter=delimiter, header=header)
+        xyfile.write_xy(self.vertices, fnm, delimiter=delimiter, header=header)
         return
 
     def as_geojson(self, **kwargs):
@@ -686,22 +800,29 @@ class Multipoint(MultipointBase):
 
     @property
     def __geo_interface__(self):
-        return {"type" : "MultiPoint", "bbox" : self.bbox, "coordinates" : self.vertices}
+        return {"type" : "MultiPoint", "bbox" : self.bbox,
+                "coordinates" : self._coordinate_tuples()}
 
     def within_radius(self, pt, radius):
         """ Return Multipoint of subset that is within *radius* of *pt*.
         """
-        distances = self.distances_to(pt)
-        indices = [i for i,d in enumerate(distances) if d <= radius]
+        index = self._planar_index(pt)
+        if index is not None:
+            # horizontal distance bounds the distance including z
+            indices = index.within_radius(pt.vertex, radius)
+            distances = self._subset(indices).distances_to(pt)
+            indices = indices[distances <= radius]
+        else:
+            distances = self.distances_to(pt)
+            indices = np.flatnonzero(distances <= radius)
         return self._subset(indices)
 
     def within_bbox(self, bbox):
         """ Return Multipoint subset that is within a square bounding box
         given by (xmin, xymin, xmax, ymax). """
-        filtbbox = lambda pt: (bbox[0] <= pt.vertex[0] <= bbox[2]) and \
-                              (bbox[1] <= pt.vertex[1] <= bbox[3])
-        indices = [i for (i, pt) in enumerate(self) if filtbbox(pt)]
-        return self._subset(indices)
+        x, y = self.vertices[:,0], self.vertices[:,1]
+        mask = (bbox[0] <= x) & (x <= bbox[2]) & (bbox[1] <= y) & (y <= bbox[3])
+        return self._subset(np.nonzero(mask)[0])
 
 
 class ConnectedMultipoint(MultipointBase):
@@ -710,44 +831,240 @@ class ConnectedMultipoint(MultipointBase):
     @property
     def length(self):
         """ Returns the length of the line/boundary. """
-        points = [Point(v, crs=self._crs) for v in self.vertices]
-        distances = [a.distance(b) for a, b in zip(points[:-1], points[1:])]
-        return sum(distances)
+        return float(np.sum(self._segment_lengths()))
+
+    @_cached
+    def _segment_lengths(self):
+        """ Return an array with the length of each segment, computed with a
+        single call to the CRS *inverse* method. As for `Point.distance`, a
+        third coordinate is assumed to be in the units of the horizontal
+        distance. """
+        start, end = self.segment_arrays
+        if len(start) == 0:
+            return np.zeros(0, dtype=np.float64)
+        x0, y0 = self._crs.project(start[:,0], start[:,1], inverse=True)
+        x1, y1 = self._crs.project(end[:,0], end[:,1], inverse=True)
+        _, _, dist = self._crs.inverse(np.asarray(x0), np.asarray(y0),
+                                       np.asarray(x1), np.asarray(y1),
+                                       radians=False)
+        dist = np.asarray(dist, dtype=np.float64)
+        if self.rank == 3:
+            dist = np.sqrt(dist**2 + (end[:,2] - start[:,2])**2)
+        return dist
+
+    @_cached
+    def _segment_geodesics(self):
+        """ Return arrays with the geographical coordinates of the start of
+        each segment, the azimuth from the start to the end of each segment,
+        and the horizontal length of each segment, computed with a single call
+        to the CRS *inverse* method. """
+        start, end = self.segment_arrays
+        x0, y0 = self._crs.project(start[:,0], start[:,1], inverse=True)
+        x1, y1 = self._crs.project(end[:,0], end[:,1], inverse=True)
+        x0, y0, x1, y1 = (np.asarray(a, dtype=np.float64)
+                          for a in (x0, y0, x1, y1))
+        az, _, dist = self._crs.inverse(x0, y0, x1, y1, radians=False)
+        return (x0, y0, np.asarray(az, dtype=np.float64),
+                np.asarray(dist, dtype=np.float64))
+
+    def _walk_segments(self, segs, fracs):
+        """ Return an array of vertices at fractions *fracs* of the way along
+        segments *segs*, following geodesics of the CRS. All vertices are
+        computed with a single call to the CRS *forward* method. A third
+        coordinate is interpolated linearly. """
+        segs = np.asarray(segs, dtype=np.int64)
+        fracs = np.asarray(fracs, dtype=np.float64)
+        x0, y0, az, dist = self._segment_geodesics()
+        xg, yg, _ = self._crs.forward(x0[segs], y0[segs], az[segs],
+                                      fracs*dist[segs], radians=False)
+        x, y = self._crs.project(xg, yg)
+        vertices = np.empty((len(segs), self.rank), dtype=np.float64)
+        vertices[:,0] = x
+        vertices[:,1] = y
+        if self.rank == 3:
+            start, end = self.segment_arrays
+            vertices[:,2] = start[segs,2] + fracs*(end[segs,2] - start[segs,2])
+        return vertices
+
+    def vertices_at(self, distances):
+        """ Return an (n x rank) array of the positions at *distances* along
+        the line/boundary, following geodesics of the CRS between vertices.
+        Distances are clipped to the length of the geometry. """
+        distances = np.asarray(distances, dtype=np.float64)
+        seglengths = self._segment_lengths()
+        if len(seglengths) == 0:
+            raise GGeoError("geometry has no segments")
+        cumlength = np.concatenate([[0.0], np.cumsum(seglengths)])
+        distances = np.clip(distances, 0.0, cumlength[-1])
+        segs = np.clip(np.searchsorted(cumlength, distances, side="right") - 1,
+                       0, len(seglengths)-1)
+        offsets = distances - cumlength[segs]
+        fracs = np.divide(offsets, seglengths[segs],
+                          out=np.zeros_like(offsets), where=(seglengths[segs] != 0))
+        return self._walk_segments(segs, np.minimum(fracs, 1.0))
+
+    def _densified_vertices(self, maxlength=None, n=None):
+        """ Return the vertices of the geometry with intermediate vertices
+        added along each segment (see `densify`). The end of the final
+        segment is not included. """
+        if (maxlength is None) == (n is None):
+            raise ValueError("exactly one of maxlength and n must be given")
+        seglengths = self._segment_lengths()
+        if n is None:
+            parts = np.maximum(np.ceil(seglengths / maxlength), 1).astype(np.int64)
+        else:
+            parts = np.full(len(seglengths), int(n), dtype=np.int64)
+        # each segment contributes its start and parts-1 intermediate vertices
+        segs, steps = _vectorgeo._expand_ranges(np.zeros_like(parts), parts)
+        vertices = self._walk_segments(segs, steps / parts[segs])
+        # keep the existing vertices exactly
+        start, _ = self.segment_arrays
+        vertices[steps == 0] = start
+        return vertices
+
+    def densify(self, maxlength=None, n=None):
+        """ Return a geometry of the same type with vertices added along
+        geodesics of the CRS, either so that no segment is longer than
+        *maxlength*, or by dividing every segment into *n* equal parts.
+        Existing vertices are retained. Intermediate vertices are computed in
+        a single batch, and the returned geometry has no vertex data. """
+        start, end = self.segment_arrays
+        if len(start) == 0:
+            return type(self)(self.vertices.copy(), properties=self.properties,
+                              crs=self._crs)
+        vertices = self._densified_vertices(maxlength=maxlength, n=n)
+        if isinstance(self, Line):
+            vertices = np.vstack([vertices, self.vertices[-1:]])
+        return type(self)(vertices, properties=self.properties, crs=self._crs)
 
     @property
     def segments(self):
-        """ Returns an generator of adjacent line segments. """
-        return (self._subset((i,i+1)) for i in range(len(self)-1))
+        """ Returns an generator of adjacent line segments as Segment
+        instances. """
+        start, end = self.segment_arrays
+        crs = self._crs
+        return (Segment(a, b, crs=crs) for a, b in zip(start, end))
+
+    @property
+    def segment_arrays(self):
+        """ Returns a pair of (n-1 x rank) arrays with the start and end
+        vertices of each segment. These are views into the vertex array, so
+        no copies are made. """
+        return self.vertices[:-1], self.vertices[1:]
 
     @property
     def segment_tuples(self):
         """ Returns an generator of adjacent line segments as coordinate tuples. """
-        return ((self.vertices[i], self.vertices[i+1])
-                for i in range(len(self.vertices)-1))
+        vertices = self._cached_coordinate_tuples()
+        return ((vertices[i], vertices[i+1]) for i in range(len(vertices)-1))
+
+    def _segment_endpoints(self):
+        """ Return arrays of the horizontal start and end positions of each
+        segment. """
+        start, end = self.segment_arrays
+        return start[:,:2], end[:,:2]
 
     def intersects(self, other):
-        """ Return whether an intersection exists with another geometry. """
-        interxbool = (np.nan in _vecgeo.intersection(a[0][0], a[1][0], b[0][0], b[1][0],
-                                                     a[0][1], a[1][1], b[0][1], b[1][1])
-                    for a in self.segments for b in other.segments)
-        if self._bbox_overlap(other) and (True not in interxbool):
-            return True
-        else:
+        """ Return whether an intersection exists with another geometry. In
+        geographical coordinate systems, segments are great circle arcs. """
+        if isinstance(self._crs, GeographicalCRS):
+            ia, _, _, _ = self._arc_intersections(other, first_only=True)
+            return len(ia) != 0
+        if not self._bbox_overlap(other):
             return False
+        a0, a1 = self._segment_endpoints()
+        b0, b1 = other._segment_endpoints()
+        ia, _, _, _ = _vectorgeo.sweep_intersections(a0, a1, b0, b1,
+                                                     first_only=True)
+        return len(ia) != 0
 
     def intersections(self, other, keep_duplicates=False):
-        """ Return the intersections with another geometry as a Multipoint. """
-        interx = (_vecgeo.intersection(a[0][0], a[1][0], b[0][0], b[1][0],
-                                          a[0][1], a[1][1], b[0][1], b[1][1])
-                     for a in self.segments for b in other.segments)
+        """ Return the intersections with another geometry as a Multipoint. In
+        geographical coordinate systems, segments are great circle arcs. """
+        if isinstance(self._crs, GeographicalCRS):
+            _, _, x, y = self._arc_intersections(other)
+            return self._intersection_multipoint(x, y, keep_duplicates)
+        a0, a1 = self._segment_endpoints()
+        b0, b1 = other._segment_endpoints()
+        _, _, x, y = _vectorgeo.sweep_intersections(a0, a1, b0, b1)
+        return self._intersection_multipoint(x, y, keep_duplicates)
+
+    def self_intersects(self):
+        """ Return whether any non-adjacent segments intersect. """
+        if isinstance(self._crs, GeographicalCRS):
+            ia, _, _, _ = self._arc_intersections(None, first_only=True)
+            return len(ia) != 0
+        a0, a1 = self._segment_endpoints()
+        ia, _, _, _ = _vectorgeo.sweep_intersections(a0, a1,
+                                closed=(self._geotype == "Polygon"),
+                                first_only=True)
+        return len(ia) != 0
+
+    def self_intersections(self, keep_duplicates=False):
+        """ Return the intersections between non-adjacent segments as a
+        Multipoint. """
+        if isinstance(self._crs, GeographicalCRS):
+            _, _, x, y = self._arc_intersections(None)
+            return self._intersection_multipoint(x, y, keep_duplicates)
+        a0, a1 = self._segment_endpoints()
+        _, _, x, y = _vectorgeo.sweep_intersections(a0, a1,
+                                closed=(self._geotype == "Polygon"))
+        return self._intersection_multipoint(x, y, keep_duplicates)
+
+    def _arc_intersections(self, other, first_only=False):
+        """ Return arrays of segment indices and of the longitudes and
+        latitudes of intersections between great circle segments of *self*
+        and *other*, or between non-adjacent segments of *self* if *other* is
+        None.
+
+        When every vertex lies within one hemisphere, segments are projected
+        gnomonically, which maps great circles to straight lines, and the
+        planar sweep is used. Otherwise, arcs are intersected directly as
+        unit vectors.
+        """
+        def arcs(geom):
+            a0, a1 = geom._segment_endpoints()
+            x0, y0 = geom._crs.project(a0[:,0], a0[:,1], inverse=True)
+            x1, y1 = geom._crs.project(a1[:,0], a1[:,1], inverse=True)
+            return (_vectorgeo.unit_vectors(x0, y0),
+                    _vectorgeo.unit_vectors(x1, y1), np.asarray(x0))
+
+        if other is not None and self._crs != other._crs:
+            raise CRSError("Geometries must share the same coordinate system.")
+        a0, a1, lon0 = arcs(self)
+        closed = (self._geotype == "Polygon")
+        if other is None:
+            b0, b1 = None, None
+            c = _vectorgeo.hemisphere_centre(a0, a1)
+        else:
+            b0, b1, _ = arcs(other)
+            c = _vectorgeo.hemisphere_centre(a0, a1, b0, b1)
+
+        if c is not None:
+            proj = lambda v: np.column_stack(_vectorgeo.gnomonic(v, c))
+            pb0 = None if b0 is None else proj(b0)
+            pb1 = None if b1 is None else proj(b1)
+            ia, ib, x, y = _vectorgeo.sweep_intersections(proj(a0), proj(a1),
+                                    pb0, pb1, closed=closed,
+                                    first_only=first_only)
+            xyz = _vectorgeo.inverse_gnomonic(x, y, c)
+        else:
+            ia, ib, xyz = _vectorgeo.arc_intersections(a0, a1, b0, b1,
+                                    closed=closed, first_only=first_only)
+
+        lons, lats = _vectorgeo.lonlat(xyz)
+        # keep longitudes in the convention of the segments
+        lons = lon0[ia] + np.mod(lons - lon0[ia] + 180.0, 360.0) - 180.0
+        x, y = self._crs.project(lons, lats)
+        return ia, ib, np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+
+    def _intersection_multipoint(self, x, y, keep_duplicates):
+        """ Return intersection coordinates as a Multipoint. """
+        vertices = list(zip(x.tolist(), y.tolist()))
         if not keep_duplicates:
-            interx = set(interx)
-        interx_points = []
-        for vertex in interx:
-            if np.nan not in vertex:
-                interx_points.append(Point(vertex, properties=self.properties,
-                                           crs=self._crs))
-        return Multipoint(interx_points)
+            seen = set()
+            vertices = [v for v in vertices if not (v in seen or seen.add(v))]
+        return Multipoint(vertices, crs=self._crs)
 
     def shortest_distance_to(self, pt):
         """ Return the shortest distance from any position on the Multipoint
@@ -801,9 +1118,27 @@ class ConnectedMultipoint(MultipointBase):
                 mindist = d
         return Point(minpt, crs=self._crs)
 
+    def _segment_distances_to(self, pt):
+        """ Return an array with the shortest distance from each segment to
+        *pt* (Point). """
+        start, end = self.segment_arrays
+        if self._crs == Cartesian and pt._crs == Cartesian:
+            p = np.asarray(pt.vertex[:2], dtype=np.float64)
+            a = start[:,:2]
+            v = end[:,:2] - a
+            vv = np.einsum("ij,ij->i", v, v)
+            t = np.einsum("ij,ij->i", p - a, v)
+            t = np.clip(np.divide(t, vv, out=np.zeros_like(t), where=vv!=0),
+                        0.0, 1.0)
+            nearest = a + t[:,np.newaxis] * v
+            return np.sqrt(np.sum((nearest - p)**2, axis=1))
+        else:
+            return np.array([seg.shortest_distance_to(pt)
+                             for seg in self.segments])
+
     def within_distance(self, pt, distance):
         """ Test whether a point is within *distance* of a ConnectedMultipoint. """
-        return all(distance >= seg.shortest_distance_to(pt) for seg in self.segments)
+        return bool(np.all(distance >= self._segment_distances_to(pt)))
 
 
 class Line(ConnectedMultipoint):
@@ -819,7 +1154,8 @@ class Line(ConnectedMultipoint):
 
     @property
     def __geo_interface__(self):
-        return {"type" : "LineString", "bbox" : self.bbox, "coordinates" : self.vertices}
+        return {"type" : "LineString", "bbox" : self.bbox,
+                "coordinates" : self._coordinate_tuples()}
 
     def extend(self, other):
         """ Combine two lines, provided that that the data formats are similar.
@@ -830,62 +1166,26 @@ class Line(ConnectedMultipoint):
             raise GGeoError("Geometry mismatch ({0} != {1})".format(self._geotype, other._geotype))
 
         if None not in (self.data, other.data):
-            self.data._data.extend(other.data._data)
+            self.data.extend(other.data)
         elif self.data == other.data:
             self.data = None
         else:
             raise GGeoError('Cannot add geometries with mismatched metadata')
-        self.vertices.extend(other.vertices)
+        self.vertices = np.vstack([self.vertices, other.vertices])
+        self._invalidate_cache()
         return self
 
     def cumlength(self):
-        """ Returns the cumulative length by vertex. """
-        d = [0.0]
-        pta = self[0]
-        for ptb in self[1:]:
-            d_ = pta.distance(ptb)
-            d.append(d_ + d[-1])
-            pta = ptb
-        return d
+        """ Returns the cumulative length by vertex as an array. """
+        return np.concatenate([[0.0], np.cumsum(self._segment_lengths())])
 
     def subsection(self, n):
         """ Return *n* equally spaced Point instances along line. """
-        segments = self.segments
-        Ltotal = self.cumlength()[-1]
-        step = Ltotal / float(n-1)
-        step_remaining = step
-
-        points = [self[0]]
-        x = 0.0
-        pos = self[0]
-        seg = next(segments)
-        seg_remaining = seg.displacement()
-
-        while x < Ltotal-1e-8:
-            direction = seg[0].azimuth(seg[1])
-
-            if step_remaining <= seg_remaining:
-                pos = pos.walk(step_remaining, direction)
-                x += step_remaining
-                seg_remaining -= step_remaining
-                step_remaining = step
-                points.append(pos)
-                seg.vertices[0] = pos.vertex
-
-            else:
-                pos = seg[1]
-                x += seg_remaining
-                step_remaining -= seg_remaining
-
-                seg = next(segments, seg)
-                seg_remaining = seg.displacement()
-                # except StopIteration as e:
-                #     if abs(Ltotal-x) > 1e-8:       # tolerance for endpoint
-                #         raise e
-
-        if len(points) == n-1:
-            points.append(seg[-1])
-        return points
+        distances = np.linspace(0.0, self.cumlength()[-1], n)
+        vertices = self.vertices_at(distances[1:-1])
+        points = [Point(v, properties=self.properties, crs=self._crs)
+                  for v in vertices]
+        return [self[0]] + points + [self[-1]]
 
     def displacement(self):
         """ Returns the distance between the first and last vertex. """
@@ -893,7 +1193,7 @@ class Line(ConnectedMultipoint):
 
     def to_polygon(self):
         """ Returns a polygon. """
-        return Polygon(self.vertices, data=self.data, properties=self.properties,
+        return Polygon(self.vertices.copy(), data=self.data, properties=self.properties,
                        crs=self._crs, copy_metadata=True)
 
     def to_shapefile(self, fstem):
@@ -921,7 +1221,6 @@ class Polygon(ConnectedMultipoint):
     subs = []
 
     def __init__(self, vertices, data=None, properties=None, subs=None, **kwargs):
-        vertices = list(vertices)
         ConnectedMultipoint.__init__(self, vertices, data=data,
                                      properties=properties, **kwargs)
         self.subs = subs if subs is not None else []
@@ -934,48 +1233,47 @@ class Polygon(ConnectedMultipoint):
                 if self.data is None:
                     d = None
                 else:
-                    d = self.data[key]
-                return Line(self.vertices[key], data=d,
+                    d = self.data[key].copy()
+                return Line(self.vertices[key].copy(), data=d,
                             properties=self.properties, crs=self._crs)
         return super(Polygon, self).__getitem__(key)
 
     @property
     def __geo_interface__(self):
-        coords = [self.vertices]
+        coords = [self._coordinate_tuples()]
         for geom in self.subs:
-            coords.append(geom.vertices)
+            coords.append(geom._coordinate_tuples())
         return {"type" : "Polygon", "bbox" : self.bbox, "coordinates" : coords}
 
     def _subset(self, idxs):
         """ Return a subset defined by index in *idxs*. """
-        vertices = [self.vertices[i] for i in idxs]
+        vertices = self.vertices[np.asarray(idxs, dtype=int)]
         if self.data is None:
             data = None
         else:
-            data = Metadata([self.data[i] for i in idxs], fields=self.data.fields)
+            data = self.data[np.asarray(idxs, dtype=int)]
         subset = Line(vertices, data=data, properties=self.properties,
                       crs=self._crs, copy_metadata=False)
         return subset
 
     def isclockwise(self):
         """ Return whether polygon winds clockwise around its interior. """
-        s = sum((seg[1][0] - seg[0][0]) * (seg[1][1] + seg[0][1])
-                for seg in self.segments)
+        start, end = self.segment_arrays
+        s = np.sum((end[:,0] - start[:,0]) * (end[:,1] + start[:,1]))
         return s > 0
 
     @property
-    def segments(self):
-        """ Returns an generator of adjacent line segments.
-        Unique to Polygon: appends a final segment to close the Polygon.
-        """
-        L = len(self.vertices)
-        return itertools.chain((self._subset((i,i+1)) for i in range(len(self)-1)),
-                               (self._subset((L-1,0)),))
+    def segment_arrays(self):
+        """ Returns a pair of (n x rank) arrays with the start and end vertices
+        of each segment. Unique to Polygon: includes a final segment to close
+        the Polygon. The start array is a view into the vertex array. """
+        return self.vertices, np.roll(self.vertices, -1, axis=0)
 
     @property
     def segment_tuples(self):
         """ Returns an generator of adjacent line segments as coordinate tuples. """
-        return ((self.vertices[i-1], self.vertices[i]) for i in range(len(self.vertices)))
+        vertices = self._cached_coordinate_tuples()
+        return ((vertices[i-1], vertices[i]) for i in range(len(vertices)))
 
     @property
     def length(self):
@@ -985,29 +1283,36 @@ class Polygon(ConnectedMultipoint):
     def perimeter(self):
         """ Return the perimeter of the polygon. If there are sub-polygons,
         their perimeters are added recursively. """
-        return sum(seg.length for seg in self.segments) + \
+        return float(np.sum(self._segment_lengths())) + \
                 sum([p.perimeter for p in self.subs])
 
     @property
     def area(self):
         """ Return the two-dimensional area of the polygon, excluding
-        sub-polygons. """
-        x, y = self.coordinates
-        x0 = np.min(x)
-        a = (0.5*(x[0] + x[-1]) - x0) * (y[0] - y[-1])
-        a += sum((0.5*(x[i+1]+x[i]) - x0) * (y[i+1] - y[i]) for i in range(len(x)-1))
-        return abs(a) - sum(map(lambda p: p.area, self.subs))
+        sub-polygons. In geographical coordinate systems, the area is measured
+        on the sphere or ellipsoid (see `polygon_areas`). """
+        return self._ring_area() - sum(map(lambda p: p.area, self.subs))
+
+    @_cached
+    def _ring_area(self):
+        """ Return the unsigned area enclosed by the vertices. """
+        return float(_ring_areas([self.vertices], self._crs)[0])
 
     @property
     def centroid(self):
         """ Return Polygon centroid as a Point, ignoring sub-polygons. """
+        return Point(self._centroid_coords(), properties=self.properties,
+                     crs=self.crs)
+
+    @_cached
+    def _centroid_coords(self):
         x, y = self.coordinates
-        A = 0.5 * sum(x[i]*y[i+1] - x[i+1]*y[i] for i in range(-1, len(self)-1))
-        cx = sum((x[i] + x[i+1]) * (x[i]*y[i+1] - x[i+1]*y[i])
-                    for i in range(-1, len(self)-1)) / (6*A)
-        cy = sum((y[i] + y[i+1]) * (x[i]*y[i+1] - x[i+1]*y[i])
-                    for i in range(-1, len(self)-1)) / (6*A)
-        return Point((cx, cy), properties=self.properties, crs=self.crs)
+        xn, yn = np.roll(x, -1), np.roll(y, -1)
+        cross = x*yn - xn*y
+        A = 0.5 * np.sum(cross)
+        cx = np.sum((x + xn) * cross) / (6*A)
+        cy = np.sum((y + yn) * cross) / (6*A)
+        return (float(cx), float(cy))
 
     @staticmethod
     def _signcross(a, b):
@@ -1021,6 +1326,9 @@ class Polygon(ConnectedMultipoint):
     def contains(self, pt):
         """ Returns True if pt is inside or on the boundary of the polygon, and
         False otherwise. Uses a crossing number scheme. """
+        if isinstance(self._crs, GeographicalCRS):
+            return bool(self.contains_many(np.array([pt[0]], dtype=np.float64),
+                                           np.array([pt[1]], dtype=np.float64))[0])
         cnt = 0
         x, y = pt[0], pt[1]
         for seg in self.segment_tuples:
@@ -1029,9 +1337,76 @@ class Polygon(ConnectedMultipoint):
                 cnt += 1
         return cnt % 2 == 1 and not any(p.contains(pt) for p in self.subs)
 
+    def contains_many(self, x, y=None, blocksize=2**20):
+        """ Returns a boolean array that is True where the points given by
+        coordinate arrays *x* and *y* are inside or on the boundary of the
+        polygon. A Multipoint may be passed in place of *x* and *y*.
+
+        Points are tested against all edges at once using a crossing number
+        scheme. *blocksize* bounds the number of point-edge pairs evaluated at
+        a time.
+
+        In geographical coordinate systems, edges are great circle arcs. The
+        polygon and points are projected gnomonically about the centre of the
+        polygon, which maps the edges to straight lines, so the polygon must
+        lie within a hemisphere.
+
+        *x* and *y* may have any broadcastable shapes, and the result has
+        their broadcast shape.
+        """
+        if y is None:
+            x, y = x.get_coordinate_lists(self._crs)
+        x, y = np.broadcast_arrays(np.asarray(x, dtype=np.float64),
+                                   np.asarray(y, dtype=np.float64))
+        shape = x.shape
+        x, y = x.ravel(), y.ravel()
+        inside = np.zeros(x.shape, dtype=bool)
+
+        if isinstance(self._crs, GeographicalCRS):
+            lons, lats = self._crs.project(self.vertices[:,0],
+                                           self.vertices[:,1], inverse=True)
+            v = _vectorgeo.unit_vectors(lons, lats)
+            c = _vectorgeo.hemisphere_centre(v)
+            if c is None:
+                raise GGeoError("Polygon must lie within a hemisphere")
+            px, py = self._crs.project(x.ravel(), y.ravel(), inverse=True)
+            p = _vectorgeo.unit_vectors(px, py)
+            # points in the far hemisphere are outside
+            front = np.flatnonzero(p.dot(c) > 0)
+            xt = np.full(x.size, np.inf)
+            yt = np.full(x.size, np.inf)
+            xt[front], yt[front] = _vectorgeo.gnomonic(p[front], c)
+            xt, yt = xt.reshape(x.shape), yt.reshape(x.shape)
+            b = np.column_stack(_vectorgeo.gnomonic(v, c))
+        else:
+            xt, yt = x, y
+            b = self.vertices[:,:2]
+
+        # Only points within the bounding box can be inside
+        xmin, ymin = b.min(axis=0)
+        xmax, ymax = b.max(axis=0)
+        candidates = np.nonzero((xmin <= xt) & (xt <= xmax) &
+                                (ymin <= yt) & (yt <= ymax))[0]
+        if len(candidates) == 0:
+            return inside.reshape(shape)
+
+        a = np.roll(b, 1, axis=0)
+        x0, x1, y0, y1 = a[:,0], b[:,0], a[:,1], b[:,1]
+
+        n = max(1, blocksize // len(b))
+        for i in range(0, len(candidates), n):
+            idx = candidates[i:i+n]
+            cnt = _vectorgeo.crossings_cn(xt[idx], yt[idx], x0, x1, y0, y1)
+            inside[idx] = (cnt % 2 == 1)
+
+        for p in self.subs:
+            inside[inside] = ~p.contains_many(x[inside], y[inside],
+                                              blocksize=blocksize)
+        return inside.reshape(shape)
+
     def to_line(self):
         """ Returns a self-closing polyline. Discards sub-polygons. """
-        v = self.vertices + self.vertices[0]
+        v = np.vstack([self.vertices, self.vertices[:1]])
         return Line(v, properties=self.properties, data=self.data,
                     crs=self.crs, copy_metadata=True)
 
@@ -1046,6 +1421,86 @@ class Polygon(ConnectedMultipoint):
         return
 
 
+class Segment(object):
+    """ Lightweight straight segment between two vertices, as yielded by
+    `ConnectedMultipoint.segments`.
+
+    *start*         Start vertex (sequence or array of length rank)
+    *end*           End vertex (sequence or array of length rank)
+    *crs*           Coordinate reference system instance [default CARTESIAN]
+    """
+    __slots__ = ("start", "end", "_crs")
+
+    def __init__(self, start, end, crs=Cartesian):
+        self.start = start
+        self.end = end
+        self._crs = crs
+        return
+
+    def __repr__(self):
+        return "Segment({0}, {1})".format(tuple(self.start), tuple(self.end))
+
+    def __len__(self):
+        return 2
+
+    def __getitem__(self, idx):
+        if idx in (0, -2):
+            v = self.start
+        elif idx in (1, -1):
+            v = self.end
+        else:
+            raise IndexError("segment index out of range")
+        return Point(tuple(v), crs=self._crs)
+
+    def __iter__(self):
+        yield self[0]
+        yield self[1]
+
+    @property
+    def crs(self):
+        return self._crs
+
+    @property
+    def vertices(self):
+        return np.vstack([self.start, self.end])
+
+    @property
+    def length(self):
+        """ Returns the length of the segment. As for `Point.distance`, a
+        third coordinate is assumed to be in the units of the horizontal
+        distance. """
+        a, b = self.start, self.end
+        (x0, x1), (y0, y1) = self._crs.project([a[0], b[0]], [a[1], b[1]],
+                                               inverse=True)
+        _, _, dist = self._crs.inverse(x0, y0, x1, y1, radians=False)
+        if len(a) == 3:
+            dist = math.sqrt(dist**2 + (b[2]-a[2])**2)
+        return dist
+
+    def displacement(self):
+        """ Returns the distance between the start and end vertex. """
+        return self.length
+
+    def azimuth(self):
+        """ Returns the azimuth from the start to the end vertex. """
+        return self[0].azimuth(self[1])
+
+    def shortest_distance_to(self, pt):
+        """ Return the shortest distance from any position on the segment to
+        *pt* (Point). """
+        ptvertex = pt.crs.project(*pt.vertex[:2], inverse=True)
+        (x0, x1), (y0, y1) = self._crs.project([self.start[0], self.end[0]],
+                                               [self.start[1], self.end[1]],
+                                               inverse=True)
+        if self._crs == Cartesian:
+            _, d = _vecgeo.pt_nearest_planar(tuple(ptvertex), (x0, y0), (x1, y1))
+        else:
+            _, d = _vecgeo.pt_nearest_proj(self._crs.forward, self._crs.inverse,
+                                           ptvertex, (x0, y0), (x1, y1),
+                                           tol=0.01)
+        return d
+
+
 class GeometryError(Exception):
     """ Base class for geometry module errors. """
     def __init__(self, message=''):
@@ -1072,6 +1527,61 @@ class GGeoError(GeometryError):
         self.message = message
 
 
+def _ring_areas(rings, crs):
+    """ Return the unsigned areas enclosed by each of a list of vertex arrays
+    in *crs*, computed in a single vectorized pass. """
+    if len(rings) == 0:
+        return np.zeros(0, dtype=np.float64)
+    starts = np.cumsum([0] + [len(r) for r in rings[:-1]])
+    vertices = np.vstack([r[:,:2] for r in rings])
+    x, y = vertices[:,0], vertices[:,1]
+
+    if isinstance(crs, GeographicalCRS):
+        lons, lats = np.radians(x), np.radians(y)
+        if hasattr(crs, "radius"):
+            return geodesy.sphere_ring_areas(lons, lats, starts, crs.radius)
+        return geodesy.ellipsoid_ring_areas(lons, lats, starts,
+                                            crs._geod.a, crs._geod.f)
+
+    # shoelace formula, offset by the minimum x of each ring for precision
+    nxt = geodesy._ring_next(starts, len(x))
+    prev = np.empty_like(nxt)
+    prev[nxt] = np.arange(len(x))
+    x0 = np.repeat(np.minimum.reduceat(x, starts),
+                   np.diff(np.append(starts, len(x))))
+    a = np.add.reduceat((0.5*(x + x[prev]) - x0) * (y - y[prev]), starts)
+    return np.abs(a)
+
+def polygon_areas(polygons):
+    """ Return an array with the area of each of a list of Polygons, excluding
+    sub-polygons, computed with a single vectorized pass over all of their
+    rings. Polygons must share a coordinate system. In geographical
+    coordinate systems, areas are computed on the sphere or ellipsoid directly
+    from longitude and latitude, without projecting. """
+    polygons = list(polygons)
+    if len(polygons) == 0:
+        return np.zeros(0, dtype=np.float64)
+    crs = polygons[0]._crs
+    if any(p._crs != crs for p in polygons[1:]):
+        raise CRSError("Polygons must share the same coordinate system.")
+
+    # sub-polygons at odd depths are subtracted and at even depths added
+    rings, owners, signs = [], [], []
+    stack = [(p, i, 1.0) for i, p in enumerate(polygons)]
+    while stack:
+        (poly, owner, sign) = stack.pop()
+        rings.append(poly.vertices)
+        owners.append(owner)
+        signs.append(sign)
+        stack.extend((sub, owner, -sign) for sub in poly.subs)
+
+    areas = _ring_areas(rings, crs) * np.array(signs)
+    return np.bincount(owners, weights=areas, minlength=len(polygons))
+
+def _as_tuples(vertices):
+    """ Return an array of vertices as a list of tuples. """
+    return [tuple(v) for v in vertices.tolist()]
+
 def points_to_multipoint(points):
     """ Merge *points* into a Multipoint instance. Point properties are stored
     as Multipoint data. All points must use the same CRS.
@@ -1099,9 +1609,9 @@ def affine_matrix(mpa, mpb):
     to Multipoint mpb using a least squares fit. """
     if len(mpa) != len(mpb):
         raise GeometryError("Input geometries must have identical length")
-    vecp = np.asarray(mpb.get_vertices()).ravel()
+    vecp = mpb.vertices.ravel()
     A = np.empty([2*len(mpa), 6], dtype=np.float64)
-    for i, (x, y) in enumerate(mpa.get_vertices()):
+    for i, (x, y) in enumerate(mpa.vertices):
         A[2*i:2*i+2,:] = np.kron(np.eye(2), [x, y, 1])
     M, res, rank, singvals = np.linalg.lstsq(A, vecp)
     return np.vstack([np.reshape(M, [2, 3]), np.atleast_2d([0, 0, 1])])
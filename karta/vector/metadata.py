@@ -1,14 +1,24 @@
 """ Metadata tables for vector data """
 
+import numbers
+import numpy as np
 from collections import Sequence
 
 class Metadata(Sequence):
+    """ Table of per-vertex attributes. Values are stored by column, with one
+    array per field. Fields in which every value is a bool, integer, or float
+    are stored in arrays of that type, and all other fields (e.g. strings, or
+    mixed types) in object arrays.
+
+    Values keep their type, so storing a value of another type in a typed
+    field (e.g. an int or None in a float field) converts that field to an
+    object array. """
 
     def __init__(self, data, fields=None, checktypes=False):
         """ Create a collection of metadata from *data*.
 
         *data* may be:
-        
+
             - a list with uniform type
             - a dictionary with equally-sized fields of uniform type.
             - a scalar
@@ -20,39 +30,59 @@ class Metadata(Sequence):
         If *checktypes* is True (default False), the values in *data* will be
         tested to ensure they are of constant type. In the usual case, this
         type-checking is foregone for speed.
+
+        Creating Metadata from another Metadata instance copies the
+        underlying arrays, keeping their types.
         """
-        if fields is None:
-            if hasattr(data, "_fields"):        # Data is Metadata-like
-                self._fields = data._fields
-                self._data = data._data
-            elif hasattr(data, "keys"):         # Data is dict-like
+        if hasattr(data, "_fields"):            # Data is Metadata-like
+            self._fields = data._fields
+            columns = [data.getcolumn(f).copy() for f in data._fields]
+            if fields is not None and tuple(fields) != self._fields:
+                raise ValueError("Length of data entries and fields don't match")
+            self._set_columns(columns, copy=False)
+        elif fields is None:
+            if hasattr(data, "keys"):           # Data is dict-like
                 self._fields = tuple(data.keys())
                 fst = data[self._fields[0]]
                 if hasattr(fst, "__iter__") and not isinstance(fst, str):   # Vector entries
-                    zipvalues = zip(*[data[f] for f in self._fields])
-                    self._data = [tuple(item) for item in zipvalues]
+                    columns = [data[f] for f in self._fields]
                 else:                           # Scalar entries
-                    self._data = [(data[f],) for f in self._fields]
+                    columns = [[data[f]] for f in self._fields]
             else:                               # Data is list or scalar
                 self._fields = ("value",)
                 if hasattr(data, "__iter__") and not isinstance(data, str):
-                    self._data = [(d,) for d in data]
+                    columns = [data]
                 else:
-                    self._data = [(data,)]
+                    columns = [[data]]
+            self._set_columns(columns)
         else:
-            if hasattr(data[0], "__len__") and not isinstance(data[0], str):
+            if len(data) != 0 and hasattr(data[0], "__len__") \
+                    and not isinstance(data[0], str):
                 if len(data[0]) != len(fields):
                     raise ValueError("Length of data entries and fields don't match")
             self._fields = tuple(fields)
-            self._data = data
+            if len(data) == 0:
+                columns = [[] for f in self._fields]
+            else:
+                columns = list(zip(*data))
+            self._set_columns(columns)
 
         if checktypes:
             self._validatetypes()
         return
 
+    def _set_columns(self, columns, copy=True):
+        """ Store a list of column sequences, one per field. """
+        self._columns = [_as_column(c, copy=copy) for c in columns]
+        lengths = set(len(c) for c in self._columns)
+        if len(lengths) > 1:
+            raise ValueError("fields have unequal lengths")
+        self._size = lengths.pop() if len(lengths) != 0 else 0
+        return
+
     def _validatetypes(self):
         for i,t in enumerate(self.types):
-            if not all(isinstance(t, d[i]) for d in self._data):
+            if not all(isinstance(v, t) for v in self.getfield(self._fields[i])):
                 raise TypeError("data contains item ({0}) not of type {1}" \
                                 .format(self._fields[i], t))
         return
@@ -61,30 +91,80 @@ class Metadata(Sequence):
         return "D[" + ", ".join(self._fields) + "]"
 
     def __eq__(self, other):
-        return (self._data == other._data) and (self._fields == other._fields)
+        if not hasattr(other, "_fields"):
+            return False
+        return (self._fields == other._fields) and (len(self) == len(other)) and \
+               all(_column_equal(self.getcolumn(f), other.getcolumn(f))
+                   for f in self._fields)
 
     def __neq__(self, other):
         return self != other
 
     def __getitem__(self, i):
-        return self._data[i]
+        """ Return a row as a tuple when *i* is an integer. When *i* is a
+        slice, return a Metadata instance that is a view into *self*, and when
+        *i* is an index sequence or boolean mask, return a Metadata instance
+        holding a copy of the selected rows. """
+        if isinstance(i, numbers.Integral):
+            i = self._rowindex(i)
+            return tuple(_py(c[i]) for c in self._columns)
+        else:
+            return self._take(i)
+
+    def _rowindex(self, i):
+        """ Return the non-negative position of row *i*. """
+        if not -self._size <= i < self._size:
+            raise IndexError("index {0} out of range".format(i))
+        return i if i >= 0 else i + self._size
+
+    def _take(self, key):
+        """ Return a new Metadata instance from the rows selected by *key*. """
+        md = Metadata.__new__(Metadata)
+        md._fields = self._fields
+        md._columns = [self.getcolumn(f)[key] for f in self._fields]
+        md._size = len(md._columns[0]) if len(md._columns) != 0 else 0
+        return md
 
     def __setitem__(self, i, val):
-        self._data[i] = val
+        """ Replace row *i* with the values in *val*. Fields that cannot hold
+        a value without changing its type become object arrays. """
+        if len(val) != len(self._fields):
+            raise ValueError("Length of data entries and fields don't match")
+        i = self._rowindex(i)
+        for j, v in enumerate(val):
+            column = self._columns[j]
+            if not _fits(column.dtype, v):
+                column = column.astype(object)
+                self._columns[j] = column
+            column[i] = v
         return
 
     def __delitem__(self, i):
-        del self._data[i]
+        self._columns = [np.delete(self.getcolumn(f), i)
+                         for f in self._fields]
+        self._size = len(self._columns[0]) if len(self._columns) != 0 else 0
+        return
 
     def __len__(self):
-        return len(self._data)
+        return self._size
+
+    def copy(self):
+        """ Return a Metadata instance with copies of the underlying arrays. """
+        md = self._take(slice(None))
+        md._columns = [c.copy() for c in md._columns]
+        return md
+
+    def __iter__(self):
+        columns = [self.getcolumn(f).tolist() for f in self._fields]
+        return (tuple(row) for row in zip(*columns))
 
     def __contains__(self, field):
         return field in self._fields
 
     @property
     def data(self):
-        return self._data
+        """ Return rows as a list of tuples. """
+        return list(self)
 
     @property
     def fields(self):
@@ -92,72 +172,220 @@ class Metadata(Sequence):
 
     @property
     def types(self):
-        return tuple(type(a) for a in self._data[0])
+        return tuple(type(a) for a in self[0])
 
     def get(self, i):
         """ Return a dictionary for a single entry """
-        d = self._data[i]
         if isinstance(i, slice):
-            r = {}
-            for j in range(len(self._fields)):
-                r[self._fields[j]] = [d_[j] for d_ in d]
-            return r
+            return dict((f, self.getcolumn(f)[i].tolist()) for f in self._fields)
         else:
-            return dict((self._fields[j], d[j]) for j in range(len(self._fields)))
+            return dict(zip(self._fields, self[i]))
 
-    def getfield(self, field):
-        """ Return list of data corresponding to *field* """
+    def getcolumn(self, field):
+        """ Return the array of data corresponding to *field*. The array is a
+        view, and is not copied. """
         if field in self._fields:
             i = self._fields.index(field)
-            return [d[i] for d in self._data]
+            return self._columns[i][:self._size]
         else:
             raise KeyError("'{0}' not a field".format(field))
 
+    def getfield(self, field):
+        """ Return list of data corresponding to *field* """
+        return self.getcolumn(field).tolist()
+
+    def isin(self, field, values):
+        """ Return a boolean array that is True where *field* takes one of
+        *values*. """
+        column = self.getcolumn(field)
+        values = list(values)
+        # values keep their own type, so that e.g. 1.5 does not match 1
+        query = _as_column(values, copy=False)
+        if column.dtype.kind in "bif" and query.dtype.kind in "bif":
+            return _isin(column, query)
+        elif column.dtype == object:
+            try:
+                return _isin(column, query.astype(object))
+            except TypeError:
+                # unorderable or mixed types
+                pass
+        return np.fromiter((v in values for v in column), dtype=bool,
+                           count=len(column))
+
+    def where(self, mask):
+        """ Return an array with the indices of rows selected by the boolean
+        array *mask*, as produced by comparisons on `getcolumn` or `isin`. """
+        mask = np.asarray(mask, dtype=bool)
+        if mask.shape != (self._size,):
+            raise ValueError("mask length must equal metadata length")
+        return np.flatnonzero(mask)
+
     def setfield(self, field, values):
         """ Modify or add a field with *values* """
         if len(values) != self.__len__():
             raise ValueError("mismatch between metadata length and field values")
+        column = _as_column(values)
         if field in self._fields:
-            idx = self._fields.index(field)
-            self._data = [tuplemut(row, v, idx) for row, v in zip(self._data, values)]
+            self._columns[self._fields.index(field)] = column
         else:
-            idx = len(self._fields)
-            self._fields = tupleinsert(self._fields, field, idx)
-            self._data = [tupleinsert(row, v, idx) for row, v in zip(self._data, values)]
+            self._fields = tupleinsert(self._fields, field, len(self._fields))
+            self._columns.append(column)
         return
 
     def extend(self, other):
         """ Extend Metadata from another Metadata instance. If *other* has
         field f in *self*, it is copied. Otherwise, the None is appended. """
         # TODO: appended None value should be approariate to the type of field f.
-        idxs_other = []
-        for f in self._fields:
+        n = len(other)
+        size = self._size + n
+        for j, f in enumerate(self._fields):
             if f in other._fields:
-                idxs_other.append(other._fields.index(f))
+                values = other.getcolumn(f)
             else:
-                idxs_other.append(None)
+                values = _as_column([None]*n)
+            self._columns[j] = _grow(self._columns[j], self._size, values)
+        self._size = size
+        return
+
+def _column_dtype(values):
+    """ Return the array type used to store *values*. """
+    types = set(map(type, values))
+    if len(types) == 0:
+        return np.dtype(object)
+    elif all(issubclass(t, (bool, np.bool_)) for t in types):
+        return np.dtype(bool)
+    elif all(issubclass(t, numbers.Integral) and not issubclass(t, bool)
+             for t in types):
+        return np.dtype(np.int64)
+    elif all(issubclass(t, (float, np.floating)) for t in types):
+        return np.dtype(np.float64)
+    else:
+        return np.dtype(object)
+
+def _as_column(values, copy=True):
+    """ Return *values* as a one-dimensional array for storage as a field. """
+    if isinstance(values, np.ndarray) and values.ndim == 1 and \
+            values.dtype.kind in "bif":
+        if values.dtype.kind == "i":
+            values = values.astype(np.int64, copy=copy)
+        elif values.dtype.kind == "f":
+            values = values.astype(np.float64, copy=copy)
+        elif copy:
+            values = values.copy()
+        return values
+    elif isinstance(values, np.ndarray) and values.ndim == 1 and \
+            values.dtype == object and not copy:
+        return values
+
+    values = list(values)
+    dtype = _column_dtype(values)
+    if dtype != object:
+        try:
+            return np.array(values, dtype=dtype)
+        except OverflowError:
+            dtype = np.dtype(object)
+    column = np.empty(len(values), dtype=object)
+    try:
+        column[:] = values
+    except ValueError:
+        # values are themselves sequences
+        for i, v in enumerate(values):
+            column[i] = v
+    return column
+
+def _fits(dtype, value):
+    """ Return whether *value* can be stored in an array of *dtype* without
+    changing its type. """
+    if dtype == object:
+        return True
+    return _column_dtype([value]) == dtype
+
+def _grow(column, size, values):
+    """ Write *values* after the first *size* entries of the array *column*,
+    reallocating with spare capacity when necessary. Returns the array, which
+    may be longer than the number of valid entries. """
+    n = size + len(values)
+    if column.dtype != values.dtype and len(values) != 0:
+        if size == 0:
+            dtype = values.dtype
+        else:
+            dtype = np.dtype(object)
+    else:
+        dtype = column.dtype
+    if len(column) < n or dtype != column.dtype or not column.flags.owndata:
+        capacity = max(n, 2*size)
+        new = np.empty(capacity, dtype=dtype)
+        new[:size] = column[:size]
+        column = new
+    if dtype == object and values.dtype != object:
+        values = values.astype(object)
+    column[size:n] = values
+    return column
+
+def _isin(a, b):
+    """ Return whether each element of *a* is in *b*. """
+    if hasattr(np, "isin"):
+        return np.isin(a, b)
+    # numpy < 1.13
+    return np.in1d(a, b)
 
-        for i in range(len(other)):
-            self._data.append(tuple([None if idxs_other[j] is None
-                                          else other._data[i][idxs_other[j]]
-                                          for j in range(len(self._fields))]))
+def _column_equal(a, b):
+    if a.dtype == object or b.dtype == object:
+        return a.tolist() == b.tolist()
+    return np.array_equal(a, b)
+
+def _py(value):
+    """ Convert numpy scalars to Python scalars. """
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
 
 class Indexer(object):
+    """ Attribute access for a geometry. Indexing with a field name returns
+    the field as a list, and with an integer returns a row as a dictionary.
+    Indexing with a boolean mask or an index array returns the matching subset
+    of the geometry. Masks can be constructed from the arrays returned by
+    `getcolumn` and `isin`:
+
+        >>> fast = mp.d[(mp.d.getcolumn("speed") > 30) &
+        ...             mp.d.isin("quality", (1, 2))]
+    """
 
-    def __init__(self, md):
+    def __init__(self, md, geom=None):
         if md is None:
             raise KeyError("cannot index data-less geometry")
         else:
             self.md = md
+            self.geom = geom
 
     def __getitem__(self, key):
         if isinstance(key, str):
             return self.md.getfield(key)
-        elif isinstance(key, int):
+        elif isinstance(key, numbers.Integral):
             return self.md.get(key)
+        elif isinstance(key, (np.ndarray, list)):
+            key = np.asarray(key)
+            if key.dtype == bool:
+                key = self.md.where(key)
+            if hasattr(self.geom, "_subset"):
+                return self.geom._subset(key)
+            return self.md[key]
         else:
             raise KeyError("invalid key type: {0}".format(type(key)))
 
+    def getcolumn(self, field):
+        """ Return the array of data corresponding to *field*. """
+        return self.md.getcolumn(field)
+
+    def isin(self, field, values):
+        """ Return a boolean array that is True where *field* takes one of
+        *values*. """
+        return self.md.isin(field, values)
+
+    def where(self, mask):
+        """ Return the indices selected by the boolean array *mask*. """
+        return self.md.where(mask)
+
 def tuplemut(tpl, val, idx):
     """ Return a tuple with *idx* changed to *val* """
     lst = list(tpl)
@@ -168,4 +396,3 @@ def tupleinsert(tpl, val, idx):
     """ Return a tuple with *val* inserted into position *idx* """
     lst = list(tpl[:idx]) + [val] + list(tpl[idx:])
     return tuple(lst)
-
@@ -1,5 +1,11 @@
 """ Implements a simple quadtree datastructure, with emphasis on performance. """
 
+import os
+import heapq
+import itertools
+import numpy as np
+from . import _vectorgeo
+
 try:
     from ._cvectorgeo import iswithin, hashpt
 except ImportError:
@@ -21,12 +27,18 @@ class QuadTree(object):
     -------------------
     maxchildren         <int> maximum number of points before a node is split
     maxdepth            <int> maximum tree depth
+    minchildren         <int> number of points at or below which the four
+                        leaves of a branch are merged back into a single leaf
+                        (default maxchildren // 2)
     """
 
-    def __init__(self, bbox, maxchildren=20, maxdepth=999):
+    def __init__(self, bbox, maxchildren=20, maxdepth=999, minchildren=None):
 
         self.maxchildren = maxchildren
         self.maxdepth = maxdepth
+        if minchildren is None:
+            minchildren = maxchildren // 2
+        self.minchildren = minchildren
         self.node = Node([], bbox, True)
         self.size = 0
 
@@ -37,6 +49,57 @@ class QuadTree(object):
         self.size += 1
         return d
 
+    def remove(self, pt):
+        """ Remove a point from the QuadTree. Branches left holding
+        *minchildren* points or fewer are coalesced into leaves. Raises
+        ValueError if the point is not present. """
+        (self.node, found) = removept(self.node, pt, self.minchildren)
+        if not found:
+            raise ValueError("{0} not in QuadTree".format(pt))
+        self.size -= 1
+        return
+
+    def move(self, old, new):
+        """ Replace the point *old* with *new*. The tree is only modified
+        below the smallest node that contains both positions, so that a small
+        displacement usually updates a single leaf in place. Raises ValueError
+        if *old* is not present. """
+        if not iswithin(self.node.bbox, new):
+            raise BBoxError
+
+        path = [self.node]
+        while not path[-1].leaf:
+            for child in path[-1].children:
+                if iswithin(child.bbox, old):
+                    path.append(child)
+                    break
+            else:
+                raise ValueError("{0} not in QuadTree".format(old))
+
+        leaf = path[-1]
+        if iswithin(leaf.bbox, new):
+            leaf.children[leaf.children.index(old)] = new
+            return
+
+        k = len(path) - 2
+        while not iswithin(path[k].bbox, new):
+            k -= 1
+        top = path[k]
+
+        i = top.children.index(path[k+1])
+        (child, found) = removept(path[k+1], old, self.minchildren)
+        if not found:
+            raise ValueError("{0} not in QuadTree".format(old))
+        top.children[i] = child
+
+        for (i, child) in enumerate(top.children):
+            if iswithin(child.bbox, new):
+                (child, _) = addpt(child, new, k+2, self.maxchildren,
+                                   self.maxdepth)
+                top.children[i] = child
+                break
+        return
+
     def querypt(self, pt, method="hash"):
         """ Test whether QuadTree contains a point. *method* may be "recursion"
         [default] or "hash". """
@@ -51,6 +114,15 @@ class QuadTree(object):
         """ Extract all points from a boundary box. """
         return getfrombbox(self.node, bbox)
 
+    def nearest(self, pt, k=1):
+        """ Return a list of the *k* points nearest to *pt*, ordered by
+        increasing distance. """
+        return nearest(self.node, pt, k)
+
+    def within_radius(self, pt, radius):
+        """ Return a list of the points within *radius* of *pt*. """
+        return within_radius(self.node, pt, radius)
+
 
 def addpt(node, pt, depth, maxchildren, maxdepth):
     """ Add *pt* to *node*. *depth* is the current level in the quadtree.
@@ -79,6 +151,38 @@ def addpt(node, pt, depth, maxchildren, maxdepth):
 
     return node, depth
 
+def removept(node, pt, minchildren):
+    """ Remove *pt* from *node*. Returns the updated node (which is a new leaf
+    if the branch was coalesced), as well as whether the point was found. """
+    if node.leaf:
+        try:
+            node.children.remove(pt)
+        except ValueError:
+            return node, False
+        return node, True
+
+    for (i,child) in enumerate(node.children):
+        if iswithin(child.bbox, pt):
+            (child, found) = removept(child, pt, minchildren)
+            node.children[i] = child
+            if found:
+                node = coalesce(node, minchildren)
+            return node, found
+    return node, False
+
+def coalesce(node, minchildren):
+    """ Return a leaf with the bbox of *node* holding the points of its
+    children if they are all leaves with no more than *minchildren* points
+    between them. Otherwise, return *node*. """
+    if not all(child.leaf for child in node.children):
+        return node
+    if sum(len(child.children) for child in node.children) > minchildren:
+        return node
+    pts = []
+    for child in node.children:
+        pts.extend(child.children)
+    return Node(pts, node.bbox, True)
+
 def mean(x):
     n = len(x)
     if n != 0:
@@ -123,6 +227,47 @@ def getfrombbox(parent, bbox):
                 pts.extend(getfrombbox(child, bbox))
         return pts
 
+def bbox_distance2(bbox, pt):
+    """ Return the squared distance from *pt* to the nearest position in
+    *bbox*. """
+    dx = max(bbox[0] - pt[0], 0.0, pt[0] - bbox[1])
+    dy = max(bbox[2] - pt[1], 0.0, pt[1] - bbox[3])
+    return dx*dx + dy*dy
+
+def nearest(parent, pt, k):
+    """ Return the *k* points in *parent* node nearest to *pt*, by best-first
+    traversal. Nodes and points are visited in order of increasing distance
+    from *pt*, so the first *k* points popped are the nearest. """
+    counter = itertools.count()
+    heap = [(bbox_distance2(parent.bbox, pt), next(counter), True, parent)]
+    found = []
+    while heap and len(found) < k:
+        (_, _, isnode, item) = heapq.heappop(heap)
+        if not isnode:
+            found.append(item)
+        elif item.leaf:
+            for childpt in item.children:
+                d2 = (childpt[0]-pt[0])**2 + (childpt[1]-pt[1])**2
+                heapq.heappush(heap, (d2, next(counter), False, childpt))
+        else:
+            for child in item.children:
+                heapq.heappush(heap, (bbox_distance2(child.bbox, pt),
+                                      next(counter), True, child))
+    return found
+
+def within_radius(parent, pt, radius):
+    """ Return all points in *parent* node within *radius* of *pt*. """
+    r2 = radius*radius
+    if parent.leaf:
+        return [childpt for childpt in parent.children
+                if (childpt[0]-pt[0])**2 + (childpt[1]-pt[1])**2 <= r2]
+    else:
+        pts = []
+        for child in parent.children:
+            if bbox_distance2(child.bbox, pt) <= r2:
+                pts.extend(within_radius(child, pt, radius))
+        return pts
+
 def querypt_recursion(parent, pt):
     """ Test whether a point exists at *pt* using recursion. """
     if parent.leaf:
@@ -144,6 +289,325 @@ def querypt_hash(parent, pt):
         else:
             parent = parent.children[quad]
 
+class LinearQuadTree(object):
+    """ Quadtree bulk-loaded from an array of points and stored as flat
+    arrays rather than as linked nodes.
+
+    Points are sorted by their Morton code (see `_vectorgeo.hashpt_many`), so
+    that every node covers a contiguous range of the sorted points. Node *i*
+    at depth *level[i]* has Morton prefix *prefix[i]* and holds the sorted
+    points in [*start[i]*, *stop[i]*). Internal nodes have four children,
+    stored consecutively from *child[i]*, and leaves have *child[i]* == -1.
+    Node 0 is the root.
+
+    Initialize with an (n x 2) array of *points*.
+
+    Optional parameters
+    -------------------
+    bbox                <tuple> (xmin, xmax, ymin, ymax) [default computed
+                        from *points*]
+    maxchildren         <int> maximum number of points before a node is split
+    maxdepth            <int> maximum tree depth (at most 31)
+
+    Queries return indices into *points*.
+    """
+
+    def __init__(self, points, bbox=None, maxchildren=20, maxdepth=24):
+        points = np.asarray(points, dtype=np.float64)
+        if points.ndim != 2 or points.shape[1] < 2:
+            raise ValueError("points must be an (n x 2) array")
+        x, y = points[:,0], points[:,1]
+
+        if bbox is None:
+            if len(points) == 0:
+                bbox = (0.0, 1.0, 0.0, 1.0)
+            else:
+                xmin, xmax, ymin, ymax = x.min(), x.max(), y.min(), y.max()
+                dx = max(xmax - xmin, 1.0) * 1e-9
+                dy = max(ymax - ymin, 1.0) * 1e-9
+                bbox = (xmin, xmax + dx, ymin, ymax + dy)
+        elif np.any((x < bbox[0]) | (x >= bbox[1]) |
+                    (y < bbox[2]) | (y >= bbox[3])):
+            raise BBoxError
+
+        self.bbox = tuple(float(a) for a in bbox)
+        self.maxchildren = maxchildren
+        self.maxdepth = maxdepth
+
+        codes = _vectorgeo.hashpt_many(self.bbox[0], self.bbox[1],
+                                       self.bbox[2], self.bbox[3],
+                                       x, y, maxdepth)
+        order = np.argsort(codes)
+        self.index = order
+        self.codes = codes[order]
+        self.x = x[order]
+        self.y = y[order]
+        self._build()
+        return
+
+    def __len__(self):
+        return len(self.codes)
+
+    def _build(self):
+        """ Construct the node arrays one level at a time. """
+        levels = [np.zeros(1, dtype=np.int64)]
+        prefixes = [np.zeros(1, dtype=np.uint64)]
+        starts = [np.zeros(1, dtype=np.int64)]
+        stops = [np.array([len(self.codes)], dtype=np.int64)]
+        children = []
+        nnodes = 1
+        level = 0
+
+        while True:
+            split = (stops[-1] - starts[-1] > self.maxchildren) & \
+                    (level < self.maxdepth)
+            child = np.full(len(split), -1, dtype=np.int64)
+            nsplit = np.count_nonzero(split)
+            child[split] = nnodes + 4*np.arange(nsplit)
+            children.append(child)
+            if nsplit == 0:
+                break
+
+            # children of each split node, in quadrant order
+            shift = np.uint64(2*(self.maxdepth - level - 1))
+            prefix = (prefixes[-1][split][:,np.newaxis] << np.uint64(2)) + \
+                     np.arange(4, dtype=np.uint64)
+            lo = np.searchsorted(self.codes, (prefix << shift).ravel())
+            bounds = np.hstack([lo.reshape(-1, 4),
+                                stops[-1][split][:,np.newaxis]])
+            level += 1
+            levels.append(np.full(4*nsplit, level, dtype=np.int64))
+            prefixes.append(prefix.ravel())
+            starts.append(bounds[:,:4].ravel())
+            stops.append(bounds[:,1:].ravel())
+            nnodes += 4*nsplit
+
+        self.level = np.concatenate(levels)
+        self.prefix = np.concatenate(prefixes)
+        self.start = np.concatenate(starts)
+        self.stop = np.concatenate(stops)
+        self.child = np.concatenate(children)
+        return
+
+    def tofile(self, f):
+        """ Write the tree to the file or filename *f*, in a flat binary
+        format that `read_linear_quadtree` can map into memory. """
+        if not hasattr(f, "write"):
+            with open(f, "wb") as fout:
+                return self.tofile(fout)
+
+        header = np.zeros(1, dtype=_HEADER_DTYPE)
+        header["magic"] = _MAGIC
+        header["version"] = _VERSION
+        header["npoints"] = len(self.codes)
+        header["nnodes"] = len(self.level)
+        header["bbox"] = self.bbox
+        header["maxchildren"] = self.maxchildren
+        header["maxdepth"] = self.maxdepth
+        f.write(header.tobytes())
+        for (name, dtype, _) in _FILE_ARRAYS:
+            f.write(np.ascontiguousarray(getattr(self, name), dtype=dtype).tobytes())
+        return
+
+    def node_bboxes(self, nodes):
+        """ Return arrays (xmin, xmax, ymin, ymax) of the extents of *nodes*. """
+        level = self.level[nodes]
+        ix, iy = _vectorgeo.unhash_many(self.prefix[nodes])
+        xmin, xmax, ymin, ymax = self.bbox
+        width = (xmax - xmin) / 2.0**level
+        height = (ymax - ymin) / 2.0**level
+        x0 = xmin + ix*width
+        y0 = ymin + iy*height
+        return x0, x0 + width, y0, y0 + height
+
+    def _candidates(self, bboxes):
+        """ Return arrays of query numbers and sorted point positions for
+        points that may fall within each of the (n x 4) *bboxes*. """
+        q = np.arange(len(bboxes))
+        nodes = np.zeros(len(bboxes), dtype=np.int64)
+        found_q = []
+        found_lo = []
+        found_hi = []
+        while len(nodes) != 0:
+            x0, x1, y0, y1 = self.node_bboxes(nodes)
+            # pad node extents so that rounding can't exclude points
+            padx = (x1 - x0) * 1e-6
+            pady = (y1 - y0) * 1e-6
+            x0, x1, y0, y1 = x0-padx, x1+padx, y0-pady, y1+pady
+
+            bb = bboxes[q]
+            overlap = (x0 < bb[:,1]) & (bb[:,0] < x1) & \
+                      (y0 < bb[:,3]) & (bb[:,2] < y1) & \
+                      (self.start[nodes] != self.stop[nodes])
+            inside = (bb[:,0] <= x0) & (x1 <= bb[:,1]) & \
+                     (bb[:,2] <= y0) & (y1 <= bb[:,3])
+            take = overlap & ((self.child[nodes] == -1) | inside)
+            descend = overlap & ~take
+
+            found_q.append(q[take])
+            found_lo.append(self.start[nodes[take]])
+            found_hi.append(self.stop[nodes[take]])
+
+            q = np.repeat(q[descend], 4)
+            nodes = (self.child[nodes[descend]][:,np.newaxis] +
+                     np.arange(4)).ravel()
+
+        ranges, pos = _vectorgeo._expand_ranges(np.concatenate(found_lo),
+                                                np.concatenate(found_hi))
+        return np.concatenate(found_q)[ranges], pos
+
+    def getfrombbox(self, bbox):
+        """ Return the indices of points within *bbox* (xmin, xmax, ymin,
+        ymax). *bbox* may also be an (n x 4) array, in which case a list of
+        index arrays is returned. """
+        bboxes = np.asarray(bbox, dtype=np.float64)
+        single = (bboxes.ndim == 1)
+        bboxes = np.atleast_2d(bboxes)
+
+        q, pos = self._candidates(bboxes)
+        x, y = self.x[pos], self.y[pos]
+        bb = bboxes[q]
+        mask = (bb[:,0] <= x) & (x < bb[:,1]) & (bb[:,2] <= y) & (y < bb[:,3])
+        results = _vectorgeo._group(q[mask], self.index[pos[mask]],
+                                    len(bboxes))
+        return results[0] if single else results
+
+    def querypt(self, pt):
+        """ Test whether the QuadTree contains a point. *pt* may also be an
+        (n x 2) array, in which case a boolean array is returned. """
+        pts = np.asarray(pt, dtype=np.float64)
+        single = (pts.ndim == 1)
+        pts = np.atleast_2d(pts)
+        x, y = pts[:,0], pts[:,1]
+        xmin, xmax, ymin, ymax = self.bbox
+        valid = np.flatnonzero((xmin <= x) & (x < xmax) & (ymin <= y) & (y < ymax))
+
+        codes = _vectorgeo.hashpt_many(xmin, xmax, ymin, ymax, x[valid],
+                                       y[valid], self.maxdepth)
+        lo = np.searchsorted(self.codes, codes, side="left")
+        hi = np.searchsorted(self.codes, codes, side="right")
+        ranges, pos = _vectorgeo._expand_ranges(lo, hi)
+        match = (self.x[pos] == x[valid][ranges]) & (self.y[pos] == y[valid][ranges])
+
+        found = np.zeros(len(pts), dtype=bool)
+        found[valid[ranges[match]]] = True
+        return bool(found[0]) if single else found
+
+    def nearest(self, pt, k=1):
+        """ Return the indices of the *k* points nearest to *pt*, ordered by
+        increasing distance.
+
+        Nodes are visited best-first, in order of their distance from *pt*,
+        and traversal stops once no remaining node can contain a point closer
+        than the current *k*th nearest.
+        """
+        x, y = float(pt[0]), float(pt[1])
+        bestd = np.empty(0, dtype=np.float64)
+        bestpos = np.empty(0, dtype=np.int64)
+        if k <= 0:
+            return self.index[bestpos]
+        counter = itertools.count()
+        heap = [(0.0, next(counter), 0)]
+        while heap:
+            (d2, _, node) = heapq.heappop(heap)
+            if len(bestd) == k and d2 > bestd[-1]:
+                break
+            if self.child[node] == -1:
+                pos = np.arange(self.start[node], self.stop[node])
+                dist2 = (self.x[pos] - x)**2 + (self.y[pos] - y)**2
+                bestd = np.concatenate([bestd, dist2])
+                bestpos = np.concatenate([bestpos, pos])
+                order = np.argsort(bestd, kind="mergesort")[:k]
+                bestd, bestpos = bestd[order], bestpos[order]
+            else:
+                children = self.child[node] + np.arange(4)
+                children = children[self.start[children] != self.stop[children]]
+                x0, x1, y0, y1 = self.node_bboxes(children)
+                dx = np.maximum(np.maximum(x0 - x, x - x1), 0.0)
+                dy = np.maximum(np.maximum(y0 - y, y - y1), 0.0)
+                for child, cd2 in zip(children.tolist(), (dx*dx + dy*dy).tolist()):
+                    heapq.heappush(heap, (cd2, next(counter), child))
+        return self.index[bestpos]
+
+    def within_radius(self, pt, radius):
+        """ Return the indices of points within *radius* of *pt*. *pt* may
+        also be an (n x 2) array, in which case a list of index arrays is
+        returned. """
+        pts = np.asarray(pt, dtype=np.float64)
+        single = (pts.ndim == 1)
+        pts = np.atleast_2d(pts)[:,:2]
+        # search bboxes are closed on the right, unlike getfrombbox
+        bboxes = np.column_stack([pts[:,0] - radius,
+                                  np.nextafter(pts[:,0] + radius, np.inf),
+                                  pts[:,1] - radius,
+                                  np.nextafter(pts[:,1] + radius, np.inf)])
+        q, pos = self._candidates(bboxes)
+        mask = (self.x[pos] - pts[q,0])**2 + (self.y[pos] - pts[q,1])**2 <= radius**2
+        results = _vectorgeo._group(q[mask], self.index[pos[mask]], len(pts))
+        return results[0] if single else results
+
+
+_MAGIC = b"KRTAQTRE"
+_VERSION = 1
+_HEADER_DTYPE = np.dtype([("magic", "S8"), ("version", "<i8"),
+                          ("npoints", "<i8"), ("nnodes", "<i8"),
+                          ("bbox", "<f8", (4,)), ("maxchildren", "<i8"),
+                          ("maxdepth", "<i8")])
+
+# arrays following the header, with their types and lengths
+_FILE_ARRAYS = (("index", "<i8", "npoints"),
+                ("codes", "<u8", "npoints"),
+                ("x", "<f8", "npoints"),
+                ("y", "<f8", "npoints"),
+                ("level", "<i8", "nnodes"),
+                ("prefix", "<u8", "nnodes"),
+                ("start", "<i8", "nnodes"),
+                ("stop", "<i8", "nnodes"),
+                ("child", "<i8", "nnodes"))
+
+def read_linear_quadtree(fnm, mmap=True):
+    """ Open a LinearQuadTree written by `LinearQuadTree.tofile`.
+
+    When *mmap* is True [default], the arrays of the tree are memory-mapped
+    read-only from the file rather than read, so that opening is immediate and
+    queries only page in the parts of the file that they touch. The file must
+    not be modified while the tree is in use. Node extents are recomputed from
+    the node prefixes, and so are not stored.
+    """
+    header = np.fromfile(fnm, dtype=_HEADER_DTYPE, count=1)
+    if len(header) != 1 or header["magic"][0] != _MAGIC:
+        raise QuadTreeFileError("{0} is not a quadtree file".format(fnm))
+    if header["version"][0] != _VERSION:
+        raise QuadTreeFileError("unsupported quadtree file version "
+                                "{0}".format(header["version"][0]))
+
+    tree = LinearQuadTree.__new__(LinearQuadTree)
+    tree.bbox = tuple(float(a) for a in header["bbox"][0])
+    tree.maxchildren = int(header["maxchildren"][0])
+    tree.maxdepth = int(header["maxdepth"][0])
+
+    sizes = [int(header[count][0]) for (_, _, count) in _FILE_ARRAYS]
+    nbytes = _HEADER_DTYPE.itemsize + sum(n * np.dtype(dtype).itemsize
+            for (n, (_, dtype, _)) in zip(sizes, _FILE_ARRAYS))
+    if os.path.getsize(fnm) < nbytes:
+        raise QuadTreeFileError("{0} is truncated".format(fnm))
+
+    offset = _HEADER_DTYPE.itemsize
+    for (n, (name, dtype, _)) in zip(sizes, _FILE_ARRAYS):
+        if mmap and n != 0:
+            arr = np.memmap(fnm, dtype=dtype, mode="r", offset=offset,
+                            shape=(n,)).view(np.ndarray)
+        else:
+            with open(fnm, "rb") as f:
+                f.seek(offset)
+                arr = np.fromfile(f, dtype=dtype, count=n)
+        setattr(tree, name, arr)
+        offset += n * np.dtype(dtype).itemsize
+    return tree
+
 class BBoxError(Exception):
     pass
 
+class QuadTreeFileError(Exception):
+    pass
+
@@ -0,0 +1,149 @@
+""" Implements an R-tree that indexes geometries by their bounding boxes. The
+tree is bulk-loaded with the Sort-Tile-Recursive (STR) algorithm. """
+
+import heapq
+import itertools
+import numpy as np
+from . import _vectorgeo
+
+class RTree(object):
+    """ Static R-tree over the bounding boxes of a list of geometries.
+
+    Initialize with a list of *geometries*, or with an (n x 4) array of
+    bounding boxes. Bounding boxes follow the geometry convention of (xmin,
+    ymin, xmax, ymax).
+
+    Optional parameters
+    -------------------
+    maxchildren         <int> maximum number of entries in a node
+
+    Each level is packed in a single pass: entries are sorted by the x
+    coordinate of their centres, divided into vertical slices, sorted within
+    the slices by the y coordinate of their centres, and grouped into nodes of
+    *maxchildren*. *levels[0]* holds the bounding boxes of the entries and
+    *levels[-1]* the bounding box of the root. The children of node *i* on
+    level *l* are nodes [*children[l][0][i]*, *children[l][1][i]*) on level
+    *l-1*.
+
+    Queries return indices into *geometries*.
+    """
+
+    def __init__(self, geometries, maxchildren=16):
+        if maxchildren < 2:
+            raise ValueError("maxchildren must be at least 2")
+        if isinstance(geometries, np.ndarray):
+            self.geometries = None
+            bboxes = geometries.astype(np.float64)
+        else:
+            self.geometries = list(geometries)
+            bboxes = np.array([_bbox(g) for g in self.geometries],
+                              dtype=np.float64).reshape(-1, 4)
+        if bboxes.ndim != 2 or bboxes.shape[1] != 4:
+            raise ValueError("bounding boxes must be an (n x 4) array")
+        self.maxchildren = maxchildren
+
+        order = _str_order(bboxes, maxchildren)
+        self.index = order
+        self.levels = [bboxes[order]]
+        self.children = [None]
+        while len(self.levels[-1]) > 1:
+            bb = self.levels[-1]
+            start = np.arange(0, len(bb), maxchildren)
+            stop = np.minimum(start + maxchildren, len(bb))
+            parents = np.column_stack([np.minimum.reduceat(bb[:,0], start),
+                                       np.minimum.reduceat(bb[:,1], start),
+                                       np.maximum.reduceat(bb[:,2], start),
+                                       np.maximum.reduceat(bb[:,3], start)])
+            order = _str_order(parents, maxchildren)
+            self.levels.append(parents[order])
+            self.children.append((start[order], stop[order]))
+        return
+
+    def __len__(self):
+        return len(self.index)
+
+    def getfrombbox(self, bbox):
+        """ Return the indices of entries with bounding boxes that intersect
+        *bbox* (xmin, ymin, xmax, ymax). *bbox* may also be an (n x 4) array,
+        in which case a list of index arrays is returned. """
+        bboxes = np.asarray(bbox, dtype=np.float64)
+        single = (bboxes.ndim == 1)
+        bboxes = np.atleast_2d(bboxes)
+
+        nroot = len(self.levels[-1])
+        q = np.repeat(np.arange(len(bboxes)), nroot)
+        nodes = np.tile(np.arange(nroot), len(bboxes))
+        for level in range(len(self.levels)-1, -1, -1):
+            bb = self.levels[level][nodes]
+            qb = bboxes[q]
+            hit = (bb[:,0] <= qb[:,2]) & (qb[:,0] <= bb[:,2]) & \
+                  (bb[:,1] <= qb[:,3]) & (qb[:,1] <= bb[:,3])
+            q, nodes = q[hit], nodes[hit]
+            if level != 0:
+                start, stop = self.children[level]
+                ranges, nodes = _vectorgeo._expand_ranges(start[nodes],
+                                                          stop[nodes])
+                q = q[ranges]
+
+        results = _vectorgeo._group(q, self.index[nodes], len(bboxes))
+        return results[0] if single else results
+
+    def getfrompoint(self, pt):
+        """ Return the indices of entries with bounding boxes that contain
+        *pt*. *pt* may also be an (n x 2) array, in which case a list of index
+        arrays is returned. """
+        pts = np.asarray(pt, dtype=np.float64)
+        if pts.ndim == 1:
+            return self.getfrombbox(np.hstack([pts[:2], pts[:2]]))
+        return self.getfrombbox(np.hstack([pts[:,:2], pts[:,:2]]))
+
+    def nearest(self, pt, k=1):
+        """ Return the indices of the *k* entries with bounding boxes nearest
+        to *pt*, ordered by increasing distance. Entries with bounding boxes
+        that contain *pt* are at distance zero. """
+        x, y = float(pt[0]), float(pt[1])
+        counter = itertools.count()
+        top = len(self.levels) - 1
+        heap = [(d2, next(counter), top, i) for i, d2 in
+                enumerate(_bbox_distance2(self.levels[top], x, y).tolist())]
+        heapq.heapify(heap)
+        found = []
+        while heap and len(found) < k:
+            (_, _, level, node) = heapq.heappop(heap)
+            if level == 0:
+                found.append(node)
+            else:
+                start, stop = self.children[level]
+                children = np.arange(start[node], stop[node])
+                d2 = _bbox_distance2(self.levels[level-1][children], x, y)
+                for child, cd2 in zip(children.tolist(), d2.tolist()):
+                    heapq.heappush(heap, (cd2, next(counter), level-1, child))
+        return self.index[np.array(found, dtype=np.int64)]
+
+def _bbox(geom):
+    """ Return the bounding box of a geometry, including Points. """
+    bbox = getattr(geom, "bbox", None)
+    if bbox is None:
+        x, y = geom.vertex[0], geom.vertex[1]
+        bbox = (x, y, x, y)
+    return bbox
+
+def _str_order(bboxes, maxchildren):
+    """ Return the order in which Sort-Tile-Recursive packing places
+    *bboxes*. """
+    n = len(bboxes)
+    nnodes = -(-n // maxchildren)
+    nslices = int(np.ceil(np.sqrt(nnodes)))
+    cx = 0.5 * (bboxes[:,0] + bboxes[:,2])
+    cy = 0.5 * (bboxes[:,1] + bboxes[:,3])
+    slices = np.empty(n, dtype=np.int64)
+    slices[np.argsort(cx, kind="mergesort")] = \
+            np.arange(n) // max(nslices*maxchildren, 1)
+    return np.lexsort((cy, slices))
+
+def _bbox_distance2(bboxes, x, y):
+    """ Return the squared distances from (*x*, *y*) to an array of
+    *bboxes*. """
+    dx = np.maximum(np.maximum(bboxes[:,0] - x, x - bboxes[:,2]), 0.0)
+    dy = np.maximum(np.maximum(bboxes[:,1] - y, y - bboxes[:,3]), 0.0)
+    return dx*dx + dy*dy
@@ -91,28 +91,28 @@ def write_multipoint3(mp, fstem):
 
 def write_line2(line, fstem):
     w = shapefile.Writer(shapeType=shapefile.POLYLINE)
-    w.poly(shapeType=shapefile.POLYLINE, parts=[line.vertices])
+    w.poly(shapeType=shapefile.POLYLINE, parts=[line.vertices.tolist()])
     addfields(w, line.properties)
     w.save(fstem)
     return
 
 def write_line3(line, fstem):
     w = shapefile.Writer(shapeType=shapefile.POLYLINEZ)
-    w.poly(shapeType=shapefile.POLYLINEZ, parts=[line.vertices])
+    w.poly(shapeType=shapefile.POLYLINEZ, parts=[line.vertices.tolist()])
     addfields(w, line.properties)
     w.save(fstem)
     return
 
 def write_poly2(poly, fstem):
     w = shapefile.Writer(shapeType=shapefile.POLYGON)
-    w.poly(shapeType=shapefile.POLYGON, parts=[poly.vertices])
+    w.poly(shapeType=shapefile.POLYGON, parts=[poly.vertices.tolist()])
     addfields(w, poly.properties)
     w.save(fstem)
     return
 
 def write_poly3(poly, fstem):
     w = shapefile.Writer(shapeType=shapefile.POLYGONZ)
-    w.poly(shapeType=shapefile.POLYGONZ, parts=[poly.vertices])
+    w.poly(shapeType=shapefile.POLYGONZ, parts=[poly.vertices.tolist()])
     addfields(w, poly.properties)
     w.save(fstem)
     return
@@ -196,7 +196,7 @@ def write_shapefile(features, fstem):
 
         # add geometry
         for feature in features:
-            w.poly([feature.vertices])
+            w.poly([feature.vertices.tolist()])
 
         # add records
         w.field("ID", "I", "8")
@@ -3,6 +3,7 @@ Variogram estimation and modelling functions
 """
 
 import numpy as np
+from .. import geodesy
 try:
     from scipy.spatial.distance import pdist
     from scipy.optimize import minimize
@@ -100,13 +101,9 @@ def estimate_vario(mp, npoints=2000, max_dist=None, interval=None):
         import pyproj
         warnings.warn("For improved performance, consider projecting data to an "
                       "approximately equidistant reference system first.")
-        geod = pyproj.Geod(ellps="WGS84")
-        def distfunc(a, b):
-            return geod.inv(a[0], a[1], b[0], b[1])[2]
+        dist = geodesic_pdist(verts, pyproj.Geod(ellps="WGS84"))
     else:
-        distfunc = "euclidean"
-
-    dist = pdist(verts, distfunc)
+        dist = pdist(verts, "euclidean")
     I, J = ppairs(z)
     diff = z[I] - z[J]
 
@@ -127,6 +124,22 @@ def estimate_vario(mp, npoints=2000, max_dist=None, interval=None):
         sigma_variance[i] = 0.5 * np.nanstd(diff[band])**2
     return lags, sigma_variance
 
+def geodesic_pdist(verts, geod):
+    """ Return the condensed matrix of ellipsoidal distances between the
+    longitude-latitude pairs in *verts*, ordered like `pdist`. Distances are
+    computed in one vectorized call, with pairs that fail to converge (nearly
+    antipodal points) recomputed by the pyproj.Geod instance *geod*. """
+    I, J = np.triu_indices(len(verts), k=1)
+    lons, lats = np.radians(verts[:,0]), np.radians(verts[:,1])
+    _, _, dist, converged = geodesy.ellipsoid_inverse(lons[I], lats[I],
+                                                      lons[J], lats[J],
+                                                      geod.a, geod.f)
+    if not np.all(converged):
+        idx = ~converged
+        dist[idx] = geod.inv(verts[I[idx],0], verts[I[idx],1],
+                             verts[J[idx],0], verts[J[idx],1])[2]
+    return dist
+
 def ppairs(A):
     """ For data *A*, return the pairwise differences.
     """
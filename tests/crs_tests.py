@@ -1,7 +1,9 @@
 
 import unittest
 import math
+import numpy as np
 import karta.crs as crs
+import karta.geodesy as geodesy
 
 class TestCRS(unittest.TestCase):
 
@@ -80,6 +82,31 @@ class TestCRS(unittest.TestCase):
         self.assertAlmostEqual(baz, 108.48895148, places=4)
         return
 
+    def test_SphericalForward_array(self):
+        lons = np.array([0.0, 30.0, -120.0, -120.0])
+        lats = np.array([0.0, 0.0, 49.0, 49.0])
+        az = np.array([90.0, 90.0, 310.0, 10.0])
+        dist = np.array([5003778.767588614, 5003778.767588614, 2000e3, 150e3])
+        lons2, lats2, baz = crs.SphericalEarth.forward(lons, lats, az, dist)
+        for i in range(len(lons)):
+            lon2_, lat2_, baz_ = crs.SphericalEarth.forward(lons[i], lats[i],
+                                                            az[i], dist[i])
+            self.assertAlmostEqual(lons2[i], lon2_, places=10)
+            self.assertAlmostEqual(lats2[i], lat2_, places=10)
+            self.assertAlmostEqual(baz[i], baz_, places=10)
+        self.assertAlmostEqual(lons2[2], -146.5118, places=4)
+        self.assertRaises(ValueError, crs.SphericalEarth.forward,
+                          lons, lats, az - 100.0, dist)
+        return
+
+    def test_CartesianForward_array(self):
+        x2, y2, baz = crs.Cartesian.forward([0.0, 1.0], [0.0, 1.0],
+                                            [0.0, 90.0], 5.0)
+        self.assertTrue(np.allclose(x2, [0.0, 6.0]))
+        self.assertTrue(np.allclose(y2, [5.0, 1.0]))
+        self.assertTrue(np.allclose(baz, [180.0, 270.0]))
+        return
+
     def test_SphericalInverse1(self):
         lon1 = 0.0
         lat1 = 0.0
@@ -113,6 +140,141 @@ class TestCRS(unittest.TestCase):
         self.assertAlmostEqual(dist, 2533572.0748, places=2)
         return
 
+    def test_CartesianInverse_array(self):
+        x1 = [0.0, 1.0, 2.0, 2.0, -3.0]
+        y1 = [0.0, 1.0, -1.0, 5.0, 2.0]
+        x2 = [3.0, 1.0, 2.0, -4.0, -3.0]
+        y2 = [4.0, -1.0, -1.0, 1.0, 7.0]
+        az, baz, d = crs.Cartesian.inverse(np.array(x1), np.array(y1),
+                                           np.array(x2), np.array(y2))
+        # coincident points have an azimuth of 180 degrees, as in the scalar
+        # implementation
+        az_ = [36.86989764584402, 180.0, 180.0, 236.30993247402023, 0.0]
+        baz_ = [216.86989764584402, 0.0, 0.0, 56.30993247402023, 180.0]
+        d_ = [5.0, 2.0, 0.0, 7.211102550927978, 5.0]
+        for i in range(len(x1)):
+            self.assertAlmostEqual(az[i], az_[i], places=12)
+            self.assertAlmostEqual(baz[i], baz_[i], places=12)
+            self.assertAlmostEqual(d[i], d_[i], places=12)
+            az1, baz1, d1 = crs.Cartesian.inverse(x1[i], y1[i], x2[i], y2[i])
+            self.assertAlmostEqual(az1, az_[i], places=12)
+        return
+
+    def test_SphericalInverse_array(self):
+        lons1 = np.array([0.0, 32.0, 32.0, 170.0, -20.0, 10.0])
+        lats1 = np.array([0.0, -17.0, 5.0, 60.0, 10.0, 20.0])
+        lons2 = np.array([-45.0, 38.0, 38.0, -175.0, -20.00001, 10.0])
+        lats2 = np.array([0.0, 5.0, -17.0, 62.0, 10.0, 20.0])
+        az, baz, dist = crs.SphericalEarth.inverse(lons1, lats1, lons2, lats2)
+        # the fifth pair is a short step west, which leaves on a great circle
+        # bearing slightly north of west, and coincident points have an
+        # azimuth of 90 degrees, as in the scalar implementation
+        az_ = [270.0, 15.5977408185, 165.0417463964, 68.1376792981,
+               270.0000008697, 90.0]
+        baz_ = [90.0, 194.9582536036, 344.4022591815, 261.2765526194,
+                89.9999991303, 90.0]
+        dist_ = [5003778.7676, 2533572.0748, 2533572.0748, 836519.9187,
+                 1.0951, 0.0]
+        for i in range(len(lons1)):
+            self.assertAlmostEqual(az[i], az_[i], places=8)
+            self.assertAlmostEqual(baz[i], baz_[i], places=8)
+            self.assertAlmostEqual(dist[i], dist_[i], places=4)
+            az1, baz1, dist1 = crs.SphericalEarth.inverse(lons1[i], lats1[i],
+                                                          lons2[i], lats2[i])
+            self.assertAlmostEqual(az1, az_[i], places=8)
+        return
+
+    def test_ellipsoid_inverse(self):
+        geod = crs.LonLatWGS84._geod
+        lons1 = np.array([0.0, 32.0, -120.0, 170.0, 10.0, 0.0])
+        lats1 = np.array([0.0, -17.0, 49.0, 60.0, 0.0, 45.0])
+        lons2 = np.array([10.0, 38.0, -120.0, -175.0, 10.0, 179.5])
+        lats2 = np.array([10.0, 5.0, 50.0, 62.0, 1e-7, -44.8])
+        az, az2, dist, converged = geodesy.ellipsoid_inverse(
+                np.radians(lons1), np.radians(lats1),
+                np.radians(lons2), np.radians(lats2), geod.a, geod.f)
+        self.assertTrue(np.all(converged))
+        az_, baz_, dist_ = geod.inv(lons1, lats1, lons2, lats2)
+        self.assertTrue(np.allclose(dist, dist_, rtol=0, atol=1e-3))
+        self.assertTrue(np.allclose(np.degrees(az), az_, atol=1e-8))
+        return
+
+    def test_ellipsoid_forward(self):
+        geod = crs.LonLatWGS84._geod
+        lons = np.array([0.0, 32.0, -120.0, 170.0])
+        lats = np.array([0.0, -17.0, 49.0, 60.0])
+        az = np.array([45.0, 15.0, -50.0, 170.0])
+        dist = np.array([1565109.0, 2533572.0, 2000e3, 15000e3])
+        lons2, lats2, az2 = geodesy.ellipsoid_forward(np.radians(lons),
+                np.radians(lats), np.radians(az), dist, geod.a, geod.f)
+        lons2_, lats2_, _ = geod.fwd(lons, lats, az, dist)
+        self.assertTrue(np.allclose(np.degrees(lons2), lons2_, atol=1e-8))
+        self.assertTrue(np.allclose(np.degrees(lats2), lats2_, atol=1e-8))
+        return
+
+    def test_vincenty_solver(self):
+        WGS84 = crs.GeographicalCRS("+ellps=WGS84", "WGS84 (Geographical)",
+                                    geodesic_solver="vincenty")
+        self.assertEqual(crs.LonLatWGS84.geodesic_solver, "pyproj")
+        lons1 = np.array([0.0, 32.0, 0.0])
+        lats1 = np.array([0.0, -17.0, 0.0])
+        lons2 = np.array([10.0, 38.0, 179.7])
+        lats2 = np.array([10.0, 5.0, 0.0])
+        az, baz, dist = WGS84.inverse(lons1, lats1, lons2, lats2)
+        az_, baz_, dist_ = crs.LonLatWGS84.inverse(lons1, lats1, lons2, lats2)
+        self.assertTrue(np.allclose(dist, dist_, rtol=0, atol=1e-3))
+        self.assertTrue(np.allclose(baz[:2], baz_[:2], atol=1e-8))
+
+        lons3, lats3, baz = WGS84.forward(lons1, lats1, az, dist)
+        self.assertTrue(np.allclose(lons3, lons2, atol=1e-8))
+        self.assertTrue(np.allclose(lats3, lats2, atol=1e-8))
+        return
+
+    def test_geodesic_solver_option(self):
+        proj = crs.Proj4CRS("+proj=utm +zone=10 +ellps=WGS84", "+ellps=WGS84",
+                            geodesic_solver="vincenty")
+        self.assertEqual(proj.geodesic_solver, "vincenty")
+        self.assertEqual(proj.name, "+proj=utm +zone=10 +ellps=WGS84")
+        az, baz, dist = proj.inverse(np.array([-123.0]), np.array([49.0]),
+                                     np.array([-122.0]), np.array([50.0]))
+        az_, baz_, dist_ = crs.LonLatWGS84.inverse(-123.0, 49.0, -122.0, 50.0)
+        self.assertAlmostEqual(dist[0], dist_, places=3)
+        self.assertRaises(ValueError, crs.GeographicalCRS, "+ellps=WGS84",
+                          "WGS84", geodesic_solver="karney")
+        self.assertRaises(ValueError, crs.Proj4CRS, "+proj=longlat",
+                          "+ellps=WGS84", geodesic_solver=None)
+        return
+
+    def test_transform(self):
+        utm = crs.Proj4CRS("+proj=utm +zone=10 +ellps=WGS84", "+ellps=WGS84")
+        albers = crs.Proj4CRS("+proj=aea +lat_1=50 +lat_2=58.5 +lat_0=45 "
+                              "+lon_0=-126 +x_0=1000000 +y_0=0 +ellps=WGS84",
+                              "+ellps=WGS84")
+        x = np.array([400000.0, 500000.0, 600000.0])
+        y = np.array([5400000.0, 5500000.0, 5600000.0])
+        xa, ya = crs.transform(utm, albers, x, y)
+        xa_, ya_ = albers.project(*utm.project(x, y, inverse=True))
+        self.assertTrue(np.allclose(xa, xa_, rtol=0, atol=1e-6))
+        self.assertTrue(np.allclose(ya, ya_, rtol=0, atol=1e-6))
+
+        lon, lat = crs.transform(utm, crs.LonLatWGS84, x, y)
+        lon_, lat_ = utm.project(x, y, inverse=True)
+        self.assertTrue(np.allclose(lon, lon_))
+        self.assertTrue(np.allclose(lat, lat_))
+        self.assertEqual(crs.transform(utm, utm, 1.0, 2.0), (1.0, 2.0))
+        return
+
+    def test_transformer_cache(self):
+        utm = crs.Proj4CRS("+proj=utm +zone=10 +ellps=WGS84", "+ellps=WGS84")
+        f = crs.get_transformer(utm, crs.LonLatWGS84)
+        self.assertTrue(crs.get_transformer(utm, crs.LonLatWGS84) is f)
+        for i in range(crs.TRANSFORMER_CACHE_SIZE):
+            crs.get_transformer(crs.SphericalEarth, crs.Proj4CRS(
+                "+proj=tmerc +lon_0={0} +ellps=WGS84".format(i), "+ellps=WGS84"))
+        self.assertTrue(len(crs._transformers) <= crs.TRANSFORMER_CACHE_SIZE)
+        self.assertFalse(crs.get_transformer(utm, crs.LonLatWGS84) is f)
+        return
+
     def test_equal1(self):
         WGS84 = crs.Proj4CRS("+proj=longlat +datum=WGS84 +no_defs",
                               "+ellps=WGS84", name="WGS84 (Geographical)")
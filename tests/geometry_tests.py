@@ -6,8 +6,10 @@ import math
 import numpy as np
 
 from karta.vector.geometry import Point, Multipoint, Line, Polygon
-from karta.vector.geometry import affine_matrix
+from karta.vector.geometry import affine_matrix, polygon_areas
+from karta.vector import _vectorgeo
 from karta.crs import Cartesian, SphericalEarth, LonLatWGS84, NSIDCNorth, Proj4CRS
+from karta.crs import CRSError
 
 class TestGeometry(unittest.TestCase):
 
@@ -109,6 +111,11 @@ class TestGeometry(unittest.TestCase):
         self.assertEqual(len(mp), 0)
         return
 
+    def test_nearest_to_empty(self):
+        mp = Multipoint([])
+        self.assertTrue(mp.nearest_point_to(self.point) is None)
+        return
+
     def test_multipoint_zip_init(self):
         x = range(-10, 10)
         y = [_x**2 for _x in x]
@@ -122,6 +129,63 @@ class TestGeometry(unittest.TestCase):
         self.assertEqual(mp, self.mp)
         return
 
+    def test_multipoint_array_init(self):
+        vertices = np.array(self.vertices)
+        mp = Multipoint(vertices, data=self.data)
+        self.assertTrue(mp.vertices is vertices)
+        self.assertEqual(mp.rank, 3)
+        self.assertEqual(mp, self.mp)
+        return
+
+    def test_multipoint_rotate2d(self):
+        mp = Multipoint([(1.0, 0.0, 5.0), (2.0, 1.0, 6.0)])
+        mp.rotate2d(90.0, origin=(1.0, 1.0))
+        ans = np.array([[2.0, 1.0, 5.0], [1.0, 2.0, 6.0]])
+        self.assertTrue(np.allclose(mp.vertices, ans))
+        return
+
+    def test_multipoint_flat_distances_to(self):
+        mp = Multipoint([(0.0, 0.0), (3.0, 4.0), (-6.0, 8.0)])
+        d = mp.flat_distances_to(Point((0.0, 0.0)))
+        self.assertTrue(np.allclose(d, [0.0, 5.0, 10.0]))
+        return
+
+    def test_multipoint_cache_invalidation(self):
+        mp = Multipoint([(0.0, 0.0), (1.0, 2.0), (3.0, 1.0)])
+        self.assertEqual(mp.bbox, (0.0, 0.0, 3.0, 2.0))
+        mp.append(Point((4.0, 5.0)))
+        self.assertEqual(mp.bbox, (0.0, 0.0, 4.0, 5.0))
+        mp.pop()
+        self.assertEqual(mp.bbox, (0.0, 0.0, 3.0, 2.0))
+        mp.shift((1.0, 1.0))
+        self.assertEqual(mp.bbox, (1.0, 1.0, 4.0, 3.0))
+        mp[0] = (-1.0, -1.0)
+        self.assertEqual(mp.bbox, (-1.0, -1.0, 4.0, 3.0))
+        self.assertEqual(mp.__geo_interface__["coordinates"][0], (-1.0, -1.0))
+        del mp[0]
+        self.assertEqual(mp.bbox, (2.0, 2.0, 4.0, 3.0))
+        mp.rotate2d(180.0, origin=(3.0, 2.5))
+        self.assertTrue(np.allclose(mp.bbox, (2.0, 2.0, 4.0, 3.0)))
+        return
+
+    def test_line_cache_invalidation(self):
+        line = Line([(0.0, 0.0), (3.0, 4.0)])
+        self.assertEqual(line.length, 5.0)
+        line.extend(Line([(3.0, 8.0)]))
+        self.assertEqual(line.length, 9.0)
+        self.assertEqual(line.bbox, (0.0, 0.0, 3.0, 8.0))
+        return
+
+    def test_vertices_returned_as_copies(self):
+        mp = Multipoint([(0.0, 0.0), (1.0, 2.0), (3.0, 1.0)])
+        self.assertEqual(mp.bbox, (0.0, 0.0, 3.0, 2.0))
+        mp.get_vertices()[0] = (9.0, 9.0)
+        self.assertEqual(mp.bbox, (0.0, 0.0, 3.0, 2.0))
+        self.assertEqual(mp[0].get_vertex(), (0.0, 0.0))
+        mp.__geo_interface__["coordinates"][0] = (9.0, 9.0)
+        self.assertEqual(mp.__geo_interface__["coordinates"][0], (0.0, 0.0))
+        return
+
     def test_multipoint_subset(self):
         ss1 = self.mp._subset(range(2,7))
         ss2 = self.line._subset(range(2,7))
@@ -169,6 +233,17 @@ class TestGeometry(unittest.TestCase):
         self.assertEqual(pt.data[0], ("severn",))
         return
 
+    def test_multipoint_data_query(self):
+        mp = Multipoint([(0.0, 0.0), (1.0, 1.0), (2.0, 2.0), (3.0, 3.0)],
+                        data={"speed": [10.0, 40.0, 35.0, 50.0],
+                              "quality": [1, 1, 3, 2]})
+        sub = mp.d[(mp.d.getcolumn("speed") > 30) & mp.d.isin("quality", (1, 2))]
+        self.assertTrue(isinstance(sub, Multipoint))
+        self.assertEqual(sub.vertices.tolist(), [[1.0, 1.0], [3.0, 3.0]])
+        self.assertEqual(sub.data.getfield("speed"), [40.0, 50.0])
+        self.assertEqual(mp.d[[0, 2]].data.getfield("quality"), [1, 3])
+        return
+
     def test_multipoint_slicing(self):
         submp = Multipoint(self.vertices[5:10], data=self.data[5:10])
         self.assertEqual(self.mp[5:10], submp)
@@ -199,6 +274,43 @@ class TestGeometry(unittest.TestCase):
         self.assertEqual(sub, Multipoint(ans))
         return
 
+    def test_multipoint_indexed_queries(self):
+        vertices = [(float(x),float(y)) for x in range(-10,11)
+                                        for y in range(-10,11)]
+        ans = [v for v in vertices if math.sqrt(v[0]**2 + v[1]**2) <= 5.0]
+        mp = Multipoint(vertices)
+        mp.build_index(maxchildren=4)
+        self.assertEqual(mp.within_radius(Point((0,0)), 5.0), Multipoint(ans))
+        self.assertEqual(mp.nearest_point_to(Point((2.2, -3.9))), Point((2.0, -4.0)))
+        mp.shift((0.5, 0.0))
+        self.assertEqual(mp.nearest_point_to(Point((2.2, -3.9))), Point((2.5, -4.0)))
+        return
+
+    def test_multipoint_distance_matrix(self):
+        mp1 = Multipoint([(float(x), float(y)) for x in range(5) for y in range(4)])
+        mp2 = Multipoint([(2.5, 1.0), (-3.0, 0.0), (4.0, 7.0)])
+        ans = np.array([[math.sqrt((x1-x2)**2 + (y1-y2)**2)
+                         for (x2, y2) in mp2.vertices] for (x1, y1) in mp1.vertices])
+        self.assertTrue(np.allclose(mp1.distance_matrix(mp2), ans))
+        self.assertTrue(np.allclose(mp1.distance_matrix(mp2, maxbytes=1000,
+                                                        threads=3), ans))
+        d, idx = mp1.nearest_distances(mp2, maxbytes=1000, threads=2)
+        self.assertTrue(np.allclose(d, ans.min(axis=1)))
+        self.assertEqual(idx.tolist(), np.argmin(ans, axis=1).tolist())
+        return
+
+    def test_multipoint_distance_matrix_lonlat(self):
+        mp1 = Multipoint([(-120.0, 49.0), (30.0, 0.0), (32.0, -17.0)],
+                         crs=LonLatWGS84)
+        mp2 = Multipoint([(38.0, 5.0), (-121.0, 50.0)], crs=LonLatWGS84)
+        D = mp1.distance_matrix(mp2, maxbytes=1000)
+        for i, pt in enumerate(mp1):
+            self.assertTrue(np.allclose(D[i], mp2.distances_to(pt)))
+        d, idx = mp1.nearest_distances(mp2)
+        self.assertEqual(idx.tolist(), [1, 0, 0])
+        self.assertRaises(CRSError, mp1.distance_matrix, Multipoint([(0, 0)]))
+        return
+
     def test_multipoint_within_bbox(self):
         vertices = [(float(x),float(y)) for x in range(-10,11)
                                         for y in range(-10,11)]
@@ -217,7 +329,8 @@ class TestGeometry(unittest.TestCase):
         ch = mp.convex_hull()
         hull_vertices = [(187, 85), (953, 198), (986, 271), (965, 704), (863,
             979), (27, 990), (88, 254)]
-        self.assertEqual(ch.vertices, hull_vertices)
+        self.assertEqual([tuple(v) for v in ch.vertices.tolist()],
+                         hull_vertices)
         return
 
     def test_multipoint_convex_hull2(self):
@@ -229,7 +342,8 @@ class TestGeometry(unittest.TestCase):
         ch = mp.convex_hull()
         hull_vertices = [(2, -499), (431, -492), (476, 235), (402, 301), (314,
             331), (-59, 355), (-421, 172), (-482, 26), (-400, -491)]
-        self.assertEqual(ch.vertices, hull_vertices)
+        self.assertEqual([tuple(v) for v in ch.vertices.tolist()],
+                         hull_vertices)
         return
 
     def test_connected_multipoint_shortest_distance_to(self):
@@ -335,6 +449,56 @@ class TestGeometry(unittest.TestCase):
         self.assertEqual(line0.intersections(line1), Multipoint([(2.5, 0.0)]))
         return
 
+    def test_intersection_many_no_warnings(self):
+        # vertical, parallel, crossing and parallel horizontal segments
+        x0 = np.array([2.5, 0.0, 0.0, 1.0, 0.0])
+        x1 = np.array([2.5, 1.0, 2.0, 1.0, 2.0])
+        x2 = np.array([1.5, 0.0, 0.0, 1.0, 0.0])
+        x3 = np.array([3.5, 1.0, 2.0, 1.0, 2.0])
+        y0 = np.array([2.5, 0.0, 0.0, 0.0, 0.0])
+        y1 = np.array([-2.5, 1.0, 2.0, 1.0, 0.0])
+        y2 = np.array([2.5, 1.0, 2.0, 2.0, 1.0])
+        y3 = np.array([-2.5, 2.0, 0.0, 3.0, 1.0])
+        with np.errstate(all="raise"):
+            x, y = _vectorgeo.intersection_many(x0, x1, x2, x3, y0, y1, y2, y3)
+        nan = np.nan
+        self.assertTrue(np.allclose(x, [2.5, nan, 1.0, nan, nan], equal_nan=True))
+        self.assertTrue(np.allclose(y, [0.0, nan, 1.0, nan, nan], equal_nan=True))
+        return
+
+    def test_line_intersection_many(self):
+        x = np.linspace(0, 10, 101)
+        line0 = Line(zip(x, np.sin(x)))
+        line1 = Line([(0.0, 0.0), (10.0, 0.0)])
+        self.assertTrue(line0.intersects(line1))
+        interx = line0.intersections(line1)
+        ans = [k*np.pi for k in range(4)]
+        self.assertEqual(len(interx), 4)
+        for (xi, yi), a in zip(interx.vertices, ans):
+            self.assertAlmostEqual(xi, a, places=2)
+            self.assertAlmostEqual(yi, 0.0)
+        return
+
+    def test_line_no_intersection(self):
+        line0 = Line([(0.0, 0.0), (1.0, 1.0), (2.0, 0.0)])
+        line1 = Line([(0.0, 2.0), (1.0, 1.5), (2.0, 2.0)])
+        self.assertFalse(line0.intersects(line1))
+        self.assertEqual(len(line0.intersections(line1)), 0)
+        return
+
+    def test_line_self_intersection(self):
+        line = Line([(0.0, 0.0), (2.0, 2.0), (2.0, 0.0), (0.0, 2.0)])
+        self.assertTrue(line.self_intersects())
+        self.assertEqual(line.self_intersections(), Multipoint([(1.0, 1.0)]))
+        self.assertFalse(self.line[:2].self_intersects())
+        return
+
+    def test_poly_self_intersection(self):
+        self.assertFalse(self.unitsquare.self_intersects())
+        bowtie = Polygon([(0.0, 0.0), (2.0, 2.0), (2.0, 0.0), (0.0, 2.0)])
+        self.assertEqual(bowtie.self_intersections(), Multipoint([(1.0, 1.0)]))
+        return
+
     def test_poly_clockwise(self):
         p = Polygon([(0,0), (0,1), (1,1), (1,0)])
         self.assertTrue(p.isclockwise())
@@ -349,6 +513,23 @@ class TestGeometry(unittest.TestCase):
         self.assertEqual(self.poly.get_extents(), (0.0, 6.0, 1.0, 8.0))
         return
 
+    def test_line_cumlength(self):
+        line = Line([(0.0, 0.0, 0.0), (3.0, 4.0, 0.0), (3.0, 4.0, 2.0)])
+        cl = line.cumlength()
+        self.assertTrue(isinstance(cl, np.ndarray))
+        self.assertTrue(np.allclose(cl, [0.0, 5.0, 7.0]))
+        self.assertAlmostEqual(line.length, 7.0)
+        return
+
+    def test_line_length_lonlat(self):
+        vertices = [(-20.0, 79.7), (-20.1, 79.9), (-19.1, 80.0), (-18.7, 80.1)]
+        line = Line(vertices, crs=LonLatWGS84)
+        points = [Point(v, crs=LonLatWGS84) for v in vertices]
+        ans = sum(a.distance(b) for a, b in zip(points[:-1], points[1:]))
+        self.assertAlmostEqual(line.length, ans, places=6)
+        self.assertAlmostEqual(line.cumlength()[-1], ans, places=6)
+        return
+
     def test_poly_length(self):
         self.assertEqual(self.poly.length, 19.430647008220866)
         return
@@ -400,6 +581,40 @@ class TestGeometry(unittest.TestCase):
         self.assertTrue(polygon.contains(pt))
         return
 
+    def test_poly_contains_many(self):
+        theta = np.linspace(0, 2*np.pi, 361)[:-1]
+        r = 10*np.sin(theta*8) + 15
+        x = np.cos(theta) * r + 25
+        y = np.sin(theta) * r + 25
+        polygon = Polygon(zip(x, y))
+        xp, yp = np.meshgrid(np.linspace(0, 50, 41), np.linspace(0, 50, 41))
+        xp, yp = xp.ravel(), yp.ravel()
+        ans = [polygon.contains(Point((a, b))) for a, b in zip(xp, yp)]
+        self.assertEqual(polygon.contains_many(xp, yp).tolist(), ans)
+        self.assertEqual(polygon.contains_many(xp, yp, blocksize=100).tolist(), ans)
+        return
+
+    def test_poly_contains_many_subs(self):
+        mp = Multipoint([(1.0, 1.0), (3.0, 3.0), (3.0, 2.0), (11.0, 5.0),
+                         (5.0, 8.0)])
+        mask = self.ringed_poly.contains_many(mp)
+        self.assertEqual(mask.tolist(), [True, False, False, False, True])
+        return
+
+    def test_poly_contains_many_2d(self):
+        xp, yp = np.meshgrid(np.linspace(-1, 11, 13), np.linspace(-1, 11, 7))
+        mask = self.ringed_poly.contains_many(xp, yp)
+        self.assertEqual(mask.shape, (7, 13))
+        ans = self.ringed_poly.contains_many(xp.ravel(), yp.ravel())
+        self.assertEqual(mask.ravel().tolist(), ans.tolist())
+        self.assertEqual(mask[1,1], True)
+        self.assertEqual(mask[3,4], False)
+        mask = self.ringed_poly.contains_many(xp[0], 5.0)
+        self.assertEqual(mask.shape, (13,))
+        mask = self.ringed_poly.contains_many(np.full((2, 3), 20.0), yp[:2,:3])
+        self.assertEqual(mask.tolist(), [[False]*3]*2)
+        return
+
     def test_poly_getitem(self):
         poly = Polygon([(0.0, 8.0), (0.0, 5.0), (6.0, 1.0), (7.0, 2.0),
                         (5.0, 4.0)])
@@ -453,12 +668,52 @@ class TestGeometry(unittest.TestCase):
         self.assertAlmostEqual(kp.area, np.pi, places=6)
         return
 
+    def test_area_spherical(self):
+        octant = Polygon([(0, 0), (90, 0), (0, 90)], crs=SphericalEarth)
+        self.assertAlmostEqual(octant.area / (0.5*np.pi*6371009.0**2), 1.0, places=12)
+        return
+
+    def test_area_ellipsoidal(self):
+        # one eighth of the WGS84 surface area
+        octant = Polygon([(0, 0), (90, 0), (0, 90)], crs=LonLatWGS84)
+        self.assertAlmostEqual(octant.area / 63758202715511.06, 1.0, places=12)
+        ring = Polygon([(10, 10), (20, 10), (20, 20), (10, 20)], crs=LonLatWGS84)
+        holed = Polygon([(0, 0), (90, 0), (0, 90)], subs=[ring], crs=LonLatWGS84)
+        self.assertAlmostEqual(holed.area, octant.area - ring.area, places=3)
+        return
+
+    def test_polygon_areas(self):
+        polys = [self.ringed_poly, Polygon([(0, 0), (2, 0), (2, 3)]),
+                 Polygon([(0, 0), (4, 0), (4, 4), (0, 4)],
+                         subs=[Polygon([(1, 1), (3, 1), (3, 3), (1, 3)],
+                                       subs=[Polygon([(2, 2), (2.5, 2), (2.5, 2.5)])])])]
+        self.assertTrue(np.allclose(polygon_areas(polys),
+                                    [self.ringed_poly.area, 3.0, 12.125]))
+        return
+
     def test_segments(self):
         v = self.vertices
-        self.assertEqual([tuple(a.vertices) for a in self.line.segments],
+        self.assertEqual([tuple(map(tuple, a.vertices.tolist()))
+                          for a in self.line.segments],
                          [(v[i], v[i+1]) for i in range(len(self.vertices)-1)])
         return
 
+    def test_segment_arrays(self):
+        start, end = self.line.segment_arrays
+        self.assertEqual(start.shape, (len(self.vertices)-1, 3))
+        self.assertTrue(np.may_share_memory(start, self.line.vertices))
+        self.assertTrue(np.may_share_memory(end, self.line.vertices))
+        self.assertTrue(np.all(start[1:] == end[:-1]))
+        return
+
+    def test_poly_segments(self):
+        segments = list(self.poly.segments)
+        self.assertEqual(len(segments), 3)
+        self.assertEqual(segments[-1][0], Point((6.0, 1.0)))
+        self.assertEqual(segments[-1][1], Point((0.0, 8.0)))
+        self.assertAlmostEqual(segments[0].length, 3.0)
+        return
+
     def test_within_distance(self):
         line = Line([(0,0), (1,1), (3,1)])
         pt = Point((1,1.5))
@@ -557,6 +812,42 @@ class TestGeometry(unittest.TestCase):
             self.assertEqual(len(line.subsection(n)), n)
         return
 
+    def test_densify_maxlength(self):
+        line = Line([(0.0, 0.0), (3.0, 0.0), (3.0, 1.0)], properties={"a": 1})
+        dense = line.densify(maxlength=1.0)
+        self.assertTrue(isinstance(dense, Line))
+        self.assertEqual(dense.properties, {"a": 1})
+        self.assertTrue(np.allclose(dense.vertices, [(0, 0), (1, 0), (2, 0),
+                                                     (3, 0), (3, 1)]))
+        self.assertAlmostEqual(dense.length, line.length)
+        return
+
+    def test_densify_polygon(self):
+        poly = Polygon([(0.0, 0.0), (2.0, 0.0), (2.0, 2.0), (0.0, 2.0)])
+        dense = poly.densify(n=2)
+        self.assertTrue(isinstance(dense, Polygon))
+        self.assertTrue(np.allclose(dense.vertices, [(0, 0), (1, 0), (2, 0),
+                                                     (2, 1), (2, 2), (1, 2),
+                                                     (0, 2), (0, 1)]))
+        self.assertAlmostEqual(dense.area, poly.area)
+        return
+
+    def test_densify_lonlat(self):
+        line = Line([(0, 40), (120, 40)], crs=LonLatWGS84)
+        dense = line.densify(n=19)
+        self.assertEqual(len(dense), 20)
+        for a, b in zip(dense, line.subsection(20)):
+            self.assertPointAlmostEqual(a, b)
+        self.assertTrue(np.all(line.densify(maxlength=1e5)._segment_lengths() <= 1e5))
+        return
+
+    def test_vertices_at(self):
+        line = Line([(0.0, 0.0, 0.0), (3.0, 0.0, 0.0), (3.0, 4.0, 3.0)])
+        vertices = line.vertices_at([0.0, 1.5, 3.0, 5.5, 100.0])
+        self.assertTrue(np.allclose(vertices, [(0, 0, 0), (1.5, 0, 0), (3, 0, 0),
+                                               (3, 2, 1.5), (3, 4, 3)]))
+        return
+
 class TestGeoInterface(unittest.TestCase):
 
     def test_point(self):
@@ -723,11 +1014,56 @@ class VectorCRSTests(unittest.TestCase):
                      (2.7, 34.1)], crs=SphericalEarth)
         UTM31N = Proj4CRS("+proj=utm +zone=31 +ellps=WGS84 "
                     "+datum=WGS84 +units=m +no_defs", "+ellps=WGS84")
-        self.assertEqual(line.get_coordinate_lists(UTM31N),
+        self.assertEqual(tuple(map(tuple, line.get_coordinate_lists(UTM31N))),
                     ((407650.39665729366, 421687.71905896586, 472328.1095127584), 
                      (3762606.6598763773, 3784658.467084308, 3773284.485241791)))
         return
 
+    def test_contains_antimeridian(self):
+        poly = Polygon([(170, -10), (-170, -10), (-170, 10), (170, 10)],
+                       crs=LonLatWGS84)
+        self.assertTrue(poly.contains(Point((180, 0), crs=LonLatWGS84)))
+        self.assertTrue(poly.contains(Point((-175, 5), crs=LonLatWGS84)))
+        self.assertFalse(poly.contains(Point((0, 0), crs=LonLatWGS84)))
+        return
+
+    def test_contains_pole(self):
+        poly = Polygon([(45, 80), (135, 80), (225, 80), (315, 80)], crs=SphericalEarth)
+        inside = poly.contains_many(np.array([0.0, 45.0, 0.0, 100.0]),
+                                    np.array([90.0, 85.0, 70.0, -89.0]))
+        self.assertEqual(inside.tolist(), [True, True, False, False])
+        return
+
+    def test_contains_great_circle_edges(self):
+        # along 0E, the great circle edges reach about 67N and 74N
+        poly = Polygon([(-60, 50), (60, 50), (60, 60), (-60, 60)], crs=LonLatWGS84)
+        self.assertTrue(poly.contains(Point((0, 70), crs=LonLatWGS84)))
+        self.assertFalse(poly.contains(Point((0, 55), crs=LonLatWGS84)))
+        return
+
+    def test_intersections_antimeridian(self):
+        line0 = Line([(175, -5), (-175, 5)], crs=LonLatWGS84)
+        line1 = Line([(175, 5), (-175, -5)], crs=LonLatWGS84)
+        self.assertTrue(line0.intersects(line1))
+        x = line0.intersections(line1)
+        self.assertEqual(len(x), 1)
+        self.assertAlmostEqual(x[0].x, 180.0)
+        self.assertAlmostEqual(x[0].y, 0.0)
+        self.assertFalse(line0.intersects(Line([(0, 5), (10, -5)], crs=LonLatWGS84)))
+        return
+
+    def test_intersections_global(self):
+        equator = Line([(0, 0), (90, 0), (180, 0), (270, 0)], crs=SphericalEarth)
+        meridian = Line([(45, -10), (45, 10)], crs=SphericalEarth)
+        x = equator.intersections(meridian)
+        self.assertEqual(len(x), 1)
+        self.assertAlmostEqual(x[0].x, 45.0)
+        self.assertAlmostEqual(x[0].y, 0.0)
+        bowtie = Line([(0, 0), (10, 10), (10, 0), (0, 10)], crs=SphericalEarth)
+        self.assertTrue(bowtie.self_intersects())
+        self.assertAlmostEqual(bowtie.self_intersections()[0].x, 5.0)
+        return
+
 class MetadataAttributeTests(unittest.TestCase):
 
     def test_metadataattribute_str(self):
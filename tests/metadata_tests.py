@@ -69,6 +69,28 @@ class TestMetadata(unittest.TestCase):
         self.assertEqual(md.getfield("A"), md.getfield("A"))
         return
 
+    def test_reference_vs_value_metadata(self):
+        md = Metadata({"a": [1, 2, 3], "b": [0.5, 1.5, 2.5]})
+        md2 = Metadata(md)
+        md2[0] = (-99, -0.5)
+        md2.getcolumn("b")[1] = 9.5
+        self.assertEqual(md.getfield("a"), [1, 2, 3])
+        self.assertEqual(md.getfield("b"), [0.5, 1.5, 2.5])
+        self.assertEqual(md2.getcolumn("a").dtype, np.int64)
+        return
+
+    def test_setitem_changes_type(self):
+        md = Metadata({"f": [0.5, 1.5, 2.5], "i": [1, 2, 3]})
+        md[0] = (4, None)
+        self.assertEqual(md.getcolumn("f").dtype, object)
+        self.assertEqual(md.getcolumn("i").dtype, object)
+        self.assertEqual(md[0], (4, None))
+        self.assertEqual(type(md[0][0]), int)
+        self.assertEqual(md.getfield("f"), [4, 1.5, 2.5])
+        md[1] = (3.5, 5)
+        self.assertEqual(md[1], (3.5, 5))
+        return
+
     def test_init_specified_fields(self):
         md = Metadata([(1,2,3),(4,5,6),(7,8,9)], fields=("a","b","c"))
         self.assertEqual(md.data, [(1,2,3),(4,5,6),(7,8,9)])
@@ -76,8 +98,8 @@ class TestMetadata(unittest.TestCase):
         return
 
     def test_init_specified_fields2(self):
-        md = Metadata([("by air",),("by land,"),("by sea",)], fields=("mode",))
-        self.assertEqual(md.data, [("by air",),("by land,"),("by sea",)])
+        md = Metadata([("by air",),("by land",),("by sea",)], fields=("mode",))
+        self.assertEqual(md.data, [("by air",),("by land",),("by sea",)])
         self.assertEqual(md.fields, ("mode",))
         return
 
@@ -111,6 +133,84 @@ class TestMetadata(unittest.TestCase):
         self.assertEqual(md, ans)
         return
 
+    def test_column_types(self):
+        md = Metadata({"i": [1, 2, 3], "f": [1.5, 2.5, 3.5], "b": [True, False, True],
+                       "s": ["a", "b", "c"], "m": [1, "b", None]})
+        self.assertEqual(md.getcolumn("i").dtype, np.int64)
+        self.assertEqual(md.getcolumn("f").dtype, np.float64)
+        self.assertEqual(md.getcolumn("b").dtype, np.bool_)
+        self.assertEqual(md.getcolumn("s").dtype, object)
+        self.assertEqual(md.getcolumn("m").dtype, object)
+        self.assertEqual(type(md[0][md.fields.index("i")]), int)
+        return
+
+    def test_slice_is_view(self):
+        md = self.multifield[10:20]
+        self.assertEqual(len(md), 10)
+        self.assertTrue(np.may_share_memory(md.getcolumn("a"),
+                                            self.multifield.getcolumn("a")))
+        self.assertEqual(md.get(0), {"a":10, "b": 210, "c": 100})
+        self.assertEqual(md[-1], self.multifield[19])
+        return
+
+    def test_index_array(self):
+        md = self.multifield[np.array([3, 5, 7])]
+        self.assertEqual(md.getfield("a"), [3, 5, 7])
+        md = self.onefield[self.onefield.getcolumn("value") % 50 == 0]
+        self.assertEqual(md.getfield("value"), [0, 50, 100, 150])
+        return
+
+    def test_extend_grows(self):
+        md = Metadata({"a": [1, 2], "b": ["x", "y"]})
+        for i in range(100):
+            md.extend(Metadata({"a": [i], "b": ["z"]}))
+        self.assertEqual(len(md), 102)
+        self.assertEqual(md.getcolumn("a").dtype, np.int64)
+        self.assertEqual(md.get(101), {"a": 99, "b": "z"})
+        md.extend(Metadata({"b": ["w"]}))
+        self.assertEqual(md.get(102), {"a": None, "b": "w"})
+        self.assertEqual(md.getfield("a")[:3], [1, 2, 0])
+        return
+
+    def test_setitem_delitem(self):
+        md = Metadata([(1, "a"), (2, "b"), (3, "c")], fields=("n", "s"))
+        md[1] = (None, None)
+        self.assertEqual(md[1], (None, None))
+        self.assertEqual(md[2], (3, "c"))
+        del md[0]
+        self.assertEqual(md.data, [(None, None), (3, "c")])
+        return
+
+    def test_isin(self):
+        md = Metadata({"quality": [1, 2, 3, 1, 4], "name": ["a", "b", "c", "d", None]})
+        self.assertEqual(md.isin("quality", {1, 2}).tolist(),
+                         [True, True, False, True, False])
+        self.assertEqual(md.isin("name", ["b", None]).tolist(),
+                         [False, True, False, False, True])
+        return
+
+    def test_isin_types(self):
+        md = Metadata({"quality": [1, 2, 3], "flag": [True, False, True],
+                       "name": ["a", "b", 3]})
+        self.assertEqual(md.isin("quality", [1.5, 2.9]).tolist(),
+                         [False, False, False])
+        self.assertEqual(md.isin("quality", [2.0]).tolist(),
+                         [False, True, False])
+        self.assertEqual(md.isin("flag", [2]).tolist(), [False, False, False])
+        self.assertEqual(md.isin("flag", [False]).tolist(), [False, True, False])
+        self.assertEqual(md.isin("quality", ["a", 3]).tolist(),
+                         [False, False, True])
+        self.assertEqual(md.isin("name", [3, "a"]).tolist(), [True, False, True])
+        self.assertEqual(md.isin("name", []).tolist(), [False, False, False])
+        return
+
+    def test_where(self):
+        md = Metadata({"speed": [10.0, 40.0, 35.0, 50.0], "quality": [1, 1, 3, 2]})
+        mask = (md.getcolumn("speed") > 30) & md.isin("quality", (1, 2))
+        self.assertEqual(md.where(mask).tolist(), [1, 3])
+        self.assertRaises(ValueError, md.where, mask[:2])
+        return
+
 if __name__ == "__main__":
     unittest.main()
 
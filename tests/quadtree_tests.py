@@ -1,11 +1,16 @@
 """ Unit tests for vector functions """
 
+import os
 import unittest
+import numpy as np
+from test_helper import TESTDIR
 
-from karta.vector.quadtree import QuadTree, Node
+from karta.vector.quadtree import QuadTree, Node, LinearQuadTree
 from karta.vector.quadtree import addpt, split, hashpt
 from karta.vector.quadtree import querypt_recursion, querypt_hash
-from karta.vector.quadtree import iswithin, overlaps
+from karta.vector.quadtree import iswithin, overlaps, BBoxError
+from karta.vector.quadtree import read_linear_quadtree, QuadTreeFileError
+from karta.vector._vectorgeo import hashpt_many, unhash_many
 
 class TestQuadTree(unittest.TestCase):
 
@@ -149,6 +154,178 @@ class TestQuadTree(unittest.TestCase):
         self.assertEqual(pts, ans)
         return
 
+    def test_hashpt_many(self):
+        codes = hashpt_many(0, 1, 0, 1, [0.26, 0.99], [0.84, 0.99], 10)
+        for code, (x, y) in zip(codes, [(0.26, 0.84), (0.99, 0.99)]):
+            hashgen = hashpt(0, 1, 0, 1, x, y)
+            hsh = [next(hashgen) for i in range(10)]
+            self.assertEqual(np.base_repr(int(code), 4).zfill(10),
+                             "".join(str(h) for h in hsh))
+        ix, iy = unhash_many(codes)
+        self.assertEqual(ix.tolist(), [266, 1013])
+        self.assertEqual(iy.tolist(), [860, 1013])
+        return
+
+    def test_linear_quadtree_nodes(self):
+        pts = np.array([(x**0.5,0.5*y**0.875) for x in range(50) for y in range(50)])
+        tree = LinearQuadTree(pts, bbox=(0, 32, 0, 22))
+        leaves = tree.child == -1
+        self.assertEqual(np.sum(tree.stop[leaves] - tree.start[leaves]), len(pts))
+        self.assertTrue(np.all(tree.stop[leaves] - tree.start[leaves] <= 20))
+        x0, x1, y0, y1 = tree.node_bboxes(np.flatnonzero(leaves))
+        for i, node in enumerate(np.flatnonzero(leaves)):
+            x = tree.x[tree.start[node]:tree.stop[node]]
+            y = tree.y[tree.start[node]:tree.stop[node]]
+            self.assertTrue(np.all((x0[i] <= x) & (x < x1[i])))
+            self.assertTrue(np.all((y0[i] <= y) & (y < y1[i])))
+        return
+
+    def test_linear_quadtree_bbox(self):
+        pts = np.array([(x**0.5,0.5*y**0.875) for x in range(50) for y in range(50)])
+        tree = LinearQuadTree(pts, bbox=(0, 32, 0, 22))
+        idx = tree.getfrombbox((16, 24, 8, 12))
+        ans = [i for i, pt in enumerate(pts) if (16 <= pt[0] < 24) and (8 <= pt[1] < 12)]
+        self.assertEqual(idx.tolist(), ans)
+
+        bboxes = [(1, 3, 2, 5), (4, 6.5, 0, 1), (40, 50, 0, 1)]
+        for bbox, idx in zip(bboxes, tree.getfrombbox(bboxes)):
+            ans = [i for i, pt in enumerate(pts)
+                   if (bbox[0] <= pt[0] < bbox[1]) and (bbox[2] <= pt[1] < bbox[3])]
+            self.assertEqual(idx.tolist(), ans)
+        return
+
+    def test_linear_quadtree_querypt(self):
+        pts = np.array([(x**0.5,0.5*y**0.875) for x in range(50) for y in range(50)])
+        tree = LinearQuadTree(pts)
+        testpts = [(x**0.5,0.5*y**0.875) for (x,y) in zip((3,12,44,23,36),
+                                                          (46,42,28,2,13))]
+        self.assertTrue(np.all(tree.querypt(testpts)))
+        self.assertTrue(tree.querypt(testpts[0]))
+        testpts = [(x**0.5,0.5*y**0.875) for (x,y) in zip((73,12,54,23,63),
+                                                          (46,72,28,82,13))]
+        self.assertFalse(np.any(tree.querypt(testpts)))
+        return
+
+    def test_quadtree_nearest(self):
+        pts = [(x**0.5,0.5*y**0.875) for x in range(50) for y in range(50)]
+        QTree = QuadTree((0, 32, 0, 22))
+        for pt in pts:
+            QTree.addpt(pt)
+        dist = lambda pt: (pt[0]-3.1)**2 + (pt[1]-4.2)**2
+        ans = sorted(pts, key=dist)[:5]
+        self.assertEqual(QTree.nearest((3.1, 4.2), k=5), ans)
+        return
+
+    def test_quadtree_within_radius(self):
+        pts = [(x**0.5,0.5*y**0.875) for x in range(50) for y in range(50)]
+        QTree = QuadTree((0, 32, 0, 22))
+        for pt in pts:
+            QTree.addpt(pt)
+        ans = [pt for pt in pts if (pt[0]-3.1)**2 + (pt[1]-4.2)**2 <= 0.25]
+        res = QTree.within_radius((3.1, 4.2), 0.5)
+        self.assertEqual(sorted(res), sorted(ans))
+        return
+
+    def test_quadtree_remove(self):
+        pts = [(x**0.5,0.5*y**0.875) for x in range(50) for y in range(50)]
+        QTree = QuadTree((0, 32, 0, 22), maxchildren=20)
+        for pt in pts:
+            QTree.addpt(pt)
+        for pt in pts[::2]:
+            QTree.remove(pt)
+        self.assertEqual(QTree.size, len(pts[1::2]))
+        self.assertEqual(sorted(QTree.getfrombbox((0, 32, 0, 22))),
+                         sorted(pts[1::2]))
+        self.assertFalse(QTree.querypt(pts[0]))
+        self.assertTrue(QTree.querypt(pts[1]))
+        self.assertRaises(ValueError, QTree.remove, pts[0])
+        return
+
+    def test_quadtree_remove_coalesces(self):
+        pts = [(x**0.5,0.5*y**0.875) for x in range(50) for y in range(50)]
+        QTree = QuadTree((0, 32, 0, 22), maxchildren=20)
+        for pt in pts:
+            QTree.addpt(pt)
+        self.assertFalse(QTree.node.leaf)
+        for pt in pts[:-10]:
+            QTree.remove(pt)
+        self.assertTrue(QTree.node.leaf)
+        self.assertEqual(sorted(QTree.node.children), sorted(pts[-10:]))
+        return
+
+    def test_quadtree_move(self):
+        pts = [(x**0.5,0.5*y**0.875) for x in range(50) for y in range(50)]
+        QTree = QuadTree((0, 32, 0, 22), maxchildren=20)
+        for pt in pts:
+            QTree.addpt(pt)
+        moved = [(pt[0]+0.01, pt[1]) if i % 3 else (31.0-pt[0], 21.0-pt[1])
+                 for i, pt in enumerate(pts)]
+        for old, new in zip(pts, moved):
+            QTree.move(old, new)
+        self.assertEqual(QTree.size, len(pts))
+        self.assertEqual(sorted(QTree.getfrombbox((0, 32, 0, 22))),
+                         sorted(moved))
+        for pt in moved[:100]:
+            self.assertTrue(querypt_recursion(QTree.node, pt))
+        self.assertRaises(ValueError, QTree.move, (0.5, 0.5), (1.0, 1.0))
+        self.assertRaises(BBoxError, QTree.move, moved[0], (40.0, 1.0))
+        return
+
+    def test_linear_quadtree_file(self):
+        pts = np.array([(x**0.5,0.5*y**0.875) for x in range(50) for y in range(50)])
+        tree = LinearQuadTree(pts, maxchildren=10)
+        tmpdir = os.path.join(TESTDIR, "data")
+        if not os.path.isdir(tmpdir):
+            os.makedirs(tmpdir)
+        fnm = os.path.join(tmpdir, "linear_quadtree.bin")
+        tree.tofile(fnm)
+
+        for mmap in (True, False):
+            loaded = read_linear_quadtree(fnm, mmap=mmap)
+            self.assertEqual(loaded.bbox, tree.bbox)
+            self.assertEqual(loaded.maxdepth, tree.maxdepth)
+            self.assertTrue(np.array_equal(loaded.child, tree.child))
+            self.assertTrue(np.array_equal(loaded.index, tree.index))
+            self.assertEqual(loaded.getfrombbox((1, 3, 2, 4)).tolist(),
+                             tree.getfrombbox((1, 3, 2, 4)).tolist())
+            self.assertEqual(loaded.nearest((3.1, 4.2), k=5).tolist(),
+                             tree.nearest((3.1, 4.2), k=5).tolist())
+            self.assertTrue(loaded.querypt(pts[17]))
+
+        with open(fnm, "r+b") as f:
+            f.write(b"notatree")
+        self.assertRaises(QuadTreeFileError, read_linear_quadtree, fnm)
+        return
+
+    def test_linear_quadtree_nearest(self):
+        pts = np.array([(x**0.5,0.5*y**0.875) for x in range(50) for y in range(50)])
+        tree = LinearQuadTree(pts)
+        d = np.hypot(pts[:,0]-3.1, pts[:,1]-4.2)
+        idx = tree.nearest((3.1, 4.2), k=5)
+        self.assertEqual(idx.tolist(), np.argsort(d)[:5].tolist())
+        idx = tree.nearest((100.0, -50.0), k=1)
+        self.assertEqual(idx.tolist(), [np.argmin(np.hypot(pts[:,0]-100, pts[:,1]+50))])
+        return
+
+    def test_nearest_k_zero(self):
+        pts = np.array([(x**0.5,0.5*y**0.875) for x in range(10) for y in range(10)])
+        tree = LinearQuadTree(pts)
+        self.assertEqual(tree.nearest((1.0, 1.0), k=0).tolist(), [])
+        self.assertEqual(tree.nearest((1.0, 1.0), k=-1).tolist(), [])
+        QTree = QuadTree((0, 4, 0, 4))
+        for pt in pts:
+            QTree.addpt(tuple(pt))
+        self.assertEqual(QTree.nearest((1.0, 1.0), k=0), [])
+        self.assertEqual(QTree.nearest((1.0, 1.0), k=-1), [])
+        return
+
+    def test_linear_quadtree_within_radius(self):
+        pts = np.array([(x**0.5,0.5*y**0.875) for x in range(50) for y in range(50)])
+        tree = LinearQuadTree(pts)
+        d = np.hypot(pts[:,0]-3.1, pts[:,1]-4.2)
+        self.assertEqual(tree.within_radius((3.1, 4.2), 0.5).tolist(),
+                         np.flatnonzero(d <= 0.5).tolist())
+        return
 
 if __name__ == "__main__":
     unittest.main()
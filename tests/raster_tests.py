@@ -172,6 +172,136 @@ class RegularGridTests(unittest.TestCase):
         self.assertTrue(np.all(ind[1] == yi))
         return
 
+    def test_get_positions_skewed(self):
+        grid = karta.RegularGrid((100.0, 50.0, 2.0, 3.0, 0.5, -0.25),
+                                 values=np.zeros((10, 20)))
+        i = np.array([0.0, 3.0, 9.5, 4.2])
+        j = np.array([0.0, 7.0, 19.0, 11.6])
+        x = 100.0 + j*2.0 + i*0.5
+        y = 50.0 + i*3.0 - j*0.25
+        i_, j_ = grid.get_positions(x, y)
+        self.assertTrue(np.allclose(i_, i))
+        self.assertTrue(np.allclose(j_, j))
+        self.assertEqual(grid.get_indices(x[3], y[3]), (4, 12))
+        return
+
+    def test_get_positions_singular(self):
+        grid = karta.RegularGrid((0.0, 0.0, 1.0, 1.0, 1.0, 1.0),
+                                 values=np.zeros((10, 10)))
+        self.assertRaises(karta.raster.grid.GridError, grid.get_positions,
+                          1.0, 1.0)
+        return
+
+    def test_sample_plane(self):
+        ii, jj = np.meshgrid(np.arange(10.0), np.arange(12.0), indexing="ij")
+        grid = karta.RegularGrid((0.0, 0.0, 2.0, 1.0, 0.0, 0.0),
+                                 values=3.0 + 0.5*ii - 2.0*jj)
+        x = np.array([0.0, 3.3, 22.0, 11.0])
+        y = np.array([0.0, 4.7, 9.0, 2.25])
+        expected = 3.0 + 0.5*y - x
+        self.assertTrue(np.allclose(grid.sample_bilinear(x, y), expected))
+        self.assertTrue(np.allclose(grid.sample_bicubic(x[1::3], y[1::3]),
+                                    expected[1::3]))
+        self.assertAlmostEqual(grid.sample(4.0, 5.0, method="bicubic"), 1.5)
+        return
+
+    def test_sample_fill(self):
+        values = np.arange(20.0).reshape(4, 5)
+        values[2, 3] = np.nan
+        grid = karta.RegularGrid((0.0, 0.0, 1.0, 1.0, 0.0, 0.0), values=values)
+        x = np.array([0.5, 3.0, 3.5, -0.1, 4.0, np.nan])
+        y = np.array([0.5, 1.0, 2.5, 1.0, 3.0, 1.0])
+        z, valid = grid.sample(x, y, fill_value=-1.0, return_mask=True)
+        self.assertTrue(np.all(valid == [True, True, False, False, True, False]))
+        self.assertTrue(np.allclose(z, [3.0, 8.0, -1.0, -1.0, 19.0, -1.0]))
+
+        z = grid.sample_nearest(x, y)
+        self.assertEqual(z[3], 5.0)
+        self.assertTrue(np.isnan(z[5]))
+        self.assertEqual(z[4], 19.0)
+
+        out = np.empty(6)
+        res = grid.sample_bicubic(x, y, fill_value=0.0, out=out)
+        self.assertTrue(res is out)
+        self.assertEqual(out[3], 0.0)
+        return
+
+    def test_sample_nodata_integer(self):
+        values = np.arange(20).reshape(4, 5)
+        values[0, 0] = -9999
+        grid = karta.RegularGrid((0.0, 0.0, 1.0, 1.0, 0.0, 0.0), values=values)
+        z = grid.sample_nearest([0.0, 1.0, 9.0], [0.0, 1.0, 0.0], fill_value=-1)
+        self.assertEqual(z.dtype.kind, "i")
+        self.assertEqual(list(z), [-1, 6, -1])
+        z = grid.sample_bilinear([0.5, 1.0], [0.5, 0.5])
+        self.assertEqual(z[0], -9999)
+        self.assertEqual(z[1], 3.5)
+        return
+
+    def test_sampler(self):
+        x = np.linspace(-20.0, 1500.0, 37)
+        y = np.linspace(1490.0, 10.0, 37)
+        grids = [karta.RegularGrid(self.rast.transform,
+                                   values=self.rast.values*k) for k in range(3)]
+        for method in ("nearest", "bilinear", "bicubic"):
+            sampler = karta.raster.Sampler(self.rast, x, y, method=method)
+            z = sampler(grids[2])
+            z_ = grids[2].sample(x, y, method=method)
+            self.assertTrue(np.allclose(z, z_, equal_nan=True))
+
+            zs = sampler(grids)
+            self.assertEqual(zs.shape, (37, 3))
+            zstack = sampler(np.dstack([g.values for g in grids]))
+            self.assertTrue(np.allclose(zs, zstack, equal_nan=True))
+            self.assertTrue(np.allclose(zs[:,2], z, equal_nan=True))
+
+        z, valid = sampler(self.rast, fill_value=0.0, return_mask=True)
+        self.assertFalse(valid[0])
+        self.assertEqual(z[0], 0.0)
+        self.assertTrue(valid[18])
+        self.assertFalse(valid[-1])
+
+        other = karta.RegularGrid((0.0, 0.0, 30.0, 30.0, 0.0, 0.0),
+                                  values=self.rast.values)
+        self.assertRaises(karta.raster.grid.NonEquivalentGridError,
+                          sampler, other)
+        return
+
+    def test_sampler_integer_grids(self):
+        values = np.arange(20).reshape(4, 5)
+        grids = [karta.RegularGrid((0.0, 0.0, 1.0, 1.0, 0.0, 0.0),
+                                   values=values*k) for k in range(3)]
+        x = np.array([0.0, 1.0, 9.0])
+        y = np.array([0.0, 1.5, 0.0])
+
+        sampler = karta.raster.Sampler(grids[0], x, y, method="nearest")
+        z = sampler(grids, fill_value=np.nan)
+        self.assertEqual(z.dtype.kind, "f")
+        self.assertTrue(np.isnan(z[2]).all())
+        self.assertEqual(z[1].tolist(), [0.0, 11.0, 22.0])
+        z = sampler(grids, fill_value=-1)
+        self.assertEqual(z.dtype.kind, "i")
+        self.assertEqual(z[2].tolist(), [-1, -1, -1])
+
+        # arrays have no nodata value, and are filled with NaN by default
+        stack = np.dstack([g.values for g in grids])
+        z = sampler(stack)
+        self.assertEqual(z.dtype.kind, "f")
+        self.assertTrue(np.isnan(z[2]).all())
+        out = np.empty((3, 3), dtype=np.int64)
+        self.assertRaises(ValueError, sampler, stack, out=out)
+        self.assertRaises(ValueError, sampler, grids, fill_value=np.nan, out=out)
+        sampler(stack, fill_value=-1, out=out)
+        self.assertEqual(out[:,2].tolist(), [0, 22, -1])
+
+        sampler = karta.raster.Sampler(grids[0], x, y, method="bilinear")
+        self.assertRaises(ValueError, sampler, grids[1], fill_value=-1,
+                          out=np.empty(3, dtype=np.int64))
+        z = sampler(grids[1])
+        self.assertEqual(z.dtype.kind, "f")
+        self.assertEqual(z[1], 8.5)
+        return
+
     def test_profile(self):
         path = karta.Line([(15.0, 15.0), (1484.0, 1484.0)], crs=karta.crs.Cartesian)
         _, z = self.rast.profile(path, resolution=42.426406871192853, method="nearest")
@@ -179,6 +309,49 @@ class RegularGridTests(unittest.TestCase):
         self.assertTrue(np.allclose(z, expected))
         return
 
+    def test_profile_segments(self):
+        path = karta.Line([(15.0, 15.0), (15.0, 135.0), (75.0, 135.0)],
+                          crs=karta.crs.Cartesian)
+        vertices, z = self.rast.profile(path, resolution=30.0, method="nearest")
+        self.assertEqual(vertices.shape, (7, 2))
+        self.assertTrue(np.allclose(vertices[4], (15.0, 135.0)))
+        self.assertTrue(np.allclose(vertices[6], (75.0, 135.0)))
+        expected = np.r_[self.rast.values[:5,0], self.rast.values[4,1:3]]
+        self.assertTrue(np.allclose(z, expected))
+        return
+
+    def test_profiles(self):
+        paths = [karta.Line([(15.0, 15.0), (1484.0, 1484.0)]),
+                 karta.Line([(15.0, 15.0), (15.0, 135.0), (75.0, 135.0)]),
+                 karta.Line([(1.0, 1.0), (1.5, 0.5)], crs=karta.crs.SphericalEarth),
+                 karta.Line([(100.0, 50.0), (900.0, 1300.0)])]
+        res = self.rast.profiles(paths, resolution=25.0)
+        self.assertEqual(len(res), 4)
+        for path, (vertices, z) in zip(paths, res):
+            vertices_, z_ = self.rast.profile(path, resolution=25.0)
+            self.assertTrue(np.allclose(vertices, vertices_))
+            self.assertTrue(np.allclose(z, z_, equal_nan=True))
+            n = int(path.length // 25.0) + 1
+            self.assertTrue(np.allclose(vertices,
+                                        path.vertices_at(np.arange(n)*25.0)))
+        return
+
+    def test_profile_lonlat(self):
+        utm = karta.crs.Proj4CRS("+proj=utm +zone=10 +ellps=WGS84", "+ellps=WGS84")
+        grid = karta.RegularGrid((400000.0, 5400000.0, 1000.0, 1000.0, 0.0, 0.0),
+                                 values=np.ones((300, 300)), crs=utm)
+        path = karta.Line([(-124.0, 49.0), (-122.5, 50.5)],
+                          crs=karta.crs.LonLatWGS84)
+        vertices, z = grid.profile(path, resolution=5000.0)
+        self.assertEqual(len(z), int(path.length // 5000.0) + 1)
+        x, y = utm.project(-124.0, 49.0)
+        self.assertAlmostEqual(vertices[0,0], x, places=3)
+        self.assertAlmostEqual(vertices[0,1], y, places=3)
+        steps = np.sqrt(np.sum(np.diff(vertices, axis=0)**2, axis=1))
+        self.assertTrue(np.allclose(steps, 5000.0, rtol=2e-3))
+        self.assertTrue(np.allclose(z, 1.0))
+        return
+
     def test_read_aai(self):
         grid = karta.read_aai(os.path.join(TESTDATA,'peaks49.asc'))
         self.assertTrue(np.all(grid.values[::-1] == self.rast.values))
@@ -237,6 +410,14 @@ class TestAAIGrid(unittest.TestCase):
         self.assertEqual(ind, (48, 0))
         return
 
+    def test_get_profile(self):
+        z = self.rast.get_profile([(15.0, 15.0), (15.0, 135.0), (75.0, 135.0)],
+                                  resolution=30.0)
+        data = self.rast.data
+        expected = np.r_[data[48:43:-1,0], data[44,1:2]]
+        self.assertTrue(np.all(z == expected))
+        return
+
     def test_resize(self):
         orig = self.rast.data.copy()
         x0, x1, y0, y1 = self.rast.get_region()
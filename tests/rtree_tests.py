@@ -0,0 +1,56 @@
+""" Unit tests for the R-tree spatial index """
+
+import unittest
+import numpy as np
+
+from karta.vector.geometry import Point, Line, Polygon
+from karta.vector.rtree import RTree
+
+class TestRTree(unittest.TestCase):
+
+    def setUp(self):
+        self.polys = [Polygon([(x, y), (x+1.5, y), (x+1.5, y+1.5), (x, y+1.5)])
+                      for x in range(0, 40, 2) for y in range(0, 30, 2)]
+        return
+
+    def test_levels(self):
+        tree = RTree(self.polys, maxchildren=4)
+        self.assertEqual(len(tree), len(self.polys))
+        self.assertEqual(len(tree.levels[-1]), 1)
+        self.assertEqual(tree.levels[-1].tolist(), [[0.0, 0.0, 39.5, 29.5]])
+        self.assertEqual(sorted(tree.index.tolist()), list(range(len(self.polys))))
+        return
+
+    def test_getfrombbox(self):
+        tree = RTree(self.polys, maxchildren=4)
+        bbox = (3.0, 5.0, 8.5, 9.0)
+        ans = [i for i, p in enumerate(self.polys)
+               if p.bbox[0] <= bbox[2] and bbox[0] <= p.bbox[2] and
+                  p.bbox[1] <= bbox[3] and bbox[1] <= p.bbox[3]]
+        self.assertEqual(tree.getfrombbox(bbox).tolist(), ans)
+
+        res = tree.getfrombbox([bbox, (100.0, 100.0, 101.0, 101.0)])
+        self.assertEqual(res[0].tolist(), ans)
+        self.assertEqual(len(res[1]), 0)
+        return
+
+    def test_getfrompoint(self):
+        tree = RTree(self.polys, maxchildren=4)
+        idx = tree.getfrompoint((7.0, 12.5))
+        self.assertEqual(len(idx), 1)
+        self.assertTrue(self.polys[idx[0]].contains(Point((7.0, 12.5))))
+        self.assertEqual(len(tree.getfrompoint((7.75, 12.5))), 0)
+        return
+
+    def test_nearest(self):
+        geoms = [Point((0.0, 0.0)), Line([(5.0, 5.0), (6.0, 9.0)]),
+                 Polygon([(10.0, 0.0), (12.0, 0.0), (11.0, 3.0)])]
+        tree = RTree(geoms, maxchildren=2)
+        self.assertEqual(tree.nearest((9.0, 1.0), k=1).tolist(), [2])
+        self.assertEqual(tree.nearest((5.5, 6.0), k=3).tolist(), [1, 2, 0])
+        self.assertEqual(tree.nearest((5.5, 6.0), k=0).tolist(), [])
+        self.assertEqual(tree.nearest((5.5, 6.0), k=-1).tolist(), [])
+        return
+
+if __name__ == "__main__":
+    unittest.main()
@@ -9,6 +9,7 @@ from geometry_init_tests import *
 from geometry_tests import *
 from vector_io_tests import *
 from quadtree_tests import *
+from rtree_tests import *
 from metadata_tests import *
 from raster_tests import *
 from shapefile_tests import *
@@ -116,7 +116,7 @@ class TestShapefile(unittest.TestCase):
     def test_read_points(self):
         shps = read_shapefile(os.path.join(TESTDATA, "newp"))
         mp = shps[0]
-        self.assertEqual(mp.vertices,
+        self.assertEqual([tuple(v) for v in mp.vertices.tolist()],
                          [(-14.612, 80.50906666666667), (-14.612, 80.50906666666667),
                           (-14.612, 80.50906666666667), (-13.744733333333333, 80.28181666666667),
                           (-13.744733333333333, 80.28181666666667), (-13.744733333333333, 80.28181666666667),
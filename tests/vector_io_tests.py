@@ -30,8 +30,8 @@ class TestGeoInterface(unittest.TestCase):
         p = Multipoint([(4, 2), (3, 5), (3, 2), (7, 3)])
         sp = shapely.geometry.shape(p)
         x, y = p.coordinates
-        self.assertEqual(x, tuple([el.x for el in sp]))
-        self.assertEqual(y, tuple([el.y for el in sp]))
+        self.assertEqual(tuple(x), tuple([el.x for el in sp]))
+        self.assertEqual(tuple(y), tuple([el.y for el in sp]))
         return
 
     def test_line_output(self):
@@ -39,8 +39,8 @@ class TestGeoInterface(unittest.TestCase):
         sp = shapely.geometry.shape(p)
         x, y = p.coordinates
         sx, sy = sp.xy
-        self.assertEqual(x, tuple(sx))
-        self.assertEqual(y, tuple(sy))
+        self.assertEqual(tuple(x), tuple(sx))
+        self.assertEqual(tuple(y), tuple(sy))
         return
 
     def test_poly_output(self):
@@ -61,8 +61,8 @@ class TestGeoInterface(unittest.TestCase):
         p = vector.read.from_shape(sp)
         x, y = p.coordinates
         sx, sy = sp.xy
-        self.assertEqual(x, tuple(sx))
-        self.assertEqual(y, tuple(sy))
+        self.assertEqual(tuple(x), tuple(sx))
+        self.assertEqual(tuple(y), tuple(sy))
         return
 
     def test_poly_input(self):
@@ -87,12 +87,12 @@ class TestGeoInterface(unittest.TestCase):
         p1, p2 = vector.read.from_shape(smp)
         x, y = p1.coordinates
         sx, sy = sp1.xy
-        self.assertEqual(x, tuple(sx))
-        self.assertEqual(y, tuple(sy))
+        self.assertEqual(tuple(x), tuple(sx))
+        self.assertEqual(tuple(y), tuple(sy))
         x, y = p2.coordinates
         sx, sy = sp2.xy
-        self.assertEqual(x, tuple(sx))
-        self.assertEqual(y, tuple(sy))
+        self.assertEqual(tuple(x), tuple(sx))
+        self.assertEqual(tuple(y), tuple(sy))
         return
 
     def test_feature_input(self):
@@ -359,7 +359,7 @@ class TestGPX(unittest.TestCase):
         g = vector.gpx.GPX()
         g.add_track(track)
         expected = self.Track([self.Trkseg(
-                        [self.Point(xy, {}, {}) for xy in track[0].vertices],
+                        [self.Point(tuple(xy), {}, {}) for xy in track[0].vertices],
                         {"name":"segment0"}, {})], {}, {})
         self.assertEqual(g.tracks[0], expected)
         return
@@ -369,7 +369,7 @@ class TestGPX(unittest.TestCase):
                       for i in range(10)], properties={"name":"route0"})
         g = vector.gpx.GPX()
         g.add_route(route)
-        expected = self.Route([self.Point(xy, {}, {}) for xy in route.vertices],
+        expected = self.Route([self.Point(tuple(xy), {}, {}) for xy in route.vertices],
                               {"name":"route0"}, {})
         self.assertEqual(g.routes[0], expected)
         return